@@ -1,9 +1,28 @@
 -- --------------------------------------
 -- Database Schema Creation Queries
 -- These queries create the necessary tables if they do not exist.
--- Run once during bot startup in the `setup_database_schema` function.
+-- They are applied as ordered migrations (SCHEMA_MIGRATIONS) by `apply_schema_migrations` at startup.
+-- Each applied migration is recorded in schema_version; when the recorded version is current, no DDL runs.
 -- --------------------------------------
 
+-- Create schema_version table
+-- Purpose: Records which schema migrations have been applied.
+CREATE TABLE IF NOT EXISTS schema_version (
+    version INT PRIMARY KEY,
+    description VARCHAR(255) NOT NULL,
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Current Schema Version
+-- Purpose: Startup check; migrations newer than this are applied.
+-- Used by: get_schema_version, load_startup_state, setup_database_schema
+SELECT MAX(version) FROM schema_version;
+
+-- Record Applied Migration
+-- Used by: apply_schema_migrations
+-- Parameters: version (INT), description (VARCHAR)
+INSERT INTO schema_version (version, description) VALUES (%s, %s);
+
 -- Create bot_config table
 -- Purpose: Stores key-value pairs for bot configuration (e.g., LOGGING_CHANNEL_ID).
 CREATE TABLE IF NOT EXISTS bot_config (
@@ -15,6 +34,7 @@ CREATE TABLE IF NOT EXISTS bot_config (
 -- Purpose: Stores moderation actions (e.g., bans, kicks, mutes) for auditing.
 CREATE TABLE IF NOT EXISTS case_logs (
     `id` INT AUTO_INCREMENT PRIMARY KEY,
+    `guild_id` BIGINT DEFAULT NULL,
     `user_id` BIGINT NOT NULL,
     `moderator_id` BIGINT NOT NULL,
     `action` VARCHAR(50) NOT NULL,
@@ -23,6 +43,10 @@ CREATE TABLE IF NOT EXISTS case_logs (
     `timestamp` TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Guild-scoped case lookups (keyset pagination by id). Schema migration 2 adds the column and index to existing tables.
+-- Rows logged before guild_id existed keep guild_id NULL. Their guild is unknown, so /cases does not show them in any guild.
+ALTER TABLE case_logs ADD INDEX idx_case_logs_guild_user_id (guild_id, user_id, id);
+
 -- Create user_levels table
 -- Purpose: Stores user XP, level, message count, and last XP gain timestamp for leveling system.
 CREATE TABLE IF NOT EXISTS user_levels (
@@ -35,6 +59,13 @@ CREATE TABLE IF NOT EXISTS user_levels (
     PRIMARY KEY (guild_id, user_id)
 );
 
+-- Secondary index for rank lookups (COUNT of users with more XP in a guild).
+-- Schema migration 3 adds it to existing tables if it is missing.
+ALTER TABLE user_levels ADD INDEX idx_user_levels_guild_xp (guild_id, xp);
+
+-- Secondary index for the top message sender reconcile query (ORDER BY message_count DESC LIMIT 1).
+ALTER TABLE user_levels ADD INDEX idx_user_levels_guild_messages (guild_id, message_count);
+
 -- Create level_config table
 -- Purpose: Stores guild-specific leveling configuration (XP range, multiplier, cooldown, channels, roles).
 CREATE TABLE IF NOT EXISTS level_config (
@@ -60,7 +91,7 @@ CREATE TABLE IF NOT EXISTS level_roles (
 -- --------------------------------------
 -- Runtime Queries
 -- These queries are used during bot operation for reading and writing data.
--- Executed asynchronously via the `async_db_runner` function.
+-- Executed asynchronously via `async_db_query` / `async_db_transaction` on the configured DB_DRIVER.
 -- --------------------------------------
 
 -- Fetch Bot Configuration
@@ -68,14 +99,20 @@ CREATE TABLE IF NOT EXISTS level_roles (
 -- Used by: fetch_bot_config, /config view
 SELECT name, value FROM bot_config;
 
--- Fetch User Case Logs
--- Purpose: Retrieves moderation history for a specific user.
--- Used by: async_get_user_caselogs, /cases command
--- Parameters: user_id (BIGINT)
-SELECT `id`, `action`, `reason`, `duration`, `moderator_id`, `timestamp`
+-- Fetch User Case Logs (one page)
+-- Purpose: Retrieves one page of moderation history for a user in a guild, newest first (keyset pagination, no OFFSET).
+-- Used by: async_get_user_caselogs, /cases command (CaseLogView)
+-- Parameters: guild_id (BIGINT), user_id (BIGINT), before_id (INT, omitted for the first page), limit (INT)
+SELECT id, action, reason, duration, moderator_id, timestamp
 FROM case_logs
-WHERE `user_id` = %s
-ORDER BY `id` DESC;
+WHERE guild_id = %s AND user_id = %s AND id < %s
+ORDER BY id DESC LIMIT %s;
+
+-- Count User Case Logs
+-- Purpose: Total number of cases for a user in a guild (shown in the /cases header).
+-- Used by: async_count_user_caselogs, /cases command
+-- Parameters: guild_id (BIGINT), user_id (BIGINT)
+SELECT COUNT(*) FROM case_logs WHERE guild_id = %s AND user_id = %s;
 
 -- Set Bot Configuration
 -- Purpose: Inserts or updates a configuration key-value pair.
@@ -88,9 +125,16 @@ ON DUPLICATE KEY UPDATE value = VALUES(value);
 -- Log Moderation Case
 -- Purpose: Logs a moderation action (e.g., ban, kick, mute).
 -- Used by: async_log_case, /ban, /kick, /mute, /unmute, /warn, /unban
--- Parameters: user_id (BIGINT), moderator_id (BIGINT), action (VARCHAR), reason (TEXT), duration (VARCHAR, nullable)
-INSERT INTO case_logs (user_id, moderator_id, action, reason, duration)
-VALUES (%s, %s, %s, %s, %s);
+-- Parameters: guild_id (BIGINT), user_id (BIGINT), moderator_id (BIGINT), action (VARCHAR), reason (TEXT), duration (VARCHAR, nullable)
+INSERT INTO case_logs (guild_id, user_id, moderator_id, action, reason, duration)
+VALUES (%s, %s, %s, %s, %s, %s);
+
+-- Log Moderation Cases (bulk)
+-- Purpose: Logs the same action for every user affected by a mass action, as one executemany batch.
+-- Used by: async_log_cases_bulk, /massban, /masstimeout
+-- Parameters (per row): guild_id (BIGINT), user_id (BIGINT), moderator_id (BIGINT), action (VARCHAR), reason (TEXT), duration (VARCHAR, nullable)
+INSERT INTO case_logs (guild_id, user_id, moderator_id, action, reason, duration)
+VALUES (%s, %s, %s, %s, %s, %s);
 
 -- Fetch Level Config
 -- Purpose: Retrieves leveling configuration for a guild.
@@ -115,13 +159,45 @@ SELECT xp, level, message_count, last_xp_gain FROM user_levels WHERE guild_id =
 -- Purpose: Creates a new user level entry if it doesn't exist.
 -- Used by: async_get_user_level, on_message
 -- Parameters: guild_id (BIGINT), user_id (BIGINT)
-INSERT INTO user_levels (guild_id, user_id) VALUES (%s, %s);
+INSERT IGNORE INTO user_levels (guild_id, user_id) VALUES (%s, %s);
 
 -- Update User Level Data
--- Purpose: Updates XP, level, message count, or last XP gain for a user.
+-- Purpose: Updates XP, level, message count, or last XP gain for a user. A NULL parameter keeps the stored value,
+--          so every partial update shares this one statement (run as a server-side prepared statement).
 -- Used by: async_update_user_level, /level add_xp, /level remove_xp, on_message
 -- Parameters: xp (INT, nullable), level (INT, nullable), message_count (INT, nullable), last_xp_gain (TIMESTAMP, nullable), guild_id (BIGINT), user_id (BIGINT)
-UPDATE user_levels SET xp = %s, level = %s, message_count = %s, last_xp_gain = %s WHERE guild_id = %s AND user_id = %s;
+UPDATE user_levels SET xp = COALESCE(%s, xp), level = COALESCE(%s, level), message_count = COALESCE(%s, message_count), last_xp_gain = COALESCE(%s, last_xp_gain) WHERE guild_id = %s AND user_id = %s;
+
+-- Apply Message XP (one upsert plus an unlocked read-back, one connection checkout)
+-- Purpose: Atomically applies a chat message: cooldown check, XP and message_count increments and level recompute.
+--          Inside the cooldown the row is left untouched, so the affected-row count is 1 (insert), 2 (update) or 0 (cooldown;
+--          on_message then counts the message through the write buffer). The old level is derived from xp - gain.
+-- Used by: async_apply_message_xp, on_message
+-- Parameters: guild_id, user_id, xp_gain, initial level, now, then cutoff (now - cooldown), cutoff, multiplier, multiplier, cutoff, cutoff
+INSERT INTO user_levels (guild_id, user_id, xp, level, message_count, last_xp_gain) VALUES (%s, %s, %s, %s, 1, %s)
+ON DUPLICATE KEY UPDATE xp = IF((last_xp_gain IS NULL OR last_xp_gain <= %s), xp + VALUES(xp), xp),
+    level = IF((last_xp_gain IS NULL OR last_xp_gain <= %s), IF(%s = 0, 0, FLOOR((SQRT(1 + 8 * xp / %s) - 1) / 2)), level),
+    message_count = IF((last_xp_gain IS NULL OR last_xp_gain <= %s), message_count + 1, message_count),
+    last_xp_gain = IF((last_xp_gain IS NULL OR last_xp_gain <= %s), VALUES(last_xp_gain), last_xp_gain);
+SELECT xp, level, message_count, last_xp_gain FROM user_levels WHERE guild_id = %s AND user_id = %s;
+
+-- Flush Buffered XP Updates
+-- Purpose: Applies batched per-user XP/message_count deltas from the write-behind buffer (one row tuple per user).
+-- Used by: XPWriteBuffer.flush (message_count bumps from on_message inside the XP cooldown; shutdown, /restart)
+-- Parameters per row: guild_id (BIGINT), user_id (BIGINT), xp delta (INT), level (INT), message_count delta (INT), last_xp_gain (TIMESTAMP, nullable)
+INSERT INTO user_levels (guild_id, user_id, xp, level, message_count, last_xp_gain)
+VALUES (%s, %s, %s, %s, %s, %s), (%s, %s, %s, %s, %s, %s)
+ON DUPLICATE KEY UPDATE xp = xp + VALUES(xp),
+    level = IF(VALUES(xp) > 0, VALUES(level), level),
+    message_count = message_count + VALUES(message_count),
+    last_xp_gain = IFNULL(VALUES(last_xp_gain), last_xp_gain);
+
+-- Recompute Guild Levels (after /level set_xp_multiplier)
+-- Purpose: Streams a guild's rows in user_id order (keyset pagination), then writes changed levels back in one executemany batch per chunk.
+-- Used by: async_recompute_guild_levels
+-- Parameters: guild_id (BIGINT), last seen user_id (BIGINT), chunk size (INT); then per row: level, guild_id, user_id, xp read
+SELECT user_id, xp, level FROM user_levels WHERE guild_id = %s AND user_id > %s ORDER BY user_id LIMIT %s;
+UPDATE user_levels SET level = %s WHERE guild_id = %s AND user_id = %s AND xp = %s;
 
 -- Add Level Role
 -- Purpose: Assigns a role to a specific level in a guild.
@@ -130,20 +206,83 @@ UPDATE user_levels SET xp = %s, level = %s, message_count = %s, last_xp_gain = %
 INSERT INTO level_roles (guild_id, level, role_id) VALUES (%s, %s, %s)
 ON DUPLICATE KEY UPDATE role_id = %s;
 
--- Fetch Level Role
--- Purpose: Retrieves the role ID for a specific level in a guild.
--- Used by: async_get_level_role, on_message, /level add_xp
--- Parameters: guild_id (BIGINT), level (INT)
-SELECT role_id FROM level_roles WHERE guild_id = %s AND level = %s;
+-- Fetch Level Roles For Guild
+-- Purpose: Loads every level role of a guild once into the in-memory LevelRoleIndex (bisect lookups afterwards).
+-- Used by: async_get_level_roles_between, async_get_level_role, on_message, /level add_xp, /level remove_xp
+-- Parameters: guild_id (BIGINT)
+SELECT level, role_id FROM level_roles WHERE guild_id = %s ORDER BY level;
 
 -- Fetch Top User
--- Purpose: Retrieves the user with the highest message count in a guild.
+-- Purpose: Retrieves the user with the highest message count in a guild, using idx_user_levels_guild_messages.
 -- Used by: async_get_top_user, /level update_top
 -- Parameters: guild_id (BIGINT)
-SELECT user_id FROM user_levels WHERE guild_id = %s ORDER BY message_count DESC LIMIT 1;
+SELECT user_id, message_count FROM user_levels WHERE guild_id = %s ORDER BY message_count DESC LIMIT 1;
+
+-- Fetch Message Count
+-- Purpose: Seeds the in-memory top message sender of a guild from level_config.current_top_user_id (once per guild).
+-- Used by: async_get_message_count, on_message
+-- Parameters: guild_id (BIGINT), user_id (BIGINT)
+SELECT message_count FROM user_levels WHERE guild_id = %s AND user_id = %s;
 
 -- Fetch User Rank
--- Purpose: Retrieves the rank of a user based on XP in a guild.
--- Used by: async_get_user_rank, /level rank
+-- Purpose: Retrieves the rank of a user based on XP in a guild (1 + users with strictly more XP), using idx_user_levels_guild_xp.
+-- Used by: async_get_user_rank, /level rank (until the guild's in-memory XP index has loaded)
 -- Parameters: guild_id (BIGINT), user_id (BIGINT)
-SELECT user_id, xp FROM user_levels WHERE guild_id = %s ORDER BY xp DESC;
+SELECT 1 + (SELECT COUNT(*) FROM user_levels AS other WHERE other.guild_id = u.guild_id AND other.xp > u.xp)
+FROM user_levels AS u WHERE u.guild_id = %s AND u.user_id = %s;
+
+-- Load Guild XP Index
+-- Purpose: Loads a guild's XP values once into the in-memory SortedXPIndex used for repeated rank lookups.
+-- Used by: GuildXPIndexes
+-- Parameters: guild_id (BIGINT)
+SELECT user_id, xp FROM user_levels WHERE guild_id = %s;
+
+-- --------------------------------------
+-- Embedded SQLite Schema (DB_DRIVER = "sqlite")
+-- Applied by SQLiteDriver.migrate from SQLITE_SCHEMA_MIGRATIONS. Portable queries above run unchanged (%s -> ?).
+-- The upserts and INSERT IGNORE have hand-written SQLite versions (ON CONFLICT ... DO UPDATE SET, INSERT OR IGNORE),
+-- registered next to each statement in SQLITE_STATEMENTS via sqlite_variant(). sqlite_query raises
+-- SQLiteDialectError for any other statement with MySQL-only syntax (IF(, VALUES(col), backticks, LIMIT x, y,
+-- FOR UPDATE, ON DUPLICATE KEY, INSERT IGNORE) instead of guessing a translation.
+-- --------------------------------------
+
+CREATE TABLE IF NOT EXISTS schema_version (version INTEGER PRIMARY KEY, description TEXT NOT NULL, applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP);
+CREATE TABLE IF NOT EXISTS bot_config (name TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS case_logs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    guild_id INTEGER DEFAULT NULL,
+    user_id INTEGER NOT NULL,
+    moderator_id INTEGER NOT NULL,
+    action TEXT NOT NULL,
+    reason TEXT,
+    duration TEXT DEFAULT NULL,
+    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS user_levels (
+    guild_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    xp INTEGER DEFAULT 0,
+    level INTEGER DEFAULT 0,
+    message_count INTEGER DEFAULT 0,
+    last_xp_gain TIMESTAMP NULL,
+    PRIMARY KEY (guild_id, user_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS level_config (
+    guild_id INTEGER PRIMARY KEY,
+    xp_min INTEGER DEFAULT 1,
+    xp_max INTEGER DEFAULT 10,
+    xp_multiplier INTEGER DEFAULT 100,
+    xp_cooldown_seconds INTEGER DEFAULT 60,
+    level_up_channel_id INTEGER,
+    top_message_role_id INTEGER,
+    current_top_user_id INTEGER
+);
+CREATE TABLE IF NOT EXISTS level_roles (
+    guild_id INTEGER NOT NULL,
+    level INTEGER NOT NULL,
+    role_id INTEGER NOT NULL,
+    PRIMARY KEY (guild_id, level)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_case_logs_guild_user_id ON case_logs (guild_id, user_id, id);
+CREATE INDEX IF NOT EXISTS idx_user_levels_guild_xp ON user_levels (guild_id, xp);
+CREATE INDEX IF NOT EXISTS idx_user_levels_guild_messages ON user_levels (guild_id, message_count);
@@ -0,0 +1,25 @@
+"""Helpers shared by the benchmark scripts (not a benchmark itself)."""
+import math
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import botcode  # noqa: E402
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of samples (0.0 when there are none)."""
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+async def remove_guild_data(guild_ids):
+    """Deletes every user_levels, level_config and level_roles row of the given benchmark guilds."""
+    placeholders = ", ".join(["%s"] * len(guild_ids))
+    await botcode.async_db_transaction(
+        botcode.DBStatement(f"DELETE FROM user_levels WHERE guild_id IN ({placeholders})", tuple(guild_ids)),
+        botcode.DBStatement(f"DELETE FROM level_config WHERE guild_id IN ({placeholders})", tuple(guild_ids)),
+        botcode.DBStatement(f"DELETE FROM level_roles WHERE guild_id IN ({placeholders})", tuple(guild_ids)),
+    )
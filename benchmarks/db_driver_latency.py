@@ -0,0 +1,84 @@
+"""Compares p50/p99 latency of the "thread" and "aiomysql" database drivers.
+
+Runs the same mix of hot helpers (async_get_level_config, async_get_user_level,
+async_update_user_level) through each driver at a fixed concurrency, and probes an
+unrelated asyncio.to_thread call during the run to show default-executor queueing.
+
+Usage: python benchmarks/db_driver_latency.py [--requests 2000] [--concurrency 100] [--guild-id 900000100]
+Needs the MySQL server from DB_CONFIG and the aiomysql package. Rows are written under --guild-id
+(a throwaway ID no real guild has) and deleted when the run ends, even if it fails.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import botcode  # noqa: E402
+from _util import percentile, remove_guild_data  # noqa: E402
+
+
+async def run_driver(driver, requests, concurrency, guild_id):
+    botcode.db_driver = driver
+    latencies = []
+    probe_latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+    done = asyncio.Event()
+
+    async def one(i):
+        async with semaphore:
+            start = time.perf_counter()
+            user_id = i % 500
+            await botcode.async_get_level_config(guild_id)
+            data = await botcode.async_get_user_level(guild_id, user_id)
+            await botcode.async_update_user_level(guild_id, user_id, message_count=data['message_count'] + 1)
+            latencies.append(time.perf_counter() - start)
+
+    async def probe():
+        while not done.is_set():
+            start = time.perf_counter()
+            await asyncio.to_thread(lambda: None)
+            probe_latencies.append(time.perf_counter() - start)
+            await asyncio.sleep(0.01)
+
+    probe_task = asyncio.create_task(probe())
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    elapsed = time.perf_counter() - started
+    done.set()
+    await probe_task
+    await driver.close()
+    return latencies, probe_latencies, elapsed
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--guild-id", type=int, default=900_000_100)
+    args = parser.parse_args()
+
+    botcode.setup_database_schema()
+    drivers = [botcode.ThreadedMySQLDriver()]
+    if botcode.aiomysql is not None:
+        drivers.append(botcode.AsyncMySQLDriver(botcode.DB_CONFIG, botcode.DB_POOL_SIZE))
+    else:
+        print("aiomysql is not installed; only the thread driver will be measured.")
+
+    print(f"{'driver':<10} {'p50 ms':>9} {'p99 ms':>9} {'ops/s':>9} {'to_thread p99 ms':>17}")
+    try:
+        for driver in drivers:
+            latencies, probes, elapsed = await run_driver(driver, args.requests, args.concurrency, args.guild_id)
+            print(
+                f"{driver.name:<10} {percentile(latencies, 50) * 1000:>9.2f} {percentile(latencies, 99) * 1000:>9.2f} "
+                f"{len(latencies) / elapsed:>9.0f} {percentile(probes, 99) * 1000:>17.2f}"
+            )
+    finally:
+        botcode.db_driver = botcode.ThreadedMySQLDriver()
+        await remove_guild_data([args.guild_id])
+        await botcode.db_driver.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
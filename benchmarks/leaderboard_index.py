@@ -0,0 +1,61 @@
+"""Benchmarks SortedXPIndex (the /level rank and /level leaderboard structure) on a large guild.
+
+Builds an index of --users random XP values, then measures XP updates, rank lookups and
+leaderboard pages at random depths, next to a full sort per page for comparison.
+
+Usage: python benchmarks/leaderboard_index.py [--users 1000000] [--ops 20000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import botcode  # noqa: E402
+from _util import percentile  # noqa: E402
+
+
+def timed(fn, ops):
+    samples = []
+    for _ in range(ops):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def report(name, samples):
+    print(f"{name:<28} p50 {percentile(samples, 50) * 1e6:>10.1f} us   p99 {percentile(samples, 99) * 1e6:>10.1f} us")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--ops", type=int, default=20_000)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    xp = {user_id: rng.randint(0, 500_000) for user_id in range(args.users)}
+
+    start = time.perf_counter()
+    index = botcode.SortedXPIndex(xp.items())
+    print(f"build ({args.users} users)            {time.perf_counter() - start:.2f} s")
+
+    def update():
+        user_id = rng.randrange(args.users)
+        xp[user_id] += rng.randint(1, 10)
+        index.set_xp(user_id, xp[user_id])
+
+    page_size = botcode.LeaderboardView.PAGE_SIZE
+    pages = args.users // page_size
+    report("set_xp", timed(update, args.ops))
+    report("rank", timed(lambda: index.rank(rng.randrange(args.users)), args.ops))
+    report("page (random depth)", timed(lambda: index.page(rng.randrange(pages) * page_size, page_size), args.ops))
+    report("page (last page)", timed(lambda: index.page((pages - 1) * page_size, page_size), args.ops))
+    full_sort_ops = max(1, min(20, args.ops))
+    report("full sort per page (old way)", timed(lambda: sorted(xp.items(), key=lambda item: -item[1])[:page_size], full_sort_ops))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Measures resident memory and time-to-ready of the bot's gateway session under each MEMORY_PROFILE.
+
+Every profile runs in a fresh Python process that logs in with the bot's intents and cache options,
+waits for on_ready (which includes member chunking when the profile chunks at startup), waits
+--settle seconds for the caches to fill from live traffic, and reports RSS, ready time and cache sizes.
+Only the Discord client runs: no database, command sync or background tasks.
+
+Usage: python benchmarks/memory_profiles.py [--profiles full balanced minimal] [--settle 30] [--output FILE]
+Needs a bot token in DISCORD_BOT_TOKEN (or --token). Measure with the bot in your real guilds.
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import botcode  # noqa: E402
+
+
+def rss_mb():
+    """Current resident set size, or the peak where /proc is unavailable."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+async def measure(profile, token, settle):
+    started = time.perf_counter()
+    baseline = rss_mb()
+    client = botcode.commands.Bot(command_prefix="!", intents=botcode.bot_intents(), **botcode.memory_profile_options(profile))
+    result = {}
+
+    @client.event
+    async def on_ready():
+        result["ready_seconds"] = time.perf_counter() - started
+        result["rss_ready_mb"] = rss_mb()
+        await asyncio.sleep(settle)
+        result["rss_settled_mb"] = rss_mb()
+        result["guilds"] = len(client.guilds)
+        result["cached_members"] = sum(len(guild.members) for guild in client.guilds)
+        result["total_members"] = sum(guild.member_count or 0 for guild in client.guilds)
+        result["cached_messages"] = len(client.cached_messages)
+        await client.close()
+
+    await client.start(token)
+    return {"profile": profile, "rss_baseline_mb": baseline, **result}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profiles", nargs="+", default=list(botcode.MEMORY_PROFILES), choices=list(botcode.MEMORY_PROFILES))
+    parser.add_argument("--settle", type=float, default=30, help="seconds to keep running after on_ready")
+    parser.add_argument("--token", default=os.getenv("DISCORD_BOT_TOKEN"))
+    parser.add_argument("--output", help="also write the results as JSON")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if not args.token:
+        parser.error("set DISCORD_BOT_TOKEN or pass --token")
+
+    if args.child:
+        print(json.dumps(asyncio.run(measure(args.child, args.token, args.settle))))
+        return
+
+    results = []
+    print(f"{'profile':<10} {'ready s':>8} {'RSS ready MB':>13} {'RSS settled MB':>15} {'members cached':>15} {'messages':>9}")
+    for profile in args.profiles:
+        child = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", profile, "--settle", str(args.settle)],
+            env={**os.environ, "DISCORD_BOT_TOKEN": args.token}, capture_output=True, text=True, check=True
+        )
+        row = json.loads(child.stdout.strip().splitlines()[-1])
+        results.append(row)
+        print(
+            f"{profile:<10} {row['ready_seconds']:>8.1f} {row['rss_ready_mb']:>13.1f} {row['rss_settled_mb']:>15.1f} "
+            f"{row['cached_members']:>7}/{row['total_members']:<7} {row['cached_messages']:>9}"
+        )
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""Synthetic load test for BurgentruckBot.on_message.
+
+Drives on_message with fake messages, members and guilds, against the storage backend
+the bot is configured for, and reports:
+  - throughput (messages/s) and p50/p99 latency per message (from its scheduled send time),
+  - DB calls (connection checkouts) and SQL statements per message, from the bot's own metrics,
+  - Discord REST calls per message (level-up posts and role edits made through the fakes).
+Results are printed and saved as JSON so runs can be compared for regressions.
+
+Usage: python benchmarks/on_message_load.py [--messages 20000] [--rate 0] [--concurrency 50]
+                                            [--users 5000] [--guilds 5] [--cooldown 60]
+                                            [--backend thread|aiomysql|sqlite] [--sqlite-path PATH]
+                                            [--output benchmarks/results/on_message_load.json]
+--rate 0 sends as fast as --concurrency allows; a positive rate schedules messages open-loop.
+The MySQL backends use the server from DB_CONFIG; sqlite uses a local file (SQLITE_PATH by default).
+Rows are written under --guild-id-base and removed afterwards unless --keep-data is given.
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import botcode  # noqa: E402
+from _util import percentile, remove_guild_data  # noqa: E402
+
+
+class RestCounter:
+    """Counts the Discord REST calls the fakes would have made."""
+    def __init__(self):
+        self.calls = 0
+
+
+class FakeRole:
+    def __init__(self, role_id):
+        self.id = role_id
+        self.name = f"role-{role_id}"
+
+
+class FakeMember:
+    def __init__(self, user_id, rest):
+        self.id = user_id
+        self.bot = False
+        self.mention = f"<@{user_id}>"
+        self.roles = []
+        self._rest = rest
+
+    async def add_roles(self, *roles, **kwargs):
+        self._rest.calls += 1
+
+    async def remove_roles(self, *roles, **kwargs):
+        self._rest.calls += 1
+
+
+class FakeGuild:
+    def __init__(self, guild_id, rest):
+        self.id = guild_id
+        self.name = f"guild-{guild_id}"
+        self._members = {}
+        self._rest = rest
+
+    def member(self, user_id):
+        member = self._members.get(user_id)
+        if member is None:
+            member = self._members[user_id] = FakeMember(user_id, self._rest)
+        return member
+
+    def get_member(self, user_id):
+        return self._members.get(user_id)
+
+    def get_role(self, role_id):
+        return FakeRole(role_id)
+
+
+class FakeChannel:
+    def __init__(self, rest):
+        self._rest = rest
+
+    async def send(self, *args, **kwargs):
+        self._rest.calls += 1
+
+
+class FakeMessage:
+    def __init__(self, author, guild, channel):
+        self.author = author
+        self.guild = guild
+        self.channel = channel
+        self.content = "hello"
+
+
+def histogram_count(name):
+    return sum(histogram.count for histogram in botcode.metrics.histograms(name).values())
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def prepare_guilds(guild_ids, cooldown, channel_id):
+    for guild_id in guild_ids:
+        for key, value in (("xp_cooldown_seconds", cooldown), ("level_up_channel_id", channel_id), ("top_message_role_id", 1)):
+            await botcode.async_set_level_config(guild_id, key, value)
+        for level in (1, 5, 10, 20):
+            await botcode.async_add_level_role(guild_id, level, 1000 + level)
+
+
+async def run(args):
+    rng = random.Random(args.seed)
+    rest = RestCounter()
+    channel = FakeChannel(rest)
+    channel_id = 42
+
+    bot = botcode.BurgentruckBot(token="benchmark")
+    botcode.bot = bot
+
+    async def no_commands(message):
+        return None
+    bot.process_commands = no_commands
+    bot.get_channel = lambda cid: channel if cid == channel_id else None
+
+    guild_ids = [args.guild_id_base + i for i in range(args.guilds)]
+    guilds = [FakeGuild(guild_id, rest) for guild_id in guild_ids]
+    await prepare_guilds(guild_ids, args.cooldown, channel_id)
+    botcode.xp_buffer.start()
+
+    messages = []
+    for _ in range(args.messages):
+        guild = rng.choice(guilds)
+        messages.append(FakeMessage(guild.member(rng.randrange(1, args.users + 1)), guild, channel))
+
+    db_calls_before = histogram_count("db_query_seconds")
+    statements_before = histogram_count("db_statement_seconds")
+    latencies = []
+    semaphore = asyncio.Semaphore(args.concurrency)
+    started = time.perf_counter()
+
+    async def deliver(i, message):
+        scheduled = started + i / args.rate if args.rate > 0 else None
+        if scheduled is not None:
+            await asyncio.sleep(max(0.0, scheduled - time.perf_counter()))
+        async with semaphore:
+            begin = scheduled if scheduled is not None else time.perf_counter()
+            await bot.on_message(message)
+            latencies.append(time.perf_counter() - begin)
+
+    await asyncio.gather(*(deliver(i, message) for i, message in enumerate(messages)))
+    elapsed = time.perf_counter() - started
+    await botcode.xp_buffer.stop()
+    db_calls = histogram_count("db_query_seconds") - db_calls_before
+    statements = histogram_count("db_statement_seconds") - statements_before
+
+    if not args.keep_data:
+        await remove_guild_data(guild_ids)
+    await bot.close()
+
+    return {
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "git_revision": git_revision(),
+        "backend": botcode.db_driver.name if botcode.db_driver is not None else botcode.DB_DRIVER,
+        "parameters": {
+            "messages": args.messages, "rate": args.rate, "concurrency": args.concurrency,
+            "users": args.users, "guilds": args.guilds, "cooldown": args.cooldown, "seed": args.seed,
+        },
+        "results": {
+            "elapsed_seconds": elapsed,
+            "messages_per_second": len(latencies) / elapsed if elapsed else 0.0,
+            "latency_p50_ms": percentile(latencies, 50) * 1000,
+            "latency_p99_ms": percentile(latencies, 99) * 1000,
+            "latency_max_ms": max(latencies) * 1000 if latencies else 0.0,
+            "db_calls_per_message": db_calls / len(latencies) if latencies else 0.0,
+            "sql_statements_per_message": statements / len(latencies) if latencies else 0.0,
+            "rest_calls_per_message": rest.calls / len(latencies) if latencies else 0.0,
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--rate", type=float, default=0, help="messages per second (0 = as fast as possible)")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--users", type=int, default=5000, help="distinct authors per guild")
+    parser.add_argument("--guilds", type=int, default=5)
+    parser.add_argument("--cooldown", type=int, default=60, help="xp_cooldown_seconds for the test guilds")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--guild-id-base", type=int, default=900_000_000)
+    parser.add_argument("--keep-data", action="store_true")
+    parser.add_argument("--backend", choices=["thread", "aiomysql", "sqlite"], default=botcode.DB_DRIVER)
+    parser.add_argument("--sqlite-path", default=botcode.SQLITE_PATH)
+    parser.add_argument("--output", default=os.path.join(ROOT, "benchmarks", "results", "on_message_load.json"))
+    args = parser.parse_args()
+
+    botcode.DB_DRIVER = args.backend
+    botcode.SQLITE_PATH = args.sqlite_path
+    if botcode.load_startup_state() is None:
+        print("Database unavailable.")
+        return
+    report = asyncio.run(run(args))
+    for key, value in report["results"].items():
+        print(f"{key:<30} {value:>12.3f}")
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Saved {args.output}")
+
+
+if __name__ == "__main__":
+    main()
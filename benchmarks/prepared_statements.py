@@ -0,0 +1,94 @@
+"""Compares text-protocol and prepared execution of the hot user_levels statements.
+
+For each mode it runs the on_message statement mix (the XP upsert and the unlocked
+read-back) plus the old variable-shape UPDATE or the fixed COALESCE UPDATE, and reads the
+server's session counters before and after: Com_select/Com_insert/Com_update count statements
+parsed from text, Com_stmt_prepare counts statements parsed for the binary protocol, and
+Com_stmt_execute counts executions that skipped parsing.
+
+Usage: python benchmarks/prepared_statements.py [--iterations 5000] [--guild-id 900000200]
+Needs the MySQL server from DB_CONFIG. Rows are written under --guild-id (a throwaway ID no real
+guild has) and deleted when the run ends, even if it fails.
+"""
+import argparse
+import datetime
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import botcode  # noqa: E402
+from _util import percentile  # noqa: E402
+
+COUNTERS = ("Com_select", "Com_insert", "Com_update", "Com_stmt_prepare", "Com_stmt_execute")
+
+
+def session_counters(conn):
+    cursor = conn.cursor()
+    cursor.execute("SHOW SESSION STATUS WHERE Variable_name IN (%s, %s, %s, %s, %s)", COUNTERS)
+    counters = {name: int(value) for name, value in cursor.fetchall()}
+    cursor.close()
+    return counters
+
+
+def old_update(rng, guild_id, user_id):
+    """The variable SET clause async_update_user_level used to build (up to 15 distinct shapes)."""
+    fields = [name for name in ("xp", "level", "message_count", "last_xp_gain") if rng.random() < 0.5] or ["message_count"]
+    values = [datetime.datetime.now() if name == "last_xp_gain" else rng.randint(0, 100) for name in fields]
+    query = f"UPDATE user_levels SET {', '.join(name + ' = %s' for name in fields)} WHERE guild_id = %s AND user_id = %s"
+    return botcode.DBStatement(query, tuple(values) + (guild_id, user_id))
+
+
+def new_update(rng, guild_id, user_id):
+    values = [rng.randint(0, 100) if rng.random() < 0.5 else None for _ in range(3)] + [None]
+    return botcode.DBStatement(botcode.SQL_UPDATE_USER_LEVEL, tuple(values) + (guild_id, user_id))
+
+
+def run(conn, prepared, iterations, guild_id):
+    botcode.DB_PREPARED_STATEMENTS = prepared
+    rng = random.Random(7)
+    update = new_update if prepared else old_update
+    before = session_counters(conn)
+    latencies = []
+    for i in range(iterations):
+        user_id = i % 1000
+        now = datetime.datetime.now()
+        cutoff = now - datetime.timedelta(seconds=60)
+        statements = [
+            botcode.DBStatement(botcode.SQL_APPLY_MESSAGE_XP, (guild_id, user_id, 5, 0, now, cutoff, cutoff, 100, 100, cutoff, cutoff)),
+            botcode.DBStatement(botcode.SQL_SELECT_USER_LEVEL, (guild_id, user_id), fetch="one", dictionary=True),
+            update(rng, guild_id, user_id),
+        ]
+        start = time.perf_counter()
+        botcode._run_statements_sync(conn, statements)
+        latencies.append(time.perf_counter() - start)
+    after = session_counters(conn)
+    return latencies, {name: after[name] - before[name] for name in COUNTERS}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=5000)
+    parser.add_argument("--guild-id", type=int, default=900_000_200)
+    args = parser.parse_args()
+
+    botcode.setup_database_schema()
+    conn = botcode._get_sync_connection()
+    if conn is None:
+        print("Database unavailable.")
+        return
+    print(f"{'mode':<10} {'p50 ms':>8} {'p99 ms':>8} " + " ".join(f"{name:>16}" for name in COUNTERS))
+    try:
+        for prepared in (False, True):
+            latencies, deltas = run(conn, prepared, args.iterations, args.guild_id)
+            mode = "prepared" if prepared else "text"
+            print(f"{mode:<10} {percentile(latencies, 50) * 1000:>8.3f} {percentile(latencies, 99) * 1000:>8.3f} " + " ".join(f"{deltas[name]:>16}" for name in COUNTERS))
+        print(f"prepared statement registry: {botcode.prepared_statements.stats()}")
+    finally:
+        botcode._run_statements_sync(conn, [botcode.DBStatement("DELETE FROM user_levels WHERE guild_id = %s", (args.guild_id,))])
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Measures bot startup cost: module import, and the database work done before login.
+
+Reports the time to import botcode in a fresh interpreter, then times load_startup_state()
+(schema version check + one bot_config read) against replaying every migration's DDL,
+which is what each startup did before schema versions were recorded.
+
+Usage: python benchmarks/startup_time.py [--runs 5]
+The database steps need the MySQL server from DB_CONFIG; they are skipped if it is unreachable.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def time_import(runs):
+    code = "import time; start = time.perf_counter(); import botcode; print(time.perf_counter() - start)"
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True).stdout
+        samples.append(float(output.strip().splitlines()[-1]))
+    return samples
+
+
+def time_call(fn, runs):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def report(name, samples):
+    print(f"{name:<36} median {statistics.median(samples) * 1000:>9.1f} ms   min {min(samples) * 1000:>9.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    report("import botcode", time_import(args.runs))
+
+    import botcode
+    if botcode.load_startup_state() is None:
+        print("Database unavailable; skipping the startup database measurements.")
+        return
+    report("load_startup_state (schema current)", time_call(botcode.load_startup_state, args.runs))
+
+    def replay_all_migrations():
+        conn = botcode._get_sync_connection()
+        cursor = conn.cursor(buffered=True)
+        for _, _, migrate in botcode.SCHEMA_MIGRATIONS:
+            migrate(cursor)
+        cursor.execute("SELECT name, value FROM bot_config")
+        cursor.fetchall()
+        cursor.close()
+        conn.close()
+    report("replay every migration (old startup)", time_call(replay_all_migrations, args.runs))
+    botcode.db_pool.close_all()
+
+
+if __name__ == "__main__":
+    main()
@@ -3,15 +3,41 @@ from discord.ext import commands
 from discord import app_commands
 from discord.ui import View, Modal, TextInput
 import mysql.connector
+from mysql.connector import errorcode
+import sqlite3
 import os
 import datetime
 import asyncio
 import sys
-from typing import Optional, Dict, Any, Union
+from typing import Optional, Dict, Any, Union, List, NamedTuple, Tuple, Callable, Awaitable
 import io
+import json
+import hashlib
 import time
 import math
 import random
+import bisect
+import re
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, Future
+import queue
+import threading
+import weakref
+import contextvars
+import logging
+from logging.handlers import RotatingFileHandler
+import functools
+from aiohttp import web
+
+try:
+    import aiomysql  # optional: only needed when DB_DRIVER = "aiomysql"
+except ImportError:
+    aiomysql = None
+
+try:
+    import numpy as np  # optional: vectorizes guild-wide level recomputes
+except ImportError:
+    np = None
 
 # --- Configuration & Global State ---
 
@@ -30,11 +56,98 @@ DB_CONFIG = {
     "database": "discordbotdb"
 }
 
+# Connection pool settings shared by every database helper.
+DB_POOL_SIZE = 10 # max number of open connections
+DB_POOL_CHECKOUT_TIMEOUT = 5 # seconds to wait for a free connection before giving up
+DB_POOL_IDLE_RECYCLE_SECONDS = 300 # idle connections older than this are closed and reopened
+DB_POOL_PING_IDLE_SECONDS = 30 # connections idle longer than this are pinged on checkout; fresher ones are used as-is
+
+# Dedicated worker threads for blocking database calls (the "thread" driver and async_db_runner)
+DB_EXECUTOR_THREADS = DB_POOL_SIZE # one per pooled connection; more threads would only wait on the pool
+DB_EXECUTOR_MAX_QUEUE = 500 # calls queued or running at once; further callers wait for a slot
+DB_EXECUTOR_LOW_PRIORITY_LIMIT = 100 # low-priority writes (buffered XP/message_count flushes) are deferred while this many calls wait
+
+# Hot user_levels/level_config/level_roles queries use server-side prepared statements, prepared once per pooled connection (thread driver only)
+DB_PREPARED_STATEMENTS = True
+
+# "thread" runs mysql-connector calls in worker threads, "aiomysql" uses the native asyncio driver (pip install aiomysql),
+# "sqlite" stores everything in a local SQLite file instead of a MySQL server (single-host deployments)
+DB_DRIVER = "thread"
+
+# Embedded SQLite storage (DB_DRIVER = "sqlite")
+SQLITE_PATH = "discordbot.sqlite3"
+SQLITE_MMAP_SIZE_BYTES = 256 * 1024 * 1024 # reads go through memory-mapped I/O up to this database size
+SQLITE_BUSY_TIMEOUT_SECONDS = 5 # how long a connection waits on a lock held by another process
+SQLITE_GROUP_COMMIT_MAX_WRITES = 64 # queued write transactions committed together by the single writer thread
+
+# Circuit breaker around the database: after this many consecutive connection failures calls fail fast,
+# and one probe call is let through every DB_BREAKER_RESET_SECONDS until the database answers again
+DB_BREAKER_FAILURE_THRESHOLD = 3
+DB_BREAKER_RESET_SECONDS = 30
+
+# Write-behind buffer for per-message XP and message_count updates
+XP_FLUSH_INTERVAL_SECONDS = 5 # pending updates are written at least this often
+XP_FLUSH_MAX_PENDING = 500 # flush early once this many users have pending updates
+XP_SHUTDOWN_FLUSH_ATTEMPTS = 3 # tries for the final flush on shutdown before pending updates are given up
+
+# Cached level_config rows (including "not configured") are reloaded from the database after this many seconds
+LEVEL_CONFIG_CACHE_TTL_SECONDS = 300
+
+# Rows streamed per batch when a guild's levels are recomputed after an xp_multiplier change
+LEVEL_RECOMPUTE_CHUNK_SIZE = 5000
+
+# Background dispatcher for log channel posts
+LOG_QUEUE_MAX_SIZE = 1000 # log embeds waiting to be posted; newer ones are dropped (and summarized) beyond this
+LOG_BATCH_DELAY_SECONDS = 1.0 # how long a partial batch waits for more embeds before it is posted
+LOG_DRAIN_TIMEOUT_SECONDS = 5 # max time spent posting queued logs on shutdown
+
+# Raid response commands (/massban, /masstimeout)
+MASS_ACTION_MAX_TARGETS = 1000 # targets beyond this are ignored in one run
+MASS_ACTION_CONCURRENCY = 5 # parallel REST calls for timeouts (and for bans when bulk ban is unavailable)
+MASS_ACTION_PROGRESS_INTERVAL_SECONDS = 2 # minimum time between progress message edits
+
+# In-memory XP cooldown gate
+XP_COOLDOWN_TRACKER_MAX_USERS = 100000 # least recently active users are evicted beyond this
+XP_COOLDOWN_TRACKER_IDLE_SECONDS = 3600 # users with no messages for this long are evicted
+
+# Memory profile for discord.py's member and message caches (see MEMORY_PROFILES below)
+MEMORY_PROFILE = "balanced"
+MEMORY_PROFILES = {
+    # discord.py defaults: every member of every guild is downloaded at startup, 1000 messages cached
+    "full": {"member_cache": "all", "chunk_guilds_at_startup": True, "max_messages": 1000,
+             "xp_index_max_users": 5000000, "xp_index_idle_seconds": 86400},
+    # members are cached as they show up; a guild is downloaded only when a command needs its full member list
+    "balanced": {"member_cache": "all", "chunk_guilds_at_startup": False, "max_messages": 200,
+                 "xp_index_max_users": 1000000, "xp_index_idle_seconds": 3600},
+    # no member or message cache; members are fetched on demand (one REST call each)
+    "minimal": {"member_cache": "none", "chunk_guilds_at_startup": False, "max_messages": None,
+                "xp_index_max_users": 100000, "xp_index_idle_seconds": 600},
+}
+# xp_index_*: in-memory rank indexes (rows held across all guilds, and how long a guild's index outlives its last rank lookup)
+
+# bot_config key holding the fingerprint of the last command tree uploaded to Discord (sync is skipped while it matches)
+COMMAND_TREE_FINGERPRINT_KEY = "COMMAND_TREE_FINGERPRINT"
+
+# Prometheus-format metrics served at http://METRICS_HOST:METRICS_PORT/metrics (keep it on localhost or a private network)
+METRICS_ENABLED = True
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9108
+MODERATION_TIMING_LOG = False # also print every moderation command's step timings (they are always in moderation_step_seconds)
+
+# Slow-query log: statements slower than the threshold are written to a rotating log file
+SLOW_QUERY_THRESHOLD_MS = 200
+SLOW_QUERY_LOG_FILE = "slow_queries.log"
+SLOW_QUERY_LOG_MAX_BYTES = 5 * 1024 * 1024 # rotate after 5 MB
+SLOW_QUERY_LOG_BACKUPS = 3
+SLOW_QUERY_NOTIFY_CHANNEL = False # also post a summary to the logging channel
+SLOW_QUERY_NOTIFY_INTERVAL_SECONDS = 60 # at most one channel summary per interval
+
 # 🔑 HARDCODED FALLBACK TOKEN 🔑
 HARDCODED_FALLBACK_TOKEN = "INSERT TOKEN HERE" 
 
 # Global variables initialized at the module level (outside any function)
-bot: commands.Bot
+bot: Optional[commands.Bot] = None # created in main(), so importing this module has no side effects
+bot_config_snapshot: Optional[Dict[str, str]] = None # bot_config rows, read once at startup
 tree: app_commands.CommandTree
 # Initialize with the hardcoded fallback ID so we can log connection errors immediately after on_ready
 logging_channel_id: int = HARDCODED_LOGGING_CHANNEL_ID 
@@ -56,29 +169,145 @@ def create_base_embed(title: str, description: Optional[str] = None, color: disc
         embed.set_thumbnail(url=thumbnail_url)
     return embed
 
-async def send_log_embed(title: str, description: str, color: discord.Color):
-    """Sends a log message to the configured logging channel."""
-    if hasattr(bot, 'is_ready') and bot.is_ready() and logging_channel_id:
-        channel = bot.get_channel(logging_channel_id)
-        if channel:
-            embed = create_base_embed(title, description, color=color)
+class LogDispatcher:
+    """Posts queued log embeds in the background, packing up to 10 embeds into each channel.send."""
+    MAX_EMBEDS_PER_MESSAGE = 10
+    MAX_EMBED_CHARS_PER_MESSAGE = 6000 # Discord's total embed text limit per message
+
+    def __init__(self, max_size: int, batch_delay: float, drain_timeout: float):
+        self.max_size = max_size
+        self.batch_delay = batch_delay
+        self.drain_timeout = drain_timeout
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._dropped: Dict[str, int] = {}
+        self.metrics = {'queued': 0, 'messages_sent': 0, 'embeds_sent': 0, 'dropped': 0, 'failed': 0}
+
+    def enqueue(self, embed: discord.Embed):
+        """Queues an embed for the logging channel without waiting. Drops it if the queue is full."""
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.max_size)
+        try:
+            self._queue.put_nowait(embed)
+            self.metrics['queued'] += 1
+        except asyncio.QueueFull:
+            self.metrics['dropped'] += 1
+            self._dropped[embed.title or "Untitled"] = self._dropped.get(embed.title or "Untitled", 0) + 1
+
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def stats(self) -> Dict[str, int]:
+        stats = dict(self.metrics)
+        stats['depth'] = self.depth()
+        stats['max_size'] = self.max_size
+        return stats
+
+    def _drop_summary(self) -> Optional[discord.Embed]:
+        """Builds one embed listing log entries dropped since the last summary."""
+        if not self._dropped:
+            return None
+        dropped, self._dropped = self._dropped, {}
+        lines = [f"`{count}x` {title}" for title, count in sorted(dropped.items(), key=lambda item: -item[1])]
+        return create_base_embed(
+            "⚠️ Log Messages Dropped",
+            f"The log queue was full, so **{sum(dropped.values())}** log entries were not posted:\n" + "\n".join(lines[:20]),
+            color=discord.Color.dark_red()
+        )
+
+    def _split(self, embeds: List[discord.Embed]) -> List[List[discord.Embed]]:
+        """Groups embeds into messages within Discord's per-message embed count and size limits."""
+        messages: List[List[discord.Embed]] = []
+        current: List[discord.Embed] = []
+        current_chars = 0
+        for embed in embeds:
+            size = len(embed)
+            if current and (len(current) >= self.MAX_EMBEDS_PER_MESSAGE or current_chars + size > self.MAX_EMBED_CHARS_PER_MESSAGE):
+                messages.append(current)
+                current, current_chars = [], 0
+            current.append(embed)
+            current_chars += size
+        if current:
+            messages.append(current)
+        return messages
+
+    async def _post(self, embeds: List[discord.Embed]):
+        summary = self._drop_summary()
+        if summary is not None:
+            embeds = embeds + [summary]
+        channel = bot.get_channel(logging_channel_id) if logging_channel_id else None
+        if channel is None:
+            self.metrics['failed'] += len(embeds)
+            print(f"Failed to send {len(embeds)} log(s): logging channel {logging_channel_id} not found.")
+            return
+        for group in self._split(embeds):
             try:
-                await channel.send(embed=embed)
+                await channel.send(embeds=group)
+                self.metrics['messages_sent'] += 1
+                self.metrics['embeds_sent'] += len(group)
             except Exception as e:
+                self.metrics['failed'] += len(group)
                 print(f"Failed to send log to channel {logging_channel_id} (Is ID correct and permissions set?): {e}")
 
-async def handle_db_runtime_failure(error: mysql.connector.Error):
-    """Logs the database failure to the logging channel during runtime."""
-    error_desc = f"**Error Type:** `{type(error).__name__}`\n**Message:** {error}"
-    print("CRITICAL: Database connection failed during runtime. Logging to channel.")
-    await send_log_embed(
-        title="⚠️ CRITICAL DB FAILURE",
-        description=f"Bot failed to connect to the database during a command execution. Commands requiring DB access will fail.\n\n{error_desc}",
-        color=discord.Color.red()
-    )
+    async def _next_batch(self) -> List[discord.Embed]:
+        """Waits for one embed, then collects more until the batch is full or the batch delay passes."""
+        batch = [await self._queue.get()]
+        deadline = asyncio.get_running_loop().time() + self.batch_delay
+        while len(batch) < self.MAX_EMBEDS_PER_MESSAGE:
+            remaining = deadline - asyncio.get_running_loop().time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._next_batch()
+            try:
+                await self._post(batch)
+            except Exception as e:
+                print(f"Error posting queued logs: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def start(self):
+        """Starts the background posting task."""
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.max_size)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Posts whatever is still queued (up to the drain timeout), then stops the posting task."""
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), self.drain_timeout)
+        except asyncio.TimeoutError:
+            print(f"Warning: {self.depth()} queued log(s) were not posted before shutdown.")
+        self._task.cancel()
+        self._task = None
+
+log_dispatcher = LogDispatcher(LOG_QUEUE_MAX_SIZE, LOG_BATCH_DELAY_SECONDS, LOG_DRAIN_TIMEOUT_SECONDS)
+
+async def send_log_embed(title: str, description: str, color: discord.Color):
+    """Queues a log message for the configured logging channel and returns immediately."""
+    if hasattr(bot, 'is_ready') and bot.is_ready() and logging_channel_id:
+        log_dispatcher.enqueue(create_base_embed(title, description, color=color))
 
-async def send_moderation_dm(member: Union[discord.Member, discord.User, discord.Object], action: str, guild_name: str, reason: str, duration: Optional[str] = None):
-    """Sends a DM to the target user about the moderation action."""
+async def handle_db_runtime_failure(error: Exception):
+    """Reports a runtime database error to the circuit breaker, which posts one notice per outage."""
+    if is_db_outage_error(error):
+        await db_breaker.record_failure(error)
+    else:
+        await db_breaker.record_success()  # the server answered; only this statement failed
+
+async def send_moderation_dm(member: Union[discord.Member, discord.User, discord.Object], action: str, guild_name: str, reason: str, duration: Optional[str] = None) -> bool:
+    """Sends a DM to the target user about the moderation action. Returns True if it was delivered."""
     try:
         if isinstance(member, discord.Object):
             user = await bot.fetch_user(member.id)
@@ -95,113 +324,640 @@ async def send_moderation_dm(member: Union[discord.Member, discord.User, discord
         embed.add_field(name="Reason", value=reason, inline=False)
         embed.set_footer(text="If you believe this action was taken in error, contact a staff member.")
         await user.send(embed=embed)
+        return True
     except discord.Forbidden:
         print(f"Could not DM user {member.id} about {action}.")
     except Exception as e:
         print(f"Error sending DM for {action} to {member.id}: {e}")
+    return False
+
+async def send_ban_appeal_dm(user: discord.User, guild_name: str, reason: str) -> bool:
+    """DMs a banned user the appeal form. Returns True if it was delivered."""
+    appeal_view = BanAppealDMView(guild_name=guild_name)
+    appeal_embed = create_base_embed(
+        f"🚫 You Have Been Banned from {guild_name}",
+        f"**Reason:** {reason}\n\nIf you believe this was in error, click the button below to submit a formal ban appeal to the staff team.",
+        color=discord.Color.red()
+    )
+    try:
+        await user.send(embed=appeal_embed, view=appeal_view)
+        return True
+    except discord.Forbidden:
+        return False
+    except Exception as e:
+        print(f"Error sending ban appeal DM to {user.id}: {e}")
+        return False
+
+# --- Metrics (Latency Histograms, Counters, Prometheus Endpoint) ---
+
+class LatencyHistogram:
+    """Cumulative-bucket latency histogram (seconds), as used by Prometheus."""
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BUCKETS) + 1)  # last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds: float):
+        self.counts[bisect.bisect_left(self.BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def quantile(self, q: float) -> float:
+        """Estimates a quantile by linear interpolation inside the bucket that contains it."""
+        if self.count == 0:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for i, bucket_count in enumerate(self.counts):
+            if seen + bucket_count >= target and bucket_count:
+                low = self.BUCKETS[i - 1] if i > 0 else 0.0
+                high = self.BUCKETS[i] if i < len(self.BUCKETS) else self.BUCKETS[-1]
+                return low + (high - low) * (target - seen) / bucket_count
+            seen += bucket_count
+        return self.BUCKETS[-1]
+
+class MetricsRegistry:
+    """Thread-safe store of labelled histograms and counters, rendered in the Prometheus text format."""
+    PREFIX = "burgentruck_"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms: Dict[str, Dict[Tuple[Tuple[str, str], ...], LatencyHistogram]] = {}
+        self._counters: Dict[str, Dict[Tuple[Tuple[str, str], ...], float]] = {}
+        self._help: Dict[str, str] = {}
+        self._collectors: List[Tuple[str, str, str, Callable[[], Dict[Tuple[Tuple[str, str], ...], float]]]] = []
+
+    def describe(self, name: str, help_text: str):
+        self._help[name] = help_text
+
+    def observe(self, name: str, seconds: float, **labels):
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = LatencyHistogram()
+            histogram.observe(seconds)
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def register_collector(self, name: str, metric_type: str, help_text: str, collect: Callable[[], Dict[Tuple[Tuple[str, str], ...], float]]):
+        """Adds a gauge/counter whose values are read from existing stats at scrape time."""
+        self._collectors.append((name, metric_type, help_text, collect))
+
+    def histograms(self, name: str) -> Dict[Tuple[Tuple[str, str], ...], LatencyHistogram]:
+        with self._lock:
+            return dict(self._histograms.get(name, {}))
+
+    def counters(self, name: str) -> Dict[Tuple[Tuple[str, str], ...], float]:
+        with self._lock:
+            return dict(self._counters.get(name, {}))
+
+    @staticmethod
+    def _labels(key, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+        pairs = key + extra
+        if not pairs:
+            return ""
+        escaped = (f'{k}="{v.replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"' for k, v in pairs)
+        return "{" + ",".join(escaped) + "}"
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            for name, series in self._histograms.items():
+                full = self.PREFIX + name
+                lines.append(f"# HELP {full} {self._help.get(name, name)}")
+                lines.append(f"# TYPE {full} histogram")
+                for key, histogram in series.items():
+                    cumulative = 0
+                    for bound, bucket_count in zip(list(LatencyHistogram.BUCKETS) + ["+Inf"], histogram.counts):
+                        cumulative += bucket_count
+                        lines.append(f"{full}_bucket{self._labels(key, (('le', str(bound)),))} {cumulative}")
+                    lines.append(f"{full}_sum{self._labels(key)} {histogram.sum}")
+                    lines.append(f"{full}_count{self._labels(key)} {histogram.count}")
+            for name, series in self._counters.items():
+                full = self.PREFIX + name + "_total"
+                lines.append(f"# HELP {full} {self._help.get(name, name)}")
+                lines.append(f"# TYPE {full} counter")
+                for key, value in series.items():
+                    lines.append(f"{full}{self._labels(key)} {value}")
+        for name, metric_type, help_text, collect in self._collectors:
+            try:
+                values = collect()
+            except Exception as e:
+                print(f"Metrics collector {name} failed: {e}")
+                continue
+            full = self.PREFIX + name
+            lines.append(f"# HELP {full} {help_text}")
+            lines.append(f"# TYPE {full} {metric_type}")
+            for key, value in values.items():
+                lines.append(f"{full}{self._labels(key)} {value}")
+        return "\n".join(lines) + "\n"
+
+metrics = MetricsRegistry()
+metrics.describe("command_latency_seconds", "Time from interaction creation to app command completion.")
+metrics.describe("on_message_seconds", "End-to-end on_message handling time.")
+metrics.describe("db_helper_seconds", "Time spent in an async_* database helper, including cache hits.")
+metrics.describe("db_query_seconds", "Time a database call spent executing (after it left the executor queue), by calling helper.")
+metrics.describe("db_executor_wait_seconds", "Time a database call waited in the DB executor queue.")
+metrics.describe("discord_rest_seconds", "Discord REST call latency, including library rate-limit waits.")
+metrics.describe("db_calls", "Database calls by helper and outcome.")
+metrics.describe("db_statement_seconds", "Execution time of one SQL statement (execute + fetch), by calling helper.")
+metrics.describe("db_acquire_seconds", "Time spent checking out a database connection, by calling helper.")
+metrics.describe("db_rows", "Rows returned (reads) or affected (writes), by calling helper.")
+metrics.describe("db_slow_statements", "Statements slower than SLOW_QUERY_THRESHOLD_MS, by calling helper.")
+metrics.describe("db_statement_errors", "Statements that raised (lock wait timeouts, deadlocks, lost connections), by calling helper.")
+metrics.describe("moderation_step_seconds", "Duration of one step of a moderation command (since the previous step), by command and step.")
+
+# Name of the async_* helper the current task is running, so lower layers can label their metrics
+current_db_helper: contextvars.ContextVar = contextvars.ContextVar("current_db_helper", default="other")
+
+def db_helper(func):
+    """Marks an async database helper: times it and labels the DB calls it makes."""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        token = current_db_helper.set(func.__name__)
+        start = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            metrics.observe("db_helper_seconds", time.perf_counter() - start, helper=func.__name__)
+            current_db_helper.reset(token)
+    return wrapper
+
+def record_command_latency(interaction: discord.Interaction, status: str):
+    command = interaction.command
+    name = command.qualified_name if command is not None else "unknown"
+    metrics.observe("command_latency_seconds", (discord.utils.utcnow() - interaction.created_at).total_seconds(), command=name, status=status)
+
+def instrument_http_client(http):
+    """Wraps the library's HTTP client so every REST call is timed by method, route template and status."""
+    original_request = http.request
+    async def timed_request(route, **kwargs):
+        start = time.perf_counter()
+        status = "ok"
+        try:
+            return await original_request(route, **kwargs)
+        except discord.HTTPException as e:
+            status = str(e.status)
+            raise
+        except Exception:
+            status = "error"
+            raise
+        finally:
+            metrics.observe("discord_rest_seconds", time.perf_counter() - start, method=route.method, route=route.path, status=status)
+    http.request = timed_request
+
+class MetricsServer:
+    """Serves metrics.render() at /metrics from a small aiohttp listener."""
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self._runner: Optional[web.AppRunner] = None
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        return web.Response(text=metrics.render(), content_type="text/plain", charset="utf-8", headers={"X-Content-Type-Options": "nosniff"})
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        try:
+            await web.TCPSite(self._runner, self.host, self.port).start()
+            print(f"Metrics available at http://{self.host}:{self.port}/metrics")
+        except OSError as e:
+            print(f"Warning: could not start metrics listener on {self.host}:{self.port}: {e}")
+            await self.stop()
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+metrics_server = MetricsServer(METRICS_HOST, METRICS_PORT)
+
+# Load gauges read from the components' own stats at scrape time
+metrics.register_collector("db_pool_connections", "gauge", "Pooled MySQL connections by state.",
+    lambda: {} if db_pool is None else {(("state", "in_use"),): db_pool.stats()["in_use"], (("state", "idle"),): db_pool.stats()["idle"]})
+metrics.register_collector("db_executor_calls", "gauge", "Database calls on the DB executor by state.",
+    lambda: {(("state", "running"),): db_executor.in_flight, (("state", "queued"),): db_executor.queued})
+metrics.register_collector("db_sqlite_write_queue", "gauge", "Write transactions waiting for the SQLite writer thread.",
+    lambda: {(): db_driver.stats()["write_queue"]} if isinstance(db_driver, SQLiteDriver) else {})
+metrics.register_collector("log_queue_depth", "gauge", "Log embeds waiting to be posted.", lambda: {(): log_dispatcher.depth()})
+metrics.register_collector("db_breaker_open", "gauge", "1 while the database circuit breaker is open or half-open.", lambda: {(): int(db_breaker.is_open())})
+metrics.register_collector("db_breaker_transitions_total", "counter", "Database circuit breaker state transitions.",
+    lambda: {(("to", state),): db_breaker.metrics[key] for state, key in (("open", "opened"), ("half_open", "half_opened"), ("closed", "closed"))})
+
+# --- Slow Query Log & Statement Timing ---
+
+_slow_query_logger: Optional[logging.Logger] = None
+_slow_query_notice = {"last_sent": 0.0, "suppressed": 0}
+_slow_query_lock = threading.Lock()
+
+def sql_shape(query: str) -> str:
+    """Collapses whitespace and multi-row VALUES lists so one statement shape is logged the same way every time."""
+    shape = " ".join(query.split())
+    return re.sub(r"(\((?:%s, )*%s\))(?:, \((?:%s, )*%s\))+", r"\1, ...", shape)
+
+def get_slow_query_logger() -> logging.Logger:
+    """Returns the slow-query logger, opening the rotating log file on first use."""
+    global _slow_query_logger
+    with _slow_query_lock:
+        if _slow_query_logger is None:
+            logger = logging.getLogger("burgentruck.slow_queries")
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+            handler = RotatingFileHandler(SLOW_QUERY_LOG_FILE, maxBytes=SLOW_QUERY_LOG_MAX_BYTES, backupCount=SLOW_QUERY_LOG_BACKUPS, encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+            logger.addHandler(handler)
+            _slow_query_logger = logger
+        return _slow_query_logger
+
+def _notify_slow_query(helper: str, shape: str, exec_ms: float):
+    """Posts at most one slow-query summary per SLOW_QUERY_NOTIFY_INTERVAL_SECONDS. Safe to call from DB worker threads."""
+    with _slow_query_lock:
+        now = time.monotonic()
+        if now - _slow_query_notice["last_sent"] < SLOW_QUERY_NOTIFY_INTERVAL_SECONDS:
+            _slow_query_notice["suppressed"] += 1
+            return
+        suppressed, _slow_query_notice["suppressed"] = _slow_query_notice["suppressed"], 0
+        _slow_query_notice["last_sent"] = now
+    description = f"**Helper:** `{helper}`\n**Time:** `{exec_ms:.0f}ms`\n**SQL:** `{shape[:900]}`"
+    if suppressed:
+        description += f"\n`{suppressed}` more slow queries since the last notice (see `{SLOW_QUERY_LOG_FILE}`)."
+    coro = send_log_embed("🐢 Slow Database Query", description, discord.Color.dark_gold())
+    try:
+        asyncio.get_running_loop().create_task(coro)
+    except RuntimeError:  # called from a DB worker thread
+        if bot is not None and bot.loop.is_running():
+            asyncio.run_coroutine_threadsafe(coro, bot.loop)
+        else:
+            coro.close()
+
+def record_statement(stmt: "DBStatement", rows: int, acquire_seconds: float, exec_seconds: float, error: Optional[BaseException] = None):
+    """Statement timing hook: feeds per-helper metrics and writes statements over the threshold to the slow-query log.
+
+    Called for failed statements too (with the error), since lock waits and timeouts are the slow ones worth finding.
+    """
+    helper = current_db_helper.get()
+    metrics.observe("db_statement_seconds", exec_seconds, helper=helper)
+    metrics.inc("db_rows", rows, helper=helper)
+    if error is not None:
+        metrics.inc("db_statement_errors", helper=helper)
+    exec_ms = exec_seconds * 1000
+    if exec_ms < SLOW_QUERY_THRESHOLD_MS:
+        return
+    metrics.inc("db_slow_statements", helper=helper)
+    shape = sql_shape(stmt.query)
+    param_count = sum(len(row) for row in stmt.params) if stmt.fetch == "many" else len(stmt.params)
+    get_slow_query_logger().info(
+        f"helper={helper} exec_ms={exec_ms:.1f} acquire_ms={acquire_seconds * 1000:.1f} rows={rows} params={param_count} "
+        + (f"error={type(error).__name__}: {str(error)[:200]} " if error is not None else "")
+        + f"sql={shape}"
+    )
+    if SLOW_QUERY_NOTIFY_CHANNEL:
+        _notify_slow_query(helper, shape + (f" (failed: {type(error).__name__})" if error is not None else ""), exec_ms)
 
 # --- Synchronous Database Utility Functions (For Startup & Async Wrapper) ---
 
-def _get_sync_connection():
-    """Attempts to establish a synchronous connection to the MySQL database."""
-    try:
+class PooledConnection:
+    """Proxy handed out by DBConnectionPool. Calling close() returns the connection to the pool."""
+    def __init__(self, pool: "DBConnectionPool", conn):
+        self._pool = pool
+        self._conn = conn
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+    @property
+    def raw(self):
+        """The underlying mysql-connector connection."""
+        return self._conn
+    def close(self):
+        if self._conn is not None:
+            self._pool.release(self._conn)
+            self._conn = None
+
+class DBConnectionPool:
+    """A thread-safe pool of MySQL connections with validation of long-idle connections on checkout and idle recycling."""
+    def __init__(self, config: Dict[str, Any], size: int, checkout_timeout: float, idle_recycle_seconds: float, ping_idle_seconds: float):
+        self.config = config
+        self.size = size
+        self.checkout_timeout = checkout_timeout
+        self.idle_recycle_seconds = idle_recycle_seconds
+        self.ping_idle_seconds = ping_idle_seconds
+        self._idle = []  # (connection, last_used) pairs, most recently used last
+        self._open = 0  # idle + checked out + connections currently being opened
+        self._cond = threading.Condition()
+        self.metrics = {"created": 0, "checkouts": 0, "waits": 0, "exhausted": 0, "recycled": 0, "validation_failures": 0}
+
+    def _connect(self):
+        """Opens a new raw connection, retrying a few times before giving up."""
         for i in range(3):
             try:
-                conn = mysql.connector.connect(**DB_CONFIG)
+                conn = mysql.connector.connect(**self.config)
+                with self._cond:
+                    self.metrics["created"] += 1
                 return conn
             except mysql.connector.Error as err:
                 if i < 2:
                     time.sleep(1)
                     continue
                 raise err
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def acquire(self) -> PooledConnection:
+        """Borrows a connection, waiting up to checkout_timeout seconds if every connection is in use."""
+        deadline = time.monotonic() + self.checkout_timeout
+        with self._cond:
+            waited = False
+            while not self._idle and self._open >= self.size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.metrics["exhausted"] += 1
+                    print(f"WARNING: DB connection pool exhausted ({self.size} connections in use, {self.metrics['exhausted']} exhausted checkouts so far).")
+                    raise mysql.connector.errors.PoolError(f"Connection pool exhausted after waiting {self.checkout_timeout}s.")
+                waited = True
+                self._cond.wait(remaining)
+            if waited:
+                self.metrics["waits"] += 1
+            self.metrics["checkouts"] += 1
+            if self._idle:
+                conn, last_used = self._idle.pop()
+            else:
+                conn, last_used = None, 0.0
+                self._open += 1  # reserve the slot before connecting outside the lock
+        try:
+            if conn is not None and time.monotonic() - last_used > self.idle_recycle_seconds:
+                self._close_quietly(conn)
+                conn = None
+                with self._cond:
+                    self.metrics["recycled"] += 1
+            # A recently released connection passed is_connected() in release(); if it dropped since, the statement
+            # fails with a connection error and async_db_runner retries on a fresh checkout
+            if conn is not None and time.monotonic() - last_used > self.ping_idle_seconds:
+                try:
+                    conn.ping(reconnect=True, attempts=1, delay=0)
+                except mysql.connector.Error:
+                    self._close_quietly(conn)
+                    conn = None
+                    with self._cond:
+                        self.metrics["validation_failures"] += 1
+            if conn is None:
+                conn = self._connect()
+        except BaseException:
+            with self._cond:
+                self._open -= 1
+                self._cond.notify()
+            raise
+        return PooledConnection(self, conn)
+
+    def release(self, conn):
+        """Returns a connection to the pool, discarding it if it is no longer usable."""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            usable = conn.is_connected()
+        except Exception:
+            usable = False
+        with self._cond:
+            if usable:
+                self._idle.append((conn, time.monotonic()))
+            else:
+                self._open -= 1
+            self._cond.notify()
+        if not usable:
+            self._close_quietly(conn)
+
+    def close_all(self):
+        """Closes every idle connection. Checked-out connections are closed when they are released."""
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._open -= len(idle)
+        for conn, _ in idle:
+            self._close_quietly(conn)
+
+    def stats(self) -> Dict[str, int]:
+        """Returns a snapshot of pool usage and exhaustion counters."""
+        with self._cond:
+            return {"size": self.size, "open": self._open, "idle": len(self._idle), "in_use": self._open - len(self._idle), **self.metrics}
+
+db_pool: Optional[DBConnectionPool] = None
+_db_pool_lock = threading.Lock()
+
+def _get_db_pool() -> DBConnectionPool:
+    """Returns the shared connection pool, creating it on first use."""
+    global db_pool
+    with _db_pool_lock:
+        if db_pool is None:
+            db_pool = DBConnectionPool(DB_CONFIG, DB_POOL_SIZE, DB_POOL_CHECKOUT_TIMEOUT, DB_POOL_IDLE_RECYCLE_SECONDS, DB_POOL_PING_IDLE_SECONDS)
+        return db_pool
+
+def _get_sync_connection():
+    """Borrows a validated connection from the shared pool. Call close() on it to return it."""
+    try:
+        return _get_db_pool().acquire()
     except mysql.connector.Error as err:
         print(f"Database connection error (Sync): {err}")
         return None
 
+def _ensure_index(cursor, table: str, index_name: str, columns: str):
+    """Adds an index to an existing table if it is missing (MySQL has no CREATE INDEX IF NOT EXISTS)."""
+    cursor.execute("SELECT COUNT(*) FROM information_schema.statistics WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s", (table, index_name))
+    if cursor.fetchone()[0] == 0:
+        cursor.execute(f"ALTER TABLE {table} ADD INDEX {index_name} ({columns})")
+        print(f"Added index {index_name} on {table} ({columns}).")
+
+def _ensure_column(cursor, table: str, column: str, definition: str):
+    """Adds a column to an existing table if it is missing."""
+    cursor.execute("SELECT COUNT(*) FROM information_schema.columns WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s", (table, column))
+    if cursor.fetchone()[0] == 0:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN `{column}` {definition}")
+        print(f"Added column {column} to {table}.")
+
+def _migration_base_tables(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS bot_config (
+            name VARCHAR(255) PRIMARY KEY,
+            value TEXT
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS case_logs (
+            `id` INT AUTO_INCREMENT PRIMARY KEY,
+            `guild_id` BIGINT DEFAULT NULL,
+            `user_id` BIGINT NOT NULL,
+            `moderator_id` BIGINT NOT NULL,
+            `action` VARCHAR(50) NOT NULL,
+            `reason` TEXT,
+            `duration` VARCHAR(50) DEFAULT NULL,
+            `timestamp` TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS user_levels (
+            guild_id BIGINT NOT NULL,
+            user_id BIGINT NOT NULL,
+            xp INT DEFAULT 0,
+            level INT DEFAULT 0,
+            message_count INT DEFAULT 0,
+            last_xp_gain TIMESTAMP NULL,
+            PRIMARY KEY (guild_id, user_id)
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS level_config (
+            guild_id BIGINT PRIMARY KEY,
+            xp_min INT DEFAULT 1,
+            xp_max INT DEFAULT 10,
+            xp_multiplier INT DEFAULT 100,
+            xp_cooldown_seconds INT DEFAULT 60,
+            level_up_channel_id BIGINT,
+            top_message_role_id BIGINT,
+            current_top_user_id BIGINT
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS level_roles (
+            guild_id BIGINT NOT NULL,
+            level INT NOT NULL,
+            role_id BIGINT NOT NULL,
+            PRIMARY KEY (guild_id, level)
+        )
+    """)
+
+def _migration_case_log_guild_scope(cursor):
+    _ensure_column(cursor, "case_logs", "guild_id", "BIGINT DEFAULT NULL AFTER `id`")
+    _ensure_index(cursor, "case_logs", "idx_case_logs_guild_user_id", "guild_id, user_id, id")
+
+def _migration_user_level_indexes(cursor):
+    _ensure_index(cursor, "user_levels", "idx_user_levels_guild_xp", "guild_id, xp")
+    _ensure_index(cursor, "user_levels", "idx_user_levels_guild_messages", "guild_id, message_count")
+
+# Ordered schema migrations: (version, description, function). Append new ones; never renumber or edit applied ones.
+# Every migration is idempotent, so databases created before schema_version existed start at version 0 and replay them safely.
+SCHEMA_MIGRATIONS: List[Tuple[int, str, Callable]] = [
+    (1, "base tables", _migration_base_tables),
+    (2, "guild-scoped case logs", _migration_case_log_guild_scope),
+    (3, "user_levels rank and top sender indexes", _migration_user_level_indexes),
+]
+
+def get_schema_version(cursor) -> int:
+    """Returns the highest applied migration version, or 0 if schema_version does not exist yet."""
+    try:
+        cursor.execute("SELECT MAX(version) FROM schema_version")
+    except mysql.connector.errors.ProgrammingError as err:
+        if err.errno == errorcode.ER_NO_SUCH_TABLE:
+            return 0
+        raise
+    row = cursor.fetchone()
+    return (row[0] or 0) if row else 0
+
+def apply_schema_migrations(conn) -> int:
+    """Runs every migration newer than the recorded schema version. Issues no DDL when the schema is current."""
+    cursor = conn.cursor(buffered=True)
+    try:
+        version = get_schema_version(cursor)
+        pending = [migration for migration in SCHEMA_MIGRATIONS if migration[0] > version]
+        if not pending:
+            print(f"Database schema is current (version {version}).")
+            return version
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INT PRIMARY KEY,
+                description VARCHAR(255) NOT NULL,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        for number, description, migrate in pending:
+            migrate(cursor)
+            cursor.execute("INSERT INTO schema_version (version, description) VALUES (%s, %s)", (number, description))
+            conn.commit()
+            version = number
+            print(f"Applied schema migration {number}: {description}.")
+        return version
+    finally:
+        cursor.close()
+
 def setup_database_schema():
-    """Creates all necessary tables if they do not exist (Synchronous)."""
+    """Brings the database schema up to the latest migration (Synchronous)."""
+    if DB_DRIVER == "sqlite":
+        try:
+            _get_db_driver().migrate()
+        except sqlite3.Error as err:
+            print(f"Error setting up database schema: {err}")
+        return
     conn = None
     try:
         conn = _get_sync_connection()
         if not conn: return
-        cursor = conn.cursor()
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS bot_config (
-                name VARCHAR(255) PRIMARY KEY,
-                value TEXT
-            )
-        """)
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS case_logs (
-                `id` INT AUTO_INCREMENT PRIMARY KEY,
-                `user_id` BIGINT NOT NULL,
-                `moderator_id` BIGINT NOT NULL,
-                `action` VARCHAR(50) NOT NULL,
-                `reason` TEXT,
-                `duration` VARCHAR(50) DEFAULT NULL,
-                `timestamp` TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS user_levels (
-                guild_id BIGINT NOT NULL,
-                user_id BIGINT NOT NULL,
-                xp INT DEFAULT 0,
-                level INT DEFAULT 0,
-                message_count INT DEFAULT 0,
-                last_xp_gain TIMESTAMP NULL,
-                PRIMARY KEY (guild_id, user_id)
-            )
-        """)
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS level_config (
-                guild_id BIGINT PRIMARY KEY,
-                xp_min INT DEFAULT 1,
-                xp_max INT DEFAULT 10,
-                xp_multiplier INT DEFAULT 100,
-                xp_cooldown_seconds INT DEFAULT 60,
-                level_up_channel_id BIGINT,
-                top_message_role_id BIGINT,
-                current_top_user_id BIGINT
-            )
-        """)
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS level_roles (
-                guild_id BIGINT NOT NULL,
-                level INT NOT NULL,
-                role_id BIGINT NOT NULL,
-                PRIMARY KEY (guild_id, level)
-            )
-        """)
-        conn.commit()
-        print("Database schema verified and/or created successfully (Existing data preserved).")
+        apply_schema_migrations(conn)
     except mysql.connector.Error as err:
         print(f"Error setting up database schema: {err}")
     finally:
         if conn: 
             conn.close()
 
-def fetch_bot_config() -> Dict[str, str]:
-    """Fetches all key-value pairs from the bot_config table (Synchronous)."""
+def load_startup_state() -> Optional[Dict[str, str]]:
+    """Migrates the schema and reads bot_config on one connection (Synchronous). Returns None if the database is unavailable."""
+    if DB_DRIVER == "sqlite":
+        try:
+            _get_db_driver().migrate()
+            return _get_db_driver().read_bot_config()
+        except sqlite3.Error as err:
+            print(f"Error preparing database at startup: {err}")
+            return None
     conn = None
     try:
         conn = _get_sync_connection()
-        if not conn: return {}
+        if not conn: return None
+        apply_schema_migrations(conn)
         cursor = conn.cursor(dictionary=True)
         cursor.execute("SELECT name, value FROM bot_config")
         config = {row['name']: row['value'] for row in cursor.fetchall()}
         cursor.close()
         return config
     except mysql.connector.Error as err:
-        print(f"Error fetching initial bot config: {err}")
-        return {}
+        print(f"Error preparing database at startup: {err}")
+        return None
+    finally:
+        if conn:
+            conn.close()
+
+def fetch_bot_config() -> Dict[str, str]:
+    """Fetches all key-value pairs from the bot_config table (Synchronous). Database errors propagate so callers (and the circuit breaker) see them."""
+    if DB_DRIVER == "sqlite":
+        return _get_db_driver().read_bot_config()
+    conn = _get_db_pool().acquire()
+    try:
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute("SELECT name, value FROM bot_config")
+        config = {row['name']: row['value'] for row in cursor.fetchall()}
+        cursor.close()
+        return config
     finally:
-        if conn: conn.close()
+        conn.close()
 
-def fetch_bot_token() -> str:
-    """Fetches the BOT_TOKEN from the DB, environment, or uses the hardcoded fallback."""
+def fetch_bot_token(config: Optional[Dict[str, str]] = None) -> str:
+    """Fetches the BOT_TOKEN from the DB (or a config snapshot), environment, or uses the hardcoded fallback."""
     env_token = os.getenv("DISCORD_BOT_TOKEN")
-    config = fetch_bot_config()
+    if config is None:
+        try:
+            config = fetch_bot_config()
+        except (mysql.connector.Error, sqlite3.Error) as err:
+            print(f"Error fetching initial bot config: {err}")
+            config = {}
     db_token = config.get("BOT_TOKEN")
     token = db_token or env_token or HARDCODED_FALLBACK_TOKEN
     if not db_token:
@@ -210,11 +966,196 @@ def fetch_bot_token() -> str:
 
 # --- Asynchronous Database Execution Wrapper (For Runtime Operations) ---
 
-async def async_db_runner(func, *args, **kwargs):
-    """Executes a blocking database operation in a separate thread and handles connection errors."""
+# Client/server error codes that mean the database is unreachable rather than that one statement failed
+DB_OUTAGE_ERROR_CODES = {1040, 2002, 2003, 2005, 2006, 2013, 2055}
+
+def is_db_outage_error(error: Exception) -> bool:
+    """True for connection-level errors (server down, connection lost, too many connections)."""
+    if isinstance(error, mysql.connector.errors.InterfaceError):
+        return True
+    code = getattr(error, "errno", None)
+    if code is None and error.args and isinstance(error.args[0], int):
+        code = error.args[0]  # aiomysql/PyMySQL errors carry the code as the first argument
+    return code in DB_OUTAGE_ERROR_CODES
+
+class DBCircuitBreaker:
+    """Closed -> open after repeated connection failures, open -> half-open after a cool-down, half-open -> closed once a probe succeeds."""
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probe_started: Optional[float] = None
+        self._outage_started: Optional[float] = None
+        self._outage_rejected = 0
+        self.metrics = {"failures": 0, "rejected": 0, "busy": 0, "opened": 0, "half_opened": 0, "closed": 0}
+
+    def is_open(self) -> bool:
+        """True while the database is considered down (open or probing)."""
+        return self.state != self.CLOSED
+
+    def allow_request(self) -> bool:
+        """Returns False if the call should fail fast. In half-open state only one probe call is let through at a time."""
+        now = time.monotonic()
+        if self.state == self.OPEN and now - self._opened_at >= self.reset_timeout:
+            self._transition(self.HALF_OPEN)
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.HALF_OPEN and (self._probe_started is None or now - self._probe_started > self.reset_timeout):
+            self._probe_started = now  # a probe that never reports back is replaced after reset_timeout
+            return True
+        self.metrics["rejected"] += 1
+        self._outage_rejected += 1
+        return False
+
+    def _transition(self, state: str):
+        print(f"DB circuit breaker: {self.state} -> {state}")
+        self.state = state
+        self.metrics[{self.OPEN: "opened", self.HALF_OPEN: "half_opened", self.CLOSED: "closed"}[state]] += 1
+        if state == self.OPEN:
+            self._opened_at = time.monotonic()
+        self._probe_started = None
+
+    async def record_success(self):
+        self.consecutive_failures = 0
+        if self.state == self.CLOSED:
+            return
+        outage_seconds = time.monotonic() - (self._outage_started or time.monotonic())
+        rejected, self._outage_rejected, self._outage_started = self._outage_rejected, 0, None
+        self._transition(self.CLOSED)
+        await send_log_embed(
+            "✅ Database Recovered",
+            f"The database is reachable again after **{outage_seconds:.0f}s**. `{rejected}` calls were rejected while it was down.",
+            discord.Color.green()
+        )
+
+    def record_busy(self):
+        """A call that never reached the server because the connection pool was exhausted: backpressure, neither a success
+        nor an outage. A half-open probe that got no connection frees its slot so the next call probes instead."""
+        self.metrics["busy"] += 1
+        if self.state == self.HALF_OPEN:
+            self._probe_started = None
+
+    async def record_failure(self, error: Exception):
+        self.metrics["failures"] += 1
+        self.consecutive_failures += 1
+        if self.state == self.HALF_OPEN:
+            self._transition(self.OPEN)  # probe failed: still the same outage, no new notice
+            return
+        if self.state == self.CLOSED and self.consecutive_failures >= self.failure_threshold:
+            self._outage_started = time.monotonic()
+            self._transition(self.OPEN)
+            print("CRITICAL: Database connection failed during runtime. Logging to channel.")
+            await send_log_embed(
+                "⚠️ CRITICAL DB FAILURE",
+                f"The database failed {self.consecutive_failures} times in a row. Database calls now fail fast and cached data is served "
+                f"where available; a reconnect is tried every {self.reset_timeout:.0f}s. A notice will follow when it recovers.\n\n"
+                f"**Error Type:** `{type(error).__name__}`\n**Message:** {error}",
+                discord.Color.red()
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        return {"state": self.state, "consecutive_failures": self.consecutive_failures, **self.metrics}
+
+db_breaker = DBCircuitBreaker(DB_BREAKER_FAILURE_THRESHOLD, DB_BREAKER_RESET_SECONDS)
+
+class DBExecutorBusy(Exception):
+    """Raised when a low-priority database call is shed because the DB executor is saturated."""
+
+class DBExecutor:
+    """A dedicated thread pool for blocking database calls with a bounded queue and usage metrics."""
+    def __init__(self, workers: int, max_queue: int, low_priority_limit: int):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.low_priority_limit = low_priority_limit
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._lock = threading.Lock()
+        self.queued = 0  # submitted but not yet picked up by a worker
+        self.in_flight = 0  # running on a worker
+        self._wait_samples = deque(maxlen=1000)  # seconds between submit and start, most recent calls
+        self.metrics = {"submitted": 0, "completed": 0, "shed": 0, "backpressure_waits": 0}
+
+    def saturated(self) -> bool:
+        """True when enough calls are waiting that low-priority work should be deferred."""
+        return self.queued >= self.low_priority_limit
+
+    async def submit(self, func, low_priority: bool = False):
+        """Runs func on a DB worker thread. Waits for a slot when the queue is full; sheds low-priority calls when saturated."""
+        if low_priority and self.saturated():
+            self.metrics["shed"] += 1
+            raise DBExecutorBusy(f"{self.queued} database calls are already queued.")
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="db")
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_queue)
+        if self._slots.locked():
+            self.metrics["backpressure_waits"] += 1
+        async with self._slots:
+            submitted = time.perf_counter()
+            started = False
+            with self._lock:
+                self.queued += 1
+                self.metrics["submitted"] += 1
+            def run():
+                nonlocal started
+                waited = time.perf_counter() - submitted
+                with self._lock:
+                    started = True
+                    self.queued -= 1
+                    self.in_flight += 1
+                    self._wait_samples.append(waited)
+                metrics.observe("db_executor_wait_seconds", waited)
+                try:
+                    return func()
+                finally:
+                    with self._lock:
+                        self.in_flight -= 1
+                        self.metrics["completed"] += 1
+            try:
+                context = contextvars.copy_context()  # keeps current_db_helper visible in the worker thread
+                return await asyncio.get_running_loop().run_in_executor(self._executor, context.run, run)
+            finally:
+                with self._lock:
+                    if not started:  # cancelled before a worker picked it up
+                        self.queued -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            waits = sorted(self._wait_samples)
+            stats = {"workers": self.workers, "in_flight": self.in_flight, "queued": self.queued, "max_queue": self.max_queue, **self.metrics}
+        stats["wait_p50_ms"] = waits[len(waits) // 2] * 1000 if waits else 0.0
+        stats["wait_p99_ms"] = waits[min(len(waits) - 1, int(len(waits) * 0.99))] * 1000 if waits else 0.0
+        stats["wait_max_ms"] = waits[-1] * 1000 if waits else 0.0
+        return stats
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+db_executor = DBExecutor(DB_EXECUTOR_THREADS, DB_EXECUTOR_MAX_QUEUE, DB_EXECUTOR_LOW_PRIORITY_LIMIT)
+
+async def async_db_runner(func, *args, low_priority: bool = False, **kwargs):
+    """Executes a blocking database operation on the DB executor and handles connection errors. low_priority calls may be shed (returns None)."""
+    if not db_breaker.allow_request():
+        metrics.inc("db_calls", helper=current_db_helper.get(), outcome="rejected")
+        return None
     max_retries = 3
     retry_delay = 1
+    helper = current_db_helper.get()
     def _execute_sync_op():
+        start = time.perf_counter()
+        try:
+            return _retrying_op()
+        finally:
+            metrics.observe("db_query_seconds", time.perf_counter() - start, helper=helper)
+    def _retrying_op():
         last_error = None
         current_retry_delay = retry_delay
         for attempt in range(max_retries):
@@ -222,7 +1163,7 @@ async def async_db_runner(func, *args, **kwargs):
                 return func(*args, **kwargs)
             except mysql.connector.errors.OperationalError as err:
                 last_error = err
-                if 'connection' in str(err).lower():
+                if 'connection' in str(err).lower() and attempt + 1 < max_retries and not db_breaker.is_open():
                     print(f"DB OperationalError (Attempt {attempt+1}/{max_retries}): {err}. Retrying in {current_retry_delay}s.")
                     time.sleep(current_retry_delay)
                     current_retry_delay *= 2
@@ -234,203 +1175,1394 @@ async def async_db_runner(func, *args, **kwargs):
         if last_error:
             raise last_error
     try:
-        return await asyncio.to_thread(_execute_sync_op)
+        result = await db_executor.submit(_execute_sync_op, low_priority=low_priority)
+    except DBExecutorBusy:
+        metrics.inc("db_calls", helper=helper, outcome="shed")
+        return None
+    except mysql.connector.errors.PoolError:
+        metrics.inc("db_calls", helper=helper, outcome="busy")  # acquire() already logged the exhaustion
+        db_breaker.record_busy()
+        return None
     except mysql.connector.Error as err:
         print(f"CRITICAL DB ERROR during runtime op: {err}")
-        if hasattr(bot, 'is_ready') and bot.is_ready():
-            await handle_db_runtime_failure(err)
+        metrics.inc("db_calls", helper=helper, outcome="error")
+        await handle_db_runtime_failure(err)
         return None
     except Exception as e:
         print(f"Non-MySQL error during DB op: {e}")
+        metrics.inc("db_calls", helper=helper, outcome="error")
         return None
+    metrics.inc("db_calls", helper=helper, outcome="ok")
+    await db_breaker.record_success()
+    return result
+
+# --- Database Drivers (Thread Offload, Native Asyncio or Embedded SQLite) ---
+
+class DBStatement(NamedTuple):
+    """A single SQL statement plus how its result should be returned."""
+    query: str
+    params: Union[tuple, list] = ()
+    fetch: Optional[str] = None  # None (row count), "one", "all", "lastrowid" or "many" (executemany over params)
+    dictionary: bool = False
+
+# SQLite text of every statement that does not run there as written (apart from %s placeholders), keyed by the MySQL
+# text. Statements are registered where they are declared; sqlite_query refuses any other MySQL-only statement.
+SQLITE_STATEMENTS: Dict[str, str] = {}
+
+def sqlite_variant(query: str, sqlite: str) -> str:
+    """Registers the SQLite text of a MySQL statement in SQLITE_STATEMENTS and returns the MySQL text."""
+    SQLITE_STATEMENTS[query] = sqlite
+    return query
+
+# Hot statements, kept as constants so the prepared statement registry can recognise them
+SQL_SELECT_USER_LEVEL = "SELECT xp, level, message_count, last_xp_gain FROM user_levels WHERE guild_id = %s AND user_id = %s"
+SQL_INSERT_USER_LEVEL = sqlite_variant(
+    "INSERT IGNORE INTO user_levels (guild_id, user_id) VALUES (%s, %s)",
+    "INSERT OR IGNORE INTO user_levels (guild_id, user_id) VALUES (?, ?)"
+)
+# One fixed shape for every partial update: NULL keeps the current value
+SQL_UPDATE_USER_LEVEL = (
+    "UPDATE user_levels SET xp = COALESCE(%s, xp), level = COALESCE(%s, level), "
+    "message_count = COALESCE(%s, message_count), last_xp_gain = COALESCE(%s, last_xp_gain) "
+    "WHERE guild_id = %s AND user_id = %s"
+)
+# Touches the row only outside the cooldown, so the affected-row count says what happened: 1 insert, 2 update, 0 cooldown.
+# MySQL evaluates ON DUPLICATE KEY UPDATE assignments left to right, so its level expression sees the new xp; SQLite's
+# DO UPDATE sees the old row, so it adds the gain explicitly, and its cooldown is a DO UPDATE ... WHERE, which reports
+# 0 rows when it skips (numbered parameters keep MySQL's parameter order).
+SQL_APPLY_MESSAGE_XP = sqlite_variant(
+    "INSERT INTO user_levels (guild_id, user_id, xp, level, message_count, last_xp_gain) VALUES (%s, %s, %s, %s, 1, %s) "
+    "ON DUPLICATE KEY UPDATE xp = IF((last_xp_gain IS NULL OR last_xp_gain <= %s), xp + VALUES(xp), xp), "
+    # closed form of LevelingEngine's thresholds
+    "level = IF((last_xp_gain IS NULL OR last_xp_gain <= %s), IF(%s = 0, 0, FLOOR((SQRT(1 + 8 * xp / %s) - 1) / 2)), level), "
+    "message_count = IF((last_xp_gain IS NULL OR last_xp_gain <= %s), message_count + 1, message_count), "
+    "last_xp_gain = IF((last_xp_gain IS NULL OR last_xp_gain <= %s), VALUES(last_xp_gain), last_xp_gain)",
+    "INSERT INTO user_levels (guild_id, user_id, xp, level, message_count, last_xp_gain) VALUES (?1, ?2, ?3, ?4, 1, ?5) "
+    "ON CONFLICT (guild_id, user_id) DO UPDATE SET xp = xp + excluded.xp, "
+    "level = IIF(?8 = 0, 0, FLOOR((SQRT(1 + 8.0 * (xp + excluded.xp) / ?9) - 1) / 2)), "
+    "message_count = message_count + 1, last_xp_gain = excluded.last_xp_gain "
+    "WHERE last_xp_gain IS NULL OR last_xp_gain <= ?11"
+)
+SQL_SELECT_MESSAGE_COUNT = "SELECT message_count FROM user_levels WHERE guild_id = %s AND user_id = %s"
+SQL_SELECT_LEVEL_CONFIG = "SELECT * FROM level_config WHERE guild_id = %s"
+SQL_SELECT_LEVEL_ROLES = "SELECT level, role_id FROM level_roles WHERE guild_id = %s ORDER BY level"
+
+class PreparedStatementRegistry:
+    """Prepares a fixed set of hot statements once per pooled connection and reuses the prepared cursors."""
+    def __init__(self, queries: List[str]):
+        self.queries = frozenset(queries)
+        self._cursors = weakref.WeakKeyDictionary()  # raw connection -> (connection_id, {(query, dictionary): cursor})
+        self._lock = threading.Lock()
+        self.metrics = {"prepared": 0, "reused": 0}
+
+    def cursor(self, conn, stmt: "DBStatement"):
+        """Returns a cached prepared cursor for a hot statement, or None if the statement should run as plain text."""
+        if not DB_PREPARED_STATEMENTS or stmt.query not in self.queries or stmt.fetch == "many":
+            return None
+        raw = conn.raw if isinstance(conn, PooledConnection) else conn
+        connection_id = getattr(raw, "connection_id", None)
+        key = (stmt.query, stmt.dictionary)
+        with self._lock:
+            entry = self._cursors.get(raw)
+            if entry is None or entry[0] != connection_id:
+                entry = (connection_id, {})  # new connection, or ping() reconnected: old statements are gone
+                self._cursors[raw] = entry
+            cursor = entry[1].get(key)
+            if cursor is not None:
+                self.metrics["reused"] += 1
+                return cursor
+            self.metrics["prepared"] += 1
+        cursor = raw.cursor(prepared=True, dictionary=stmt.dictionary)
+        with self._lock:
+            entry[1][key] = cursor
+        return cursor
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.metrics)
+
+prepared_statements = PreparedStatementRegistry([
+    SQL_SELECT_USER_LEVEL, SQL_INSERT_USER_LEVEL, SQL_UPDATE_USER_LEVEL,
+    SQL_APPLY_MESSAGE_XP, SQL_SELECT_MESSAGE_COUNT, SQL_SELECT_LEVEL_CONFIG, SQL_SELECT_LEVEL_ROLES,
+])
+
+def _run_statements_sync(conn, statements: List[DBStatement], acquire_seconds: float = 0.0) -> list:
+    """Executes statements on a mysql-connector connection and commits them as one transaction."""
+    results = []
+    for stmt in statements:
+        cursor = prepared_statements.cursor(conn, stmt)
+        prepared = cursor is not None
+        if not prepared:
+            cursor = conn.cursor(dictionary=stmt.dictionary, buffered=stmt.fetch == "one")
+        start = time.perf_counter()
+        row_count = 0
+        error = None
+        try:
+            if stmt.fetch == "many":
+                cursor.executemany(stmt.query, stmt.params)
+            else:
+                cursor.execute(stmt.query, stmt.params)
+            if stmt.fetch == "one":
+                if prepared:
+                    rows = cursor.fetchall()  # prepared cursors are unbuffered, so drain the result
+                    results.append(rows[0] if rows else None)
+                else:
+                    results.append(cursor.fetchone())
+                row_count = 1 if results[-1] is not None else 0
+            elif stmt.fetch == "all":
+                results.append(cursor.fetchall())
+                row_count = len(results[-1])
+            elif stmt.fetch == "lastrowid":
+                results.append(cursor.lastrowid)
+                row_count = max(cursor.rowcount, 0)
+            else:
+                results.append(cursor.rowcount)
+                row_count = max(cursor.rowcount, 0)
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            record_statement(stmt, row_count, acquire_seconds, time.perf_counter() - start, error)
+            acquire_seconds = 0.0  # only the first statement waited for the connection
+            if not prepared:
+                cursor.close()
+    conn.commit()
+    return results
+
+class ThreadedMySQLDriver:
+    """Runs statements on pooled mysql-connector connections in worker threads (see async_db_runner)."""
+    name = "thread"
+    async def run(self, statements: List[DBStatement], low_priority: bool = False) -> Optional[list]:
+        def sync_op():
+            start = time.perf_counter()
+            conn = _get_db_pool().acquire()  # connection errors propagate so the circuit breaker sees them
+            acquire_seconds = time.perf_counter() - start
+            metrics.observe("db_acquire_seconds", acquire_seconds, helper=current_db_helper.get())
+            try:
+                return _run_statements_sync(conn, statements, acquire_seconds)
+            finally:
+                conn.close()
+        return await async_db_runner(sync_op, low_priority=low_priority)
+    async def close(self):
+        if db_pool is not None:
+            db_pool.close_all()
+
+class AsyncMySQLDriver:
+    """Runs statements on a native asyncio aiomysql pool, so no worker thread is held per query."""
+    name = "aiomysql"
+    def __init__(self, config: Dict[str, Any], size: int):
+        self.config = config
+        self.size = size
+        self._pool = None
+        self._start_lock = asyncio.Lock()
+    async def _get_pool(self):
+        if self._pool is None:
+            async with self._start_lock:
+                if self._pool is None:
+                    self._pool = await aiomysql.create_pool(
+                        host=self.config["host"], port=self.config["port"], user=self.config["user"],
+                        password=self.config["password"], db=self.config["database"],
+                        minsize=1, maxsize=self.size, autocommit=False, pool_recycle=DB_POOL_IDLE_RECYCLE_SECONDS
+                    )
+        return self._pool
+    async def _run_once(self, statements: List[DBStatement]) -> list:
+        pool = await self._get_pool()
+        start = time.perf_counter()
+        async with pool.acquire() as conn:
+            acquire_seconds = time.perf_counter() - start
+            metrics.observe("db_acquire_seconds", acquire_seconds, helper=current_db_helper.get())
+            try:
+                results = []
+                for stmt in statements:
+                    async with conn.cursor(aiomysql.DictCursor if stmt.dictionary else aiomysql.Cursor) as cursor:
+                        start = time.perf_counter()
+                        row_count = 0
+                        error = None
+                        try:
+                            if stmt.fetch == "many":
+                                await cursor.executemany(stmt.query, stmt.params)
+                            else:
+                                await cursor.execute(stmt.query, stmt.params)
+                            if stmt.fetch == "one":
+                                results.append(await cursor.fetchone())
+                                row_count = 1 if results[-1] is not None else 0
+                            elif stmt.fetch == "all":
+                                results.append(list(await cursor.fetchall()))
+                                row_count = len(results[-1])
+                            elif stmt.fetch == "lastrowid":
+                                results.append(cursor.lastrowid)
+                                row_count = max(cursor.rowcount, 0)
+                            else:
+                                results.append(cursor.rowcount)
+                                row_count = max(cursor.rowcount, 0)
+                        except BaseException as e:
+                            error = e
+                            raise
+                        finally:
+                            record_statement(stmt, row_count, acquire_seconds, time.perf_counter() - start, error)
+                            acquire_seconds = 0.0
+                await conn.commit()
+                return results
+            except BaseException:
+                try:
+                    await conn.rollback()
+                except Exception:
+                    pass
+                raise
+    async def _run_with_retries(self, statements: List[DBStatement]) -> list:
+        max_retries = 3
+        retry_delay = 1
+        for attempt in range(max_retries):
+            try:
+                return await self._run_once(statements)
+            except aiomysql.OperationalError as err:
+                if attempt + 1 < max_retries and 'connect' in str(err).lower() and not db_breaker.is_open():
+                    print(f"DB OperationalError (Attempt {attempt+1}/{max_retries}): {err}. Retrying in {retry_delay}s.")
+                    await asyncio.sleep(retry_delay)
+                    retry_delay *= 2
+                    continue
+                raise
+    async def run(self, statements: List[DBStatement], low_priority: bool = False) -> Optional[list]:
+        """Same outcomes and metrics as async_db_runner: rejected while the breaker is open, error (reported to it) or ok."""
+        helper = current_db_helper.get()
+        if not db_breaker.allow_request():
+            metrics.inc("db_calls", helper=helper, outcome="rejected")
+            return None
+        start = time.perf_counter()
+        try:
+            try:
+                results = await self._run_with_retries(statements)
+            finally:
+                metrics.observe("db_query_seconds", time.perf_counter() - start, helper=helper)
+        except aiomysql.Error as err:
+            print(f"CRITICAL DB ERROR during runtime op: {err}")
+            metrics.inc("db_calls", helper=helper, outcome="error")
+            await handle_db_runtime_failure(err)
+            return None
+        except Exception as e:
+            print(f"Non-MySQL error during DB op: {e}")
+            metrics.inc("db_calls", helper=helper, outcome="error")
+            return None
+        metrics.inc("db_calls", helper=helper, outcome="ok")
+        await db_breaker.record_success()
+        return results
+    async def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            await self._pool.wait_closed()
+            self._pool = None
+
+# SQLite stores TIMESTAMP columns as text. The adapter always writes microseconds, so every value has the same width
+# and text comparison is time order, which the cooldown check in SQL_APPLY_MESSAGE_XP (last_xp_gain <= cutoff) relies on
+sqlite3.register_adapter(datetime.datetime, lambda value: value.isoformat(" ", "microseconds"))
+sqlite3.register_converter("TIMESTAMP", lambda raw: datetime.datetime.fromisoformat(raw.decode()))
+
+# MySQL-only syntax that must not reach SQLite unless the statement has an SQLITE_STATEMENTS entry
+MYSQL_ONLY_SYNTAX = re.compile(
+    r"\bIF\(|\bVALUES\(\w+\)|`|\bLIMIT\s+[^\s,]+\s*,|\bFOR\s+UPDATE\b|\bON\s+DUPLICATE\s+KEY\b|\bINSERT\s+IGNORE\b",
+    re.IGNORECASE
+)
 
-# --- Asynchronous Database Utility Functions (For Runtime ONLY) ---
-
-async def async_get_user_caselogs(user_id: int):
-    """Fetches all case logs for a specific user ID (Async)."""
-    def sync_op(user_id):
-        conn = _get_sync_connection()
-        if not conn: return []
-        cursor = conn.cursor(dictionary=True)
+class SQLiteDialectError(sqlite3.ProgrammingError):
+    """Raised for a MySQL-only statement that has no SQLite text in SQLITE_STATEMENTS."""
+
+@functools.lru_cache(maxsize=1024)
+def sqlite_query(query: str) -> str:
+    """Returns the SQLite text of a statement: its SQLITE_STATEMENTS entry, or the portable statement with ? placeholders."""
+    if query in SQLITE_STATEMENTS:
+        return SQLITE_STATEMENTS[query]
+    construct = MYSQL_ONLY_SYNTAX.search(query)
+    if construct is not None:
+        raise SQLiteDialectError(f"MySQL-only syntax {construct.group(0)!r} in a statement without an SQLite version: {query[:200]}")
+    return query.replace("%s", "?")
+
+def _sqlite_migration_base_tables(conn):
+    conn.execute("CREATE TABLE IF NOT EXISTS bot_config (name TEXT PRIMARY KEY, value TEXT)")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS case_logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            guild_id INTEGER DEFAULT NULL,
+            user_id INTEGER NOT NULL,
+            moderator_id INTEGER NOT NULL,
+            action TEXT NOT NULL,
+            reason TEXT,
+            duration TEXT DEFAULT NULL,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS user_levels (
+            guild_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            xp INTEGER DEFAULT 0,
+            level INTEGER DEFAULT 0,
+            message_count INTEGER DEFAULT 0,
+            last_xp_gain TIMESTAMP NULL,
+            PRIMARY KEY (guild_id, user_id)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS level_config (
+            guild_id INTEGER PRIMARY KEY,
+            xp_min INTEGER DEFAULT 1,
+            xp_max INTEGER DEFAULT 10,
+            xp_multiplier INTEGER DEFAULT 100,
+            xp_cooldown_seconds INTEGER DEFAULT 60,
+            level_up_channel_id INTEGER,
+            top_message_role_id INTEGER,
+            current_top_user_id INTEGER
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS level_roles (
+            guild_id INTEGER NOT NULL,
+            level INTEGER NOT NULL,
+            role_id INTEGER NOT NULL,
+            PRIMARY KEY (guild_id, level)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_case_logs_guild_user_id ON case_logs (guild_id, user_id, id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_user_levels_guild_xp ON user_levels (guild_id, xp)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_user_levels_guild_messages ON user_levels (guild_id, message_count)")
+
+# Ordered SQLite migrations, kept separately from SCHEMA_MIGRATIONS because the DDL differs. Same rules apply.
+SQLITE_SCHEMA_MIGRATIONS: List[Tuple[int, str, Callable]] = [
+    (1, "base tables and indexes", _sqlite_migration_base_tables),
+]
+
+def _run_sqlite_statements(conn: sqlite3.Connection, statements: List[DBStatement], acquire_seconds: float = 0.0) -> list:
+    """Executes statements on a SQLite connection inside the caller's transaction."""
+    results = []
+    for stmt in statements:
+        start = time.perf_counter()
+        cursor = None
+        row_count = 0
+        error = None
         try:
-            cursor.execute("SELECT `id`, `action`, `reason`, `duration`, `moderator_id`, `timestamp` FROM case_logs WHERE `user_id` = %s ORDER BY `id` DESC", (user_id,))
-            logs = cursor.fetchall()
-            return logs
+            if stmt.fetch == "many":
+                cursor = conn.executemany(sqlite_query(stmt.query), stmt.params)
+            else:
+                cursor = conn.execute(sqlite_query(stmt.query), stmt.params)
+            if stmt.fetch in ("one", "all"):
+                rows = cursor.fetchall() if stmt.fetch == "all" else cursor.fetchmany(1)
+                if stmt.dictionary:
+                    columns = [column[0] for column in cursor.description]
+                    rows = [dict(zip(columns, row)) for row in rows]
+                results.append(rows if stmt.fetch == "all" else (rows[0] if rows else None))
+                row_count = len(rows)
+            elif stmt.fetch == "lastrowid":
+                results.append(cursor.lastrowid)
+                row_count = max(cursor.rowcount, 0)
+            else:
+                results.append(cursor.rowcount)
+                row_count = max(cursor.rowcount, 0)
+        except BaseException as e:
+            error = e
+            raise
         finally:
-            cursor.close()
+            record_statement(stmt, row_count, acquire_seconds, time.perf_counter() - start, error)
+            acquire_seconds = 0.0
+            if cursor is not None:
+                cursor.close()
+    return results
+
+class SQLiteDriver:
+    """Runs statements on a local SQLite file: WAL journal, memory-mapped reads on per-thread connections, and one writer
+    thread that commits queued write transactions in groups (each behind its own savepoint, so one failure does not undo the others)."""
+    name = "sqlite"
+    def __init__(self, path: str, mmap_size: int, busy_timeout: float, group_commit_max: int):
+        self.path = path
+        self.mmap_size = mmap_size
+        self.busy_timeout = busy_timeout
+        self.group_commit_max = group_commit_max
+        self._local = threading.local()  # read connection of the current thread
+        self._connections: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        self._writes: "queue.Queue" = queue.Queue()  # (statements, context, future, queued_at), None stops the writer
+        self._writer: Optional[threading.Thread] = None
+        self.metrics = {"reads": 0, "writes": 0, "commits": 0, "failed_writes": 0, "shed": 0}
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.path, timeout=self.busy_timeout, isolation_level=None, check_same_thread=False,
+            detect_types=sqlite3.PARSE_DECLTYPES, cached_statements=256  # sqlite3 keeps compiled statements per connection
+        )
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")  # WAL + NORMAL: commits survive a crash of the bot, not a power loss
+        conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        conn.create_function("SQRT", 1, math.sqrt, deterministic=True)
+        conn.create_function("FLOOR", 1, math.floor, deterministic=True)
+        with self._lock:
+            self._connections.append(conn)
+        return conn
+
+    def _reader(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    def migrate(self) -> int:
+        """Runs every SQLite migration newer than the recorded schema version (Synchronous)."""
+        conn = self._reader()
+        try:
+            version = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()[0] or 0
+        except sqlite3.OperationalError as err:
+            if "no such table" not in str(err):
+                raise
+            version = 0
+        pending = [migration for migration in SQLITE_SCHEMA_MIGRATIONS if migration[0] > version]
+        if not pending:
+            print(f"Database schema is current (version {version}).")
+            return version
+        conn.execute("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER PRIMARY KEY, description TEXT NOT NULL, applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)")
+        for number, description, migrate in pending:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                migrate(conn)
+                conn.execute("INSERT INTO schema_version (version, description) VALUES (?, ?)", (number, description))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.rollback()
+                raise
+            version = number
+            print(f"Applied schema migration {number}: {description}.")
+        return version
+
+    def read_bot_config(self) -> Dict[str, str]:
+        """Reads every bot_config row (Synchronous)."""
+        return dict(self._reader().execute("SELECT name, value FROM bot_config").fetchall())
+
+    def _start_writer(self):
+        with self._lock:
+            if self._writer is None or not self._writer.is_alive():
+                self._writer = threading.Thread(target=self._write_loop, name="db-sqlite-writer", daemon=True)
+                self._writer.start()
+
+    def _write_loop(self):
+        conn = self._connect()
+        stopping = False
+        while not stopping:
+            item = self._writes.get()
+            if item is None:
+                break
+            group = [item]
+            while len(group) < self.group_commit_max:
+                try:
+                    item = self._writes.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                group.append(item)
+            self._commit_group(conn, [entry for entry in group if entry[2].set_running_or_notify_cancel()])
+
+    def _commit_group(self, conn: sqlite3.Connection, group: list):
+        if not group:
+            return
+        outcomes = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for statements, context, future, queued_at in group:
+                conn.execute("SAVEPOINT write_item")
+                try:
+                    results = context.run(self._execute_write, conn, statements, time.perf_counter() - queued_at)
+                    conn.execute("RELEASE write_item")
+                    outcomes.append((future, results, None))
+                except Exception as e:
+                    conn.execute("ROLLBACK TO write_item")
+                    conn.execute("RELEASE write_item")
+                    outcomes.append((future, None, e))
+            conn.execute("COMMIT")
+            self.metrics["commits"] += 1
+        except sqlite3.Error as err:
+            if conn.in_transaction:
+                conn.rollback()
+            outcomes = [(future, None, err) for _, _, future, _ in group]
+        for future, results, error in outcomes:
+            if error is None:
+                future.set_result(results)
+            else:
+                self.metrics["failed_writes"] += 1
+                future.set_exception(error)
+
+    @staticmethod
+    def _execute_write(conn: sqlite3.Connection, statements: List[DBStatement], acquire_seconds: float) -> list:
+        metrics.observe("db_acquire_seconds", acquire_seconds, helper=current_db_helper.get())  # time spent queued for the writer
+        return _run_sqlite_statements(conn, statements, acquire_seconds)
+
+    async def run(self, statements: List[DBStatement], low_priority: bool = False) -> Optional[list]:
+        if all(stmt.query.lstrip()[:6].upper() == "SELECT" for stmt in statements):
+            self.metrics["reads"] += 1
+            def sync_read():
+                conn = self._reader()
+                conn.execute("BEGIN")  # one snapshot for the whole batch
+                try:
+                    return _run_sqlite_statements(conn, statements)
+                finally:
+                    conn.execute("COMMIT")
+            return await async_db_runner(sync_read, low_priority=low_priority)
+        helper = current_db_helper.get()
+        if low_priority and self._writes.qsize() >= DB_EXECUTOR_LOW_PRIORITY_LIMIT:
+            self.metrics["shed"] += 1
+            metrics.inc("db_calls", helper=helper, outcome="shed")
+            return None
+        self._start_writer()
+        self.metrics["writes"] += 1
+        future = Future()
+        start = time.perf_counter()
+        self._writes.put((statements, contextvars.copy_context(), future, start))
+        try:
+            try:
+                results = await asyncio.wrap_future(future)
+            finally:
+                metrics.observe("db_query_seconds", time.perf_counter() - start, helper=helper)
+        except Exception as e:
+            print(f"CRITICAL DB ERROR during runtime op: {e}")
+            metrics.inc("db_calls", helper=helper, outcome="error")
+            return None
+        metrics.inc("db_calls", helper=helper, outcome="ok")
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        return {"write_queue": self._writes.qsize(), **self.metrics}
+
+    async def close(self):
+        if self._writer is not None:
+            self._writes.put(None)  # queued writes ahead of it are still committed
+            await asyncio.to_thread(self._writer.join)
+            self._writer = None
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
             conn.close()
-    return await async_db_runner(sync_op, user_id)
+        self._local = threading.local()
+
+db_driver = None
+
+def _get_db_driver():
+    """Returns the configured database driver (see DB_DRIVER), falling back to the thread driver if aiomysql is missing."""
+    global db_driver
+    if db_driver is None:
+        if DB_DRIVER == "sqlite":
+            db_driver = SQLiteDriver(SQLITE_PATH, SQLITE_MMAP_SIZE_BYTES, SQLITE_BUSY_TIMEOUT_SECONDS, SQLITE_GROUP_COMMIT_MAX_WRITES)
+        elif DB_DRIVER == "aiomysql" and aiomysql is not None:
+            db_driver = AsyncMySQLDriver(DB_CONFIG, DB_POOL_SIZE)
+        else:
+            if DB_DRIVER == "aiomysql":
+                print("Warning: DB_DRIVER is 'aiomysql' but the aiomysql package is not installed. Using the thread driver.")
+            db_driver = ThreadedMySQLDriver()
+    return db_driver
+
+async def async_db_transaction(*statements: DBStatement, low_priority: bool = False) -> Optional[list]:
+    """Runs statements in order as one transaction. Returns one result per statement, or None on failure (or when a low_priority call is shed)."""
+    return await _get_db_driver().run(list(statements), low_priority=low_priority)
+
+async def async_db_query(query: str, params: Union[tuple, list] = (), fetch: Optional[str] = None, dictionary: bool = False):
+    """Runs a single statement (see DBStatement). Returns its result, or None on failure."""
+    results = await async_db_transaction(DBStatement(query, params, fetch, dictionary))
+    return results[0] if results is not None else None
 
+# --- Asynchronous Database Utility Functions (For Runtime ONLY) ---
+
+@db_helper
+async def async_get_user_caselogs(guild_id: int, user_id: int, before_id: Optional[int] = None, limit: int = 10):
+    """Fetches one page of a user's case logs in a guild, newest first (Async). Pass the last ID of the previous page as before_id."""
+    # Cases logged before case_logs had a guild_id column (guild_id NULL) cannot be attributed to a guild and are not shown
+    query = "SELECT id, action, reason, duration, moderator_id, timestamp FROM case_logs WHERE guild_id = %s AND user_id = %s"
+    params = [guild_id, user_id]
+    if before_id is not None:
+        query += " AND id < %s"
+        params.append(before_id)
+    query += " ORDER BY id DESC LIMIT %s"
+    params.append(limit)
+    return await async_db_query(query, tuple(params), fetch="all", dictionary=True)
+
+@db_helper
+async def async_count_user_caselogs(guild_id: int, user_id: int) -> Optional[int]:
+    """Counts a user's case logs in a guild (Async)."""
+    result = await async_db_query("SELECT COUNT(*) FROM case_logs WHERE guild_id = %s AND user_id = %s", (guild_id, user_id), fetch="one")
+    return result[0] if result else None
+
+SQL_UPSERT_BOT_CONFIG = sqlite_variant(
+    "INSERT INTO bot_config (name, value) VALUES (%s, %s) ON DUPLICATE KEY UPDATE value = VALUES(value)",
+    "INSERT INTO bot_config (name, value) VALUES (?, ?) ON CONFLICT (name) DO UPDATE SET value = excluded.value"
+)
+
+@db_helper
 async def async_set_bot_config(name: str, value: str):
     """Sets or updates a configuration value in the bot_config table (Async)."""
-    def sync_op(name, value):
-        conn = _get_sync_connection()
-        if not conn: return
-        cursor = conn.cursor()
-        try:
-            cursor.execute("INSERT INTO bot_config (name, value) VALUES (%s, %s) ON DUPLICATE KEY UPDATE value = VALUES(value)", (name, value))
-            conn.commit()
-        finally:
-            cursor.close()
-            conn.close()
-    await async_db_runner(sync_op, name, value)
+    await async_db_query(SQL_UPSERT_BOT_CONFIG, (name, value))
 
-async def async_log_case(user_id: int, mod_id: int, action: str, reason: str, duration: Optional[str] = None) -> Optional[int]:
+@db_helper
+async def async_log_case(guild_id: int, user_id: int, mod_id: int, action: str, reason: str, duration: Optional[str] = None) -> Optional[int]:
     """Logs a moderation action to the case_logs table (Async). Returns the new case ID."""
-    def sync_op(user_id, mod_id, action, reason, duration):
-        conn = _get_sync_connection()
-        if not conn: return None
-        cursor = conn.cursor()
-        try:
-            cursor.execute("INSERT INTO case_logs (user_id, moderator_id, action, reason, duration) VALUES (%s, %s, %s, %s, %s)", (user_id, mod_id, action, reason, duration))
-            conn.commit()
-            return cursor.lastrowid
-        finally:
-            cursor.close()
-            conn.close()
-    return await async_db_runner(sync_op, user_id, mod_id, action, reason, duration)
+    return await async_db_query("INSERT INTO case_logs (guild_id, user_id, moderator_id, action, reason, duration) VALUES (%s, %s, %s, %s, %s, %s)", (guild_id, user_id, mod_id, action, reason, duration), fetch="lastrowid")
+
+@db_helper
+async def async_log_cases_bulk(guild_id: int, user_ids: List[int], mod_id: int, action: str, reason: str, duration: Optional[str] = None) -> Optional[int]:
+    """Logs the same moderation action for many users with one executemany insert (Async). Returns the number of rows written."""
+    if not user_ids:
+        return 0
+    return await async_db_query(
+        "INSERT INTO case_logs (guild_id, user_id, moderator_id, action, reason, duration) VALUES (%s, %s, %s, %s, %s, %s)",
+        [(guild_id, user_id, mod_id, action, reason, duration) for user_id in user_ids],
+        fetch="many"
+    )
 
+@db_helper
 async def async_get_level_config(guild_id: int) -> Optional[Dict[str, Any]]:
-    """Fetches leveling config for a guild (Async)."""
-    def sync_op(guild_id):
-        conn = _get_sync_connection()
-        if not conn: return None
-        cursor = conn.cursor(dictionary=True)
-        try:
-            cursor.execute("SELECT * FROM level_config WHERE guild_id = %s", (guild_id,))
-            config = cursor.fetchone()
-            return config
-        finally:
-            cursor.close()
-            conn.close()
-    return await async_db_runner(sync_op, guild_id)
+    """Fetches leveling config for a guild (Async). Served from level_config_cache when possible, even past its TTL during a DB outage."""
+    hit, config = level_config_cache.get(guild_id, allow_stale=db_breaker.is_open())
+    if hit:
+        return config
+    rows = await async_db_query(SQL_SELECT_LEVEL_CONFIG, (guild_id,), fetch="all", dictionary=True)
+    if rows is None:
+        return None  # DB failure: don't cache it as "not configured"
+    config = rows[0] if rows else None
+    if config is None:
+        print(f"No level config found for guild {guild_id}. Leveling stays disabled there until it is configured.")
+    level_config_cache.put(guild_id, config)
+    return config
+
+@functools.lru_cache(maxsize=None)
+def level_config_upsert(key: str) -> str:
+    """The single-column level_config upsert for one config key (both dialects registered once per key)."""
+    return sqlite_variant(
+        f"INSERT INTO level_config (guild_id, {key}) VALUES (%s, %s) ON DUPLICATE KEY UPDATE {key} = %s",
+        f"INSERT INTO level_config (guild_id, {key}) VALUES (?1, ?2) ON CONFLICT (guild_id) DO UPDATE SET {key} = ?3"
+    )
 
+@db_helper
 async def async_set_level_config(guild_id: int, key: str, value: Any):
-    """Sets or updates a leveling config value for a guild (Async)."""
-    def sync_op(guild_id, key, value):
-        conn = _get_sync_connection()
-        if not conn: return
-        cursor = conn.cursor()
-        try:
-            cursor.execute(f"INSERT INTO level_config (guild_id, {key}) VALUES (%s, %s) ON DUPLICATE KEY UPDATE {key} = %s", (guild_id, value, value))
-            conn.commit()
-        finally:
-            cursor.close()
-            conn.close()
-    await async_db_runner(sync_op, guild_id, key, value)
+    """Sets or updates a leveling config value for a guild (Async). Writes through to level_config_cache."""
+    result = await async_db_query(level_config_upsert(key), (guild_id, value, value))
+    if result is None:
+        level_config_cache.invalidate(guild_id)
+    else:
+        level_config_cache.update(guild_id, key, value)
 
+@db_helper
 async def async_get_user_level(guild_id: int, user_id: int) -> Dict[str, Any]:
     """Fetches user level data for a guild (Async). Returns defaults if not found."""
-    def sync_op(guild_id, user_id):
-        conn = _get_sync_connection()
-        if not conn: return {'xp': 0, 'level': 0, 'message_count': 0, 'last_xp_gain': None}
-        cursor = conn.cursor(dictionary=True)
-        try:
-            cursor.execute("SELECT xp, level, message_count, last_xp_gain FROM user_levels WHERE guild_id = %s AND user_id = %s", (guild_id, user_id))
-            data = cursor.fetchone()
-            if data is None:
-                cursor.execute("INSERT INTO user_levels (guild_id, user_id) VALUES (%s, %s)", (guild_id, user_id))
-                conn.commit()
-                return {'xp': 0, 'level': 0, 'message_count': 0, 'last_xp_gain': None}
-            return data
-        finally:
-            cursor.close()
-            conn.close()
-    result = await async_db_runner(sync_op, guild_id, user_id)
-    return result if result else {'xp': 0, 'level': 0, 'message_count': 0, 'last_xp_gain': None}
+    data = await async_db_query(SQL_SELECT_USER_LEVEL, (guild_id, user_id), fetch="one", dictionary=True)
+    if data is None:
+        await async_db_query(SQL_INSERT_USER_LEVEL, (guild_id, user_id))
+        data = {'xp': 0, 'level': 0, 'message_count': 0, 'last_xp_gain': None}
+    return xp_buffer.apply_pending(guild_id, user_id, data)
 
+@db_helper
 async def async_update_user_level(guild_id: int, user_id: int, xp: int = None, level: int = None, message_count: int = None, last_xp_gain: datetime.datetime = None):
-    """Updates user level data (Async)."""
-    def sync_op(guild_id, user_id, xp, level, message_count, last_xp_gain):
-        conn = _get_sync_connection()
-        if not conn: return
-        cursor = conn.cursor()
-        try:
-            set_clause = []
-            values = []
-            if xp is not None:
-                set_clause.append("xp = %s")
-                values.append(xp)
-            if level is not None:
-                set_clause.append("level = %s")
-                values.append(level)
-            if message_count is not None:
-                set_clause.append("message_count = %s")
-                values.append(message_count)
-            if last_xp_gain is not None:
-                set_clause.append("last_xp_gain = %s")
-                values.append(last_xp_gain)
-            if set_clause:
-                query = f"UPDATE user_levels SET {', '.join(set_clause)} WHERE guild_id = %s AND user_id = %s"
-                values.extend([guild_id, user_id])
-                cursor.execute(query, tuple(values))
-                conn.commit()
-        finally:
-            cursor.close()
-            conn.close()
-    await async_db_runner(sync_op, guild_id, user_id, xp, level, message_count, last_xp_gain)
+    """Updates user level data (Async). Fields left as None keep their stored value."""
+    if xp is None and level is None and message_count is None and last_xp_gain is None:
+        return
+    await async_db_query(SQL_UPDATE_USER_LEVEL, (xp, level, message_count, last_xp_gain, guild_id, user_id))
+
+@db_helper
+async def async_apply_message_xp(guild_id: int, user_id: int, xp_gain: int, cooldown_seconds: int, xp_multiplier: int, now: datetime.datetime) -> Optional[Dict[str, Any]]:
+    """Applies one chat message to user_levels with a single upsert: cooldown check, XP and message_count increments and level recompute (Async). Inside the cooldown nothing is written and the caller buffers the message_count bump. Returns {'gained', 'old_level', 'new_level', 'row'} or None on DB failure."""
+    cutoff = now - datetime.timedelta(seconds=cooldown_seconds)
+    initial_level = level_engine.level_for_xp(xp_gain, xp_multiplier)
+    results = await async_db_transaction(
+        DBStatement(SQL_APPLY_MESSAGE_XP, (guild_id, user_id, xp_gain, initial_level, now, cutoff, cutoff, xp_multiplier, xp_multiplier, cutoff, cutoff)),
+        DBStatement(SQL_SELECT_USER_LEVEL, (guild_id, user_id), fetch="one", dictionary=True),
+    )
+    if results is None or results[1] is None:
+        return None
+    row = results[1]
+    gained = results[0] > 0
+    return {
+        'gained': gained,
+        'old_level': level_engine.level_for_xp(row['xp'] - xp_gain, xp_multiplier) if gained else row['level'],
+        'new_level': row['level'],
+        'row': row,
+    }
+
+@db_helper
+async def async_recompute_guild_levels(guild_id: int, xp_multiplier: int) -> Optional[List[Tuple[int, int, int]]]:
+    """Recomputes every stored level in a guild, e.g. after an xp_multiplier change (Async). Returns (user_id, old_level, new_level) for users who crossed a level role, or None on DB failure."""
+    await xp_buffer.flush()
+    crossed = []
+    last_user_id = -1
+    while True:
+        rows = await async_db_query(
+            "SELECT user_id, xp, level FROM user_levels WHERE guild_id = %s AND user_id > %s ORDER BY user_id LIMIT %s",
+            (guild_id, last_user_id, LEVEL_RECOMPUTE_CHUNK_SIZE), fetch="all"
+        )
+        if rows is None:
+            return None
+        if not rows:
+            break
+        last_user_id = rows[-1][0]
+        new_levels = level_engine.levels_for_xp([xp or 0 for _, xp, _ in rows], xp_multiplier)
+        changed = [(user_id, xp, old_level or 0, new_level) for (user_id, xp, old_level), new_level in zip(rows, new_levels) if new_level != old_level]
+        if changed:
+            # The xp guard skips rows that on_message updated since they were read
+            result = await async_db_query(
+                "UPDATE user_levels SET level = %s WHERE guild_id = %s AND user_id = %s AND xp = %s",
+                [(new_level, guild_id, user_id, xp) for user_id, xp, _, new_level in changed], fetch="many"
+            )
+            if result is None:
+                return None
+            for user_id, _, old_level, new_level in changed:
+                if await async_get_level_roles_between(guild_id, min(old_level, new_level), max(old_level, new_level)):
+                    crossed.append((user_id, old_level, new_level))
+        if len(rows) < LEVEL_RECOMPUTE_CHUNK_SIZE:
+            break
+    return crossed
+
+SQL_UPSERT_LEVEL_ROLE = sqlite_variant(
+    "INSERT INTO level_roles (guild_id, level, role_id) VALUES (%s, %s, %s) ON DUPLICATE KEY UPDATE role_id = %s",
+    "INSERT INTO level_roles (guild_id, level, role_id) VALUES (?1, ?2, ?3) ON CONFLICT (guild_id, level) DO UPDATE SET role_id = ?4"
+)
 
+@db_helper
 async def async_add_level_role(guild_id: int, level: int, role_id: int):
-    """Adds or updates a level role (Async)."""
-    def sync_op(guild_id, level, role_id):
-        conn = _get_sync_connection()
-        if not conn: return
-        cursor = conn.cursor()
-        try:
-            cursor.execute("INSERT INTO level_roles (guild_id, level, role_id) VALUES (%s, %s, %s) ON DUPLICATE KEY UPDATE role_id = %s", (guild_id, level, role_id, role_id))
-            conn.commit()
-        finally:
-            cursor.close()
-            conn.close()
-    await async_db_runner(sync_op, guild_id, level, role_id)
-
+    """Adds or updates a level role (Async). Keeps level_role_index in sync."""
+    result = await async_db_query(SQL_UPSERT_LEVEL_ROLE, (guild_id, level, role_id, role_id))
+    if result is None:
+        level_role_index.invalidate(guild_id)
+    else:
+        level_role_index.set(guild_id, level, role_id)
+
+@db_helper
+async def async_get_level_roles_between(guild_id: int, low_level: int, high_level: int) -> List[Tuple[int, int]]:
+    """Returns (level, role_id) for every level role with low_level < level <= high_level (Async)."""
+    if not level_role_index.is_loaded(guild_id):
+        rows = await async_db_query(SQL_SELECT_LEVEL_ROLES, (guild_id,), fetch="all")
+        if rows is None:
+            return []
+        level_role_index.load(guild_id, rows)
+    return level_role_index.roles_between(guild_id, low_level, high_level)
+
+@db_helper
 async def async_get_level_role(guild_id: int, level: int) -> Optional[int]:
     """Fetches role ID for a specific level (Async)."""
-    def sync_op(guild_id, level):
-        conn = _get_sync_connection()
-        if not conn: return None
-        cursor = conn.cursor()
-        try:
-            cursor.execute("SELECT role_id FROM level_roles WHERE guild_id = %s AND level = %s", (guild_id, level))
-            result = cursor.fetchone()
-            return result[0] if result else None
-        finally:
-            cursor.close()
-            conn.close()
-    return await async_db_runner(sync_op, guild_id, level)
+    roles = await async_get_level_roles_between(guild_id, level - 1, level)
+    return roles[0][1] if roles else None
+
+@db_helper
+async def async_get_top_user(guild_id: int) -> Optional[Tuple[int, int]]:
+    """Fetches (user_id, message_count) of the user with the highest message count (Async)."""
+    result = await async_db_query("SELECT user_id, message_count FROM user_levels WHERE guild_id = %s ORDER BY message_count DESC LIMIT 1", (guild_id,), fetch="one")
+    return (result[0], result[1]) if result else None
+
+@db_helper
+async def async_get_message_count(guild_id: int, user_id: int) -> Optional[int]:
+    """Fetches a user's message count without creating a row (Async). Returns None on DB failure."""
+    rows = await async_db_query(SQL_SELECT_MESSAGE_COUNT, (guild_id, user_id), fetch="all")
+    if rows is None:
+        return None
+    stored = {'xp': 0, 'level': 0, 'message_count': rows[0][0] if rows else 0, 'last_xp_gain': None}
+    return xp_buffer.apply_pending(guild_id, user_id, stored)['message_count']
 
-async def async_get_top_user(guild_id: int) -> Optional[int]:
-    """Fetches the user with the highest message count (Async)."""
-    def sync_op(guild_id):
-        conn = _get_sync_connection()
-        if not conn: return None
-        cursor = conn.cursor()
+@db_helper
+async def async_get_user_rank(guild_id: int, user_id: int) -> Optional[int]:
+    """Fetches the rank of a user based on XP in the guild (Async). Served from guild_xp_indexes once loaded."""
+    index = guild_xp_indexes.get(guild_id)
+    if index is not None:
+        rank = index.rank(user_id)
+        if rank is not None:
+            return rank
+    else:
+        guild_xp_indexes.ensure_loading(guild_id)  # repeated lookups are then answered from memory
+    result = await async_db_query(
+        "SELECT 1 + (SELECT COUNT(*) FROM user_levels AS other WHERE other.guild_id = u.guild_id AND other.xp > u.xp) "
+        "FROM user_levels AS u WHERE u.guild_id = %s AND u.user_id = %s",
+        (guild_id, user_id), fetch="one"
+    )
+    return result[0] if result else None
+
+# --- Level Config Cache ---
+
+class LevelConfigCache:
+    """In-process cache of level_config rows keyed by guild_id. Unconfigured guilds are cached as None."""
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._entries: Dict[int, Tuple[Optional[Dict[str, Any]], float]] = {}
+
+    def get(self, guild_id: int, allow_stale: bool = False) -> Tuple[bool, Optional[Dict[str, Any]]]:
+        """Returns (hit, config). A hit with config None means the guild has no level config. allow_stale ignores the TTL."""
+        entry = self._entries.get(guild_id)
+        if entry is None or (not allow_stale and time.monotonic() - entry[1] > self.ttl):
+            return False, None
+        return True, entry[0]
+
+    def put(self, guild_id: int, config: Optional[Dict[str, Any]]):
+        self._entries[guild_id] = (config, time.monotonic())
+
+    def update(self, guild_id: int, key: str, value: Any):
+        """Applies a successful write to the cached row, or drops the entry if no full row is cached yet."""
+        entry = self._entries.get(guild_id)
+        if entry is not None and entry[0] is not None:
+            entry[0][key] = value
+        else:
+            self.invalidate(guild_id)
+
+    def invalidate(self, guild_id: Optional[int] = None):
+        """Drops one guild's entry, or every entry when guild_id is None."""
+        if guild_id is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(guild_id, None)
+
+level_config_cache = LevelConfigCache(LEVEL_CONFIG_CACHE_TTL_SECONDS)
+
+# --- Top Message Sender Tracking ---
+
+class TopSenderTracker:
+    """Running maximum of message_count per guild, persisted through level_config.current_top_user_id."""
+    def __init__(self):
+        self._top: Dict[int, Tuple[Optional[int], int]] = {}  # guild_id -> (user_id, message_count)
+
+    def get(self, guild_id: int) -> Optional[Tuple[Optional[int], int]]:
+        return self._top.get(guild_id)
+
+    def set(self, guild_id: int, user_id: Optional[int], message_count: int) -> Tuple[Optional[int], int]:
+        self._top[guild_id] = (user_id, message_count)
+        return self._top[guild_id]
+
+    def invalidate(self, guild_id: int):
+        self._top.pop(guild_id, None)
+
+top_senders = TopSenderTracker()
+
+# --- XP Rank Index (Order-Statistic Structure) ---
+
+class SortedXPIndex:
+    """Order-statistic index of one guild's users by XP, highest first.
+
+    Keys live in sorted buckets with a Fenwick tree over bucket sizes, so rank lookups
+    take O(log n) and an XP change costs O(log n) plus a small in-bucket insort.
+    """
+    BUCKET_SIZE = 512
+    _USER_MASK = (1 << 64) - 1
+
+    def __init__(self, rows=()):
+        self._xp: Dict[int, int] = {}
+        keys = []
+        for user_id, xp in rows:
+            self._xp[user_id] = xp or 0
+            keys.append(self._key(user_id, xp or 0))
+        keys.sort()
+        self._buckets: List[List[int]] = [keys[i:i + self.BUCKET_SIZE] for i in range(0, len(keys), self.BUCKET_SIZE)]
+        self._rebuild()
+
+    @staticmethod
+    def _key(user_id: int, xp: int) -> int:
+        # Higher XP sorts first, ties by user ID
+        return (-xp << 64) | user_id
+
+    def _rebuild(self):
+        self._maxes = [bucket[-1] for bucket in self._buckets]
+        tree = [0] * (len(self._buckets) + 1)
+        for i, bucket in enumerate(self._buckets, start=1):
+            tree[i] += len(bucket)
+            parent = i + (i & -i)
+            if parent < len(tree):
+                tree[parent] += tree[i]
+        self._tree = tree
+
+    def _tree_add(self, bucket_index: int, delta: int):
+        i = bucket_index + 1
+        while i < len(self._tree):
+            self._tree[i] += delta
+            i += i & -i
+
+    def _tree_prefix(self, bucket_index: int) -> int:
+        """Number of keys in buckets before bucket_index."""
+        total = 0
+        i = bucket_index
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+    def _tree_locate(self, position: int) -> Tuple[int, int]:
+        """Returns (bucket index, offset) of the key at a 0-based position."""
+        index = 0
+        step = 1 << (len(self._tree).bit_length())
+        while step:
+            nxt = index + step
+            if nxt < len(self._tree) and self._tree[nxt] <= position:
+                index = nxt
+                position -= self._tree[nxt]
+            step >>= 1
+        return index, position
+
+    def __len__(self) -> int:
+        return len(self._xp)
+
+    def _insert(self, key: int):
+        if not self._buckets:
+            self._buckets = [[key]]
+            self._rebuild()
+            return
+        i = min(bisect.bisect_left(self._maxes, key), len(self._buckets) - 1)
+        bucket = self._buckets[i]
+        bisect.insort(bucket, key)
+        self._maxes[i] = bucket[-1]
+        if len(bucket) > 2 * self.BUCKET_SIZE:
+            self._buckets[i:i + 1] = [bucket[:self.BUCKET_SIZE], bucket[self.BUCKET_SIZE:]]
+            self._rebuild()
+        else:
+            self._tree_add(i, 1)
+
+    def _remove(self, key: int):
+        i = bisect.bisect_left(self._maxes, key)
+        bucket = self._buckets[i]
+        del bucket[bisect.bisect_left(bucket, key)]
+        if bucket:
+            self._maxes[i] = bucket[-1]
+            self._tree_add(i, -1)
+        else:
+            del self._buckets[i]
+            self._rebuild()
+
+    def set_xp(self, user_id: int, xp: int):
+        old_xp = self._xp.get(user_id)
+        if old_xp == xp:
+            return
+        if old_xp is not None:
+            self._remove(self._key(user_id, old_xp))
+        self._insert(self._key(user_id, xp))
+        self._xp[user_id] = xp
+
+    def count_above(self, xp: int) -> int:
+        """Number of users with strictly more XP."""
+        key = -xp << 64
+        i = bisect.bisect_left(self._maxes, key)
+        if i == len(self._buckets):
+            return len(self._xp)
+        return self._tree_prefix(i) + bisect.bisect_left(self._buckets[i], key)
+
+    def rank(self, user_id: int) -> Optional[int]:
+        """1-based rank (users tied on XP share a rank), or None if the user is not indexed."""
+        xp = self._xp.get(user_id)
+        return None if xp is None else self.count_above(xp) + 1
+
+    def page(self, start: int, count: int) -> List[Tuple[int, int]]:
+        """Returns (user_id, xp) for positions start .. start + count - 1 without sorting or scanning earlier entries."""
+        if start >= len(self._xp) or count <= 0:
+            return []
+        bucket_index, offset = self._tree_locate(start)
+        entries = []
+        while bucket_index < len(self._buckets) and len(entries) < count:
+            for key in self._buckets[bucket_index][offset:offset + count - len(entries)]:
+                entries.append((key & self._USER_MASK, -(key >> 64)))
+            bucket_index += 1
+            offset = 0
+        return entries
+
+class GuildXPIndexes:
+    """Lazily loaded SortedXPIndex per guild, kept current through note_xp() as XP changes.
+
+    Guilds whose index was not looked up for idle_seconds are evicted, and so are the least recently looked-up
+    guilds once all indexes together hold more than max_users rows. An evicted guild is reloaded on its next lookup.
+    """
+    def __init__(self, max_users: int, idle_seconds: float):
+        self.max_users = max_users
+        self.idle_seconds = idle_seconds
+        self._indexes: "OrderedDict[int, list]" = OrderedDict()  # guild_id -> [index, last_lookup], least recent first
+        self._users = 0  # rows held by all indexes
+        self._late_updates: Dict[int, Dict[int, int]] = {}  # XP changes seen while a guild is loading
+        self._tasks: Dict[int, asyncio.Task] = {}
+
+    def _evict(self, now: float):
+        while self._users > self.max_users and self._indexes:
+            self._users -= len(self._indexes.popitem(last=False)[1][0])
+        while self._indexes:
+            oldest = next(iter(self._indexes.values()))
+            if now - oldest[1] <= self.idle_seconds:
+                break
+            self._users -= len(self._indexes.popitem(last=False)[1][0])
+
+    def get(self, guild_id: int) -> Optional[SortedXPIndex]:
+        entry = self._indexes.get(guild_id)
+        if entry is None:
+            return None
+        now = time.monotonic()
+        entry[1] = now
+        self._indexes.move_to_end(guild_id)
+        self._evict(now)
+        return entry[0]
+
+    def note_xp(self, guild_id: int, user_id: int, xp: int):
+        """Keeps a loaded (or loading) index current. Guilds without one are skipped: their next load reads the database."""
+        entry = self._indexes.get(guild_id)
+        if entry is not None:
+            before = len(entry[0])
+            entry[0].set_xp(user_id, xp)
+            self._users += len(entry[0]) - before
+            if self._users > self.max_users:
+                self._evict(time.monotonic())
+        elif guild_id in self._late_updates:
+            self._late_updates[guild_id][user_id] = xp
+
+    async def _load(self, guild_id: int):
+        self._late_updates[guild_id] = {}
+        current_db_helper.set("xp_index_load")  # runs in its own task, so this only labels the load
         try:
-            cursor.execute("SELECT user_id FROM user_levels WHERE guild_id = %s ORDER BY message_count DESC LIMIT 1", (guild_id,))
-            result = cursor.fetchone()
-            return result[0] if result else None
+            await xp_buffer.flush()
+            rows = await async_db_query("SELECT user_id, xp FROM user_levels WHERE guild_id = %s", (guild_id,), fetch="all")
+            if rows is None:
+                return None
+            index = SortedXPIndex(rows)
+            for user_id, xp in self._late_updates[guild_id].items():
+                index.set_xp(user_id, xp)
+            now = time.monotonic()
+            self._indexes[guild_id] = [index, now]
+            self._users += len(index)
+            self._evict(now)
+            return index
         finally:
-            cursor.close()
-            conn.close()
-    return await async_db_runner(sync_op, guild_id)
+            self._late_updates.pop(guild_id, None)
+            self._tasks.pop(guild_id, None)
+
+    def ensure_loading(self, guild_id: int):
+        """Starts loading a guild's index in the background if it is not loaded or loading yet."""
+        if guild_id not in self._indexes and guild_id not in self._tasks:
+            self._tasks[guild_id] = asyncio.create_task(self._load(guild_id))
+
+    async def load(self, guild_id: int) -> Optional[SortedXPIndex]:
+        """Returns a guild's index, loading it first if needed. Returns None if the database is unavailable."""
+        index = self.get(guild_id)
+        if index is not None:
+            return index
+        self.ensure_loading(guild_id)
+        return await asyncio.shield(self._tasks[guild_id])
+
+guild_xp_indexes = GuildXPIndexes(MEMORY_PROFILES[MEMORY_PROFILE]["xp_index_max_users"], MEMORY_PROFILES[MEMORY_PROFILE]["xp_index_idle_seconds"])
+
+# --- Leveling Engine ---
+
+class LevelingEngine:
+    """Shared XP -> level math. Level L needs xp_multiplier * L * (L + 1) / 2 XP, cached per multiplier as a threshold table."""
+    def __init__(self):
+        self._tables: Dict[int, List[int]] = {}
+
+    def thresholds(self, multiplier: int, xp: int) -> List[int]:
+        """Returns the threshold table for a multiplier, extended until it covers xp."""
+        table = self._tables.setdefault(multiplier, [0])
+        while table[-1] <= xp:
+            level = len(table)
+            table.append(multiplier * level * (level + 1) // 2)
+        return table
+
+    def level_for_xp(self, xp: int, multiplier: int) -> int:
+        if multiplier <= 0:
+            return 0
+        return bisect.bisect_right(self.thresholds(multiplier, xp), xp) - 1
+
+    def levels_for_xp(self, xps: List[int], multiplier: int) -> List[int]:
+        """Batch version of level_for_xp, vectorized with NumPy when it is installed."""
+        if multiplier <= 0:
+            return [0] * len(xps)
+        table = self.thresholds(multiplier, max(xps, default=0))
+        if np is not None:
+            return (np.searchsorted(np.asarray(table, dtype=np.int64), np.asarray(xps, dtype=np.int64), side="right") - 1).tolist()
+        return [bisect.bisect_right(table, xp) - 1 for xp in xps]
+
+level_engine = LevelingEngine()
+
+# --- Member Cache Helpers (Lazy Chunking) ---
+
+def memory_profile_options(name: str) -> Dict[str, Any]:
+    """Client cache options for one of MEMORY_PROFILES."""
+    profile = MEMORY_PROFILES[name]
+    return {
+        "member_cache_flags": discord.MemberCacheFlags.all() if profile["member_cache"] == "all" else discord.MemberCacheFlags.none(),
+        "chunk_guilds_at_startup": profile["chunk_guilds_at_startup"],
+        "max_messages": profile["max_messages"],
+    }
+
+_guild_chunk_locks: Dict[int, asyncio.Lock] = {}
+
+async def guild_members(guild: discord.Guild) -> List[discord.Member]:
+    """Returns every member of a guild, downloading the member list on first use when it was not chunked at startup."""
+    if guild.chunked:
+        return list(guild.members)
+    if MEMORY_PROFILES[MEMORY_PROFILE]["member_cache"] != "all":
+        return await guild.chunk(cache=False)  # nothing is kept, so every caller downloads the list again
+    async with _guild_chunk_locks.setdefault(guild.id, asyncio.Lock()):
+        if not guild.chunked:
+            start = time.perf_counter()
+            await guild.chunk()
+            print(f"Chunked guild {guild.id} ({guild.member_count} members) in {time.perf_counter() - start:.2f}s.")
+    return list(guild.members)
+
+async def get_or_fetch_member(guild: discord.Guild, user_id: int) -> Optional[discord.Member]:
+    """Returns a member from the cache, or fetches it when the memory profile did not cache it. None if they left."""
+    member = guild.get_member(user_id)
+    if member is not None:
+        return member
+    try:
+        return await guild.fetch_member(user_id)
+    except discord.HTTPException:
+        return None
 
-async def async_get_user_rank(guild_id: int, user_id: int) -> Optional[int]:
-    """Fetches the rank of a user based on XP in the guild (Async)."""
-    def sync_op(guild_id, user_id):
-        conn = _get_sync_connection()
-        if not conn: return None
-        cursor = conn.cursor()
-        try:
-            cursor.execute("SELECT user_id, xp FROM user_levels WHERE guild_id = %s ORDER BY xp DESC", (guild_id,))
-            users = cursor.fetchall()
-            for index, user in enumerate(users, start=1):
-                if user[0] == user_id:
-                    return index
+# --- Level Role Index ---
+
+class LevelRoleIndex:
+    """Per-guild sorted index of level_roles, loaded once per guild and kept in sync by async_add_level_role."""
+    def __init__(self):
+        self._levels: Dict[int, List[int]] = {}  # guild_id -> sorted levels that have a role
+        self._roles: Dict[int, Dict[int, int]] = {}  # guild_id -> {level: role_id}
+
+    def is_loaded(self, guild_id: int) -> bool:
+        return guild_id in self._roles
+
+    def load(self, guild_id: int, rows):
+        self._roles[guild_id] = {level: role_id for level, role_id in rows}
+        self._levels[guild_id] = sorted(self._roles[guild_id])
+
+    def set(self, guild_id: int, level: int, role_id: int):
+        """Records a level role for an already loaded guild. Unloaded guilds pick it up on their first load."""
+        roles = self._roles.get(guild_id)
+        if roles is None:
+            return
+        if level not in roles:
+            bisect.insort(self._levels[guild_id], level)
+        roles[level] = role_id
+
+    def invalidate(self, guild_id: int):
+        self._roles.pop(guild_id, None)
+        self._levels.pop(guild_id, None)
+
+    def roles_between(self, guild_id: int, low_level: int, high_level: int) -> List[Tuple[int, int]]:
+        levels = self._levels.get(guild_id, [])
+        start = bisect.bisect_right(levels, low_level)
+        end = bisect.bisect_right(levels, high_level)
+        roles = self._roles.get(guild_id, {})
+        return [(level, roles[level]) for level in levels[start:end]]
+
+level_role_index = LevelRoleIndex()
+
+async def apply_level_roles(member: discord.Member, guild: discord.Guild, level_roles: List[Tuple[int, int]], remove: bool = False) -> List[int]:
+    """Adds (or removes) the roles for a range of levels in a single REST call. Returns the levels whose roles were applied."""
+    roles = []
+    levels = []
+    for level, role_id in level_roles:
+        role = guild.get_role(role_id)
+        if role:
+            roles.append(role)
+            levels.append(level)
+    if not roles:
+        return []
+    try:
+        # atomic=False sends one member edit with the full role list instead of one request per role
+        if remove:
+            await member.remove_roles(*roles, atomic=len(roles) == 1)
+        else:
+            await member.add_roles(*roles, atomic=len(roles) == 1)
+    except discord.HTTPException as e:
+        print(f"Failed to update level roles for {member.id}: {e}")
+        return []
+    return levels
+
+async def reconcile_level_roles(guild: discord.Guild, changes: List[Tuple[int, int, int]]) -> int:
+    """Adds or removes level roles for (user_id, old_level, new_level) changes, MASS_ACTION_CONCURRENCY members at a time.
+    Returns how many members were updated."""
+    semaphore = asyncio.Semaphore(MASS_ACTION_CONCURRENCY)
+    async def reconcile_one(user_id: int, old_level: int, new_level: int) -> bool:
+        async with semaphore:
+            member = await get_or_fetch_member(guild, user_id)
+            if member is None:
+                return False
+            if new_level > old_level:
+                applied = await apply_level_roles(member, guild, await async_get_level_roles_between(guild.id, old_level, new_level))
+            else:
+                applied = await apply_level_roles(member, guild, await async_get_level_roles_between(guild.id, new_level, old_level), remove=True)
+            return bool(applied)
+    return sum(await asyncio.gather(*(reconcile_one(*change) for change in changes)))
+
+# --- XP Cooldown Gate ---
+
+class XPCooldownTracker:
+    """Bounded map of (guild_id, user_id) -> [last_xp_gain, message_count, last_seen], seeded lazily from user_levels."""
+    def __init__(self, max_users: int, idle_seconds: float):
+        self.max_users = max_users
+        self.idle_seconds = idle_seconds
+        self._entries: "OrderedDict[Tuple[int, int], list]" = OrderedDict()
+
+    def _evict(self, now: float):
+        while len(self._entries) > self.max_users:
+            self._entries.popitem(last=False)
+        while self._entries:
+            oldest = next(iter(self._entries.values()))
+            if now - oldest[2] <= self.idle_seconds:
+                break
+            self._entries.popitem(last=False)
+
+    def seed(self, guild_id: int, user_id: int, last_xp_gain: Optional[datetime.datetime], message_count: int):
+        """Records a user's current last_xp_gain and message_count, as seen on the XP path."""
+        now = time.monotonic()
+        key = (guild_id, user_id)
+        self._entries[key] = [last_xp_gain, message_count, now]
+        self._entries.move_to_end(key)
+        self._evict(now)
+
+    def check(self, guild_id: int, user_id: int, cooldown_seconds: float, current_time: datetime.datetime) -> Optional[int]:
+        """Counts the message and returns the new message count if the user is inside their cooldown, else None."""
+        key = (guild_id, user_id)
+        entry = self._entries.get(key)
+        if entry is None or entry[0] is None or (current_time - entry[0]).total_seconds() >= cooldown_seconds:
             return None
+        now = time.monotonic()
+        entry[1] += 1
+        entry[2] = now
+        self._entries.move_to_end(key)
+        self._evict(now)
+        return entry[1]
+
+xp_cooldowns = XPCooldownTracker(XP_COOLDOWN_TRACKER_MAX_USERS, XP_COOLDOWN_TRACKER_IDLE_SECONDS)
+
+# --- Write-Behind XP Buffer (Batched user_levels Upserts) ---
+
+@functools.lru_cache(maxsize=None)
+def xp_flush_upsert(rows: int) -> str:
+    """The multi-row user_levels upsert XPWriteBuffer.flush writes for a chunk of rows (both dialects registered once per size)."""
+    mysql_rows = ", ".join(["(%s, %s, %s, %s, %s, %s)"] * rows)
+    sqlite_rows = ", ".join(["(?, ?, ?, ?, ?, ?)"] * rows)
+    return sqlite_variant(
+        "INSERT INTO user_levels (guild_id, user_id, xp, level, message_count, last_xp_gain) "
+        f"VALUES {mysql_rows} "
+        "ON DUPLICATE KEY UPDATE xp = xp + VALUES(xp), "
+        "level = IF(VALUES(xp) > 0, VALUES(level), level), "
+        "message_count = message_count + VALUES(message_count), "
+        "last_xp_gain = IFNULL(VALUES(last_xp_gain), last_xp_gain)",
+        "INSERT INTO user_levels (guild_id, user_id, xp, level, message_count, last_xp_gain) "
+        f"VALUES {sqlite_rows} "
+        "ON CONFLICT (guild_id, user_id) DO UPDATE SET xp = xp + excluded.xp, "
+        "level = IIF(excluded.xp > 0, excluded.level, level), "
+        "message_count = message_count + excluded.message_count, "
+        "last_xp_gain = IFNULL(excluded.last_xp_gain, last_xp_gain)"
+    )
+
+class XPWriteBuffer:
+    """Accumulates per-user XP and message_count deltas from on_message and flushes them as batched upserts."""
+    def __init__(self, flush_interval: float, max_pending: int):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending: Dict[Tuple[int, int], Dict[str, Any]] = {}
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._size_flush: Optional[asyncio.Task] = None
+
+    def add(self, guild_id: int, user_id: int, xp: int = 0, message_count: int = 0, level: Optional[int] = None, last_xp_gain: Optional[datetime.datetime] = None):
+        """Queues deltas for a user. Callers adding XP must pass the resulting absolute level."""
+        entry = self._pending.setdefault((guild_id, user_id), {'xp': 0, 'message_count': 0, 'level': None, 'last_xp_gain': None})
+        entry['xp'] += xp
+        entry['message_count'] += message_count
+        if level is not None:
+            entry['level'] = level
+        if last_xp_gain is not None:
+            entry['last_xp_gain'] = last_xp_gain
+        if len(self._pending) >= self.max_pending and (self._size_flush is None or self._size_flush.done()) and not db_executor.saturated():
+            self._size_flush = asyncio.create_task(self.flush(low_priority=True))
+
+    def apply_pending(self, guild_id: int, user_id: int, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Returns the stored row for a user with their not-yet-flushed deltas applied."""
+        entry = self._pending.get((guild_id, user_id))
+        if entry is None:
+            return data
+        merged = dict(data)
+        merged['xp'] = (merged['xp'] or 0) + entry['xp']
+        merged['message_count'] = (merged['message_count'] or 0) + entry['message_count']
+        if entry['level'] is not None:
+            merged['level'] = entry['level']
+        if entry['last_xp_gain'] is not None:
+            merged['last_xp_gain'] = entry['last_xp_gain']
+        return merged
+
+    def _requeue(self, batch: Dict[Tuple[int, int], Dict[str, Any]]):
+        """Puts a failed batch back, keeping any newer level/last_xp_gain queued since."""
+        for key, old in batch.items():
+            entry = self._pending.get(key)
+            if entry is None:
+                self._pending[key] = old
+                continue
+            entry['xp'] += old['xp']
+            entry['message_count'] += old['message_count']
+            if entry['level'] is None:
+                entry['level'] = old['level']
+            if entry['last_xp_gain'] is None:
+                entry['last_xp_gain'] = old['last_xp_gain']
+
+    async def flush(self, low_priority: bool = False) -> bool:
+        """Writes every pending delta as multi-row INSERT ... ON DUPLICATE KEY UPDATE statements in one transaction.
+
+        Low-priority (background) flushes are deferred while the DB executor is saturated; the deltas stay queued.
+        Returns False if the batch could not be written and was put back.
+        """
+        token = current_db_helper.set("xp_buffer_flush")  # label for DB metrics and the slow-query log
+        try:
+            async with self._flush_lock:
+                if not self._pending:
+                    return True
+                batch, self._pending = self._pending, {}
+                written = False
+                try:
+                    items = list(batch.items())
+                    statements = []
+                    for start in range(0, len(items), self.max_pending):
+                        chunk = items[start:start + self.max_pending]
+                        params = []
+                        for (guild_id, user_id), entry in chunk:
+                            params.extend([guild_id, user_id, entry['xp'], entry['level'] or 0, entry['message_count'], entry['last_xp_gain']])
+                        statements.append(DBStatement(xp_flush_upsert(len(chunk)), params))
+                    write = asyncio.ensure_future(async_db_transaction(*statements, low_priority=low_priority))
+                    try:
+                        written = await asyncio.shield(write) is not None
+                    except asyncio.CancelledError:
+                        # The transaction may already be committing on a DB thread: wait for its outcome so the batch is neither lost
+                        # nor written twice. Further cancellations are absorbed until it is known; the first one is re-raised below.
+                        while not write.done():
+                            try:
+                                await asyncio.shield(write)
+                            except asyncio.CancelledError:
+                                pass
+                        written = not write.cancelled() and write.exception() is None and write.result() is not None
+                        raise
+                finally:
+                    if not written:
+                        print(f"Warning: failed or deferred flush of {len(batch)} buffered XP updates. They were put back in the buffer.")
+                        self._requeue(batch)
+                return written
         finally:
-            cursor.close()
-            conn.close()
-    return await async_db_runner(sync_op, guild_id, user_id)
+            current_db_helper.reset(token)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush(low_priority=True)
+            except Exception as e:
+                print(f"Error flushing XP buffer: {e}")
+
+    def start(self):
+        """Starts the periodic flush task."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stops the periodic flush task and writes everything still pending, retrying a few times before giving up loudly."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)  # an interrupted flush puts its batch back first
+            self._task = None
+        if self._size_flush is not None:
+            await asyncio.gather(self._size_flush, return_exceptions=True)
+            self._size_flush = None
+        for attempt in range(XP_SHUTDOWN_FLUSH_ATTEMPTS):
+            if await self.flush():
+                return
+            if attempt + 1 < XP_SHUTDOWN_FLUSH_ATTEMPTS:
+                await asyncio.sleep(2 ** attempt)
+        print(f"CRITICAL: {len(self._pending)} buffered XP/message_count updates could not be written at shutdown and are lost.")
+
+xp_buffer = XPWriteBuffer(XP_FLUSH_INTERVAL_SECONDS, XP_FLUSH_MAX_PENDING)
 
 # --- UI Views and Modals (For Ban Appeal) ---
 
@@ -500,6 +2632,109 @@ class BanAppealDMView(View):
     async def appeal_button(self, interaction: discord.Interaction, button: discord.ui.Button):
         await interaction.response.send_modal(BanAppealModal(guild_name=self.guild_name))
 
+# --- UI Views (Leaderboard & Case Log Pagination) ---
+
+class LeaderboardView(View):
+    """Button pagination over a guild's SortedXPIndex. Each page is read straight from the index."""
+    PAGE_SIZE = 10
+    def __init__(self, guild: discord.Guild, index: SortedXPIndex, author_id: int):
+        super().__init__(timeout=300)
+        self.guild = guild
+        self.index = index
+        self.author_id = author_id
+        self.page = 0
+        self._sync_buttons()
+    def page_count(self) -> int:
+        return max(1, math.ceil(len(self.index) / self.PAGE_SIZE))
+    def _sync_buttons(self):
+        self.page = min(self.page, self.page_count() - 1)
+        self.previous_button.disabled = self.page == 0
+        self.next_button.disabled = self.page >= self.page_count() - 1
+    def build_embed(self) -> discord.Embed:
+        entries = self.index.page(self.page * self.PAGE_SIZE, self.PAGE_SIZE)
+        lines = [f"**#{self.index.count_above(xp) + 1}** <@{user_id}> — {xp} XP" for user_id, xp in entries]
+        return create_base_embed(
+            f"🏆 Leaderboard for {self.guild.name}",
+            f"Page {self.page + 1}/{self.page_count()}\n\n" + ("\n".join(lines) if lines else "No ranked users yet."),
+            color=discord.Color.gold()
+        )
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        return interaction.user.id == self.author_id
+    @discord.ui.button(label="Previous", style=discord.ButtonStyle.secondary, emoji="◀️")
+    async def previous_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.page -= 1
+        self._sync_buttons()
+        await interaction.response.edit_message(embed=self.build_embed(), view=self)
+    @discord.ui.button(label="Next", style=discord.ButtonStyle.secondary, emoji="▶️")
+    async def next_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.page += 1
+        self._sync_buttons()
+        await interaction.response.edit_message(embed=self.build_embed(), view=self)
+
+def format_case_entry(log: Dict[str, Any]) -> str:
+    """Formats one case_logs row for the /cases embed."""
+    moderator_mention = f"<@{log['moderator_id']}>"
+    try:
+        timestamp_str = log['timestamp'].strftime("%Y-%m-%d %H:%M UTC")
+    except:
+        timestamp_str = "Unknown Time"
+    duration_info = f" | **Duration:** {log['duration']}" if log['duration'] else ""
+    reason = log['reason'] or ""
+    reason_display = reason[:50] + "..." if len(reason) > 50 else reason
+    return (
+        f"**Case ID:** `{log['id']}` | **Action:** `{log['action']}`{duration_info}\n"
+        f"**Moderator:** {moderator_mention}\n"
+        f"**Reason:** *{reason_display}*\n"
+        f"**Date:** {timestamp_str}\n"
+    )
+
+class CaseLogView(View):
+    """Button pagination over a user's case logs. Pages are loaded on demand with keyset pagination (id < last shown)."""
+    PAGE_SIZE = 10
+    def __init__(self, guild_id: int, user: discord.User, total: int, first_page: List[Dict[str, Any]], author_id: int):
+        super().__init__(timeout=300)
+        self.guild_id = guild_id
+        self.user = user
+        self.total = total
+        self.author_id = author_id
+        self.page = 0
+        self.page_cursors: List[Optional[int]] = [None]  # before_id used to load each visited page
+        self.logs = first_page
+        self._sync_buttons()
+    def page_count(self) -> int:
+        return max(1, math.ceil(self.total / self.PAGE_SIZE))
+    def _sync_buttons(self):
+        self.previous_button.disabled = self.page == 0
+        self.next_button.disabled = len(self.logs) < self.PAGE_SIZE or self.page >= self.page_count() - 1
+    def build_embed(self) -> discord.Embed:
+        first = self.page * self.PAGE_SIZE + 1
+        embed = create_base_embed(
+            f"📋 Case Logs for {self.user.name}",
+            f"Showing cases {first}-{first + len(self.logs) - 1} of {self.total} total cases (page {self.page + 1}/{self.page_count()}).\n\n" + "\n".join(format_case_entry(log) for log in self.logs),
+            color=discord.Color.blue()
+        )
+        embed.set_thumbnail(url=self.user.display_avatar.url)
+        return embed
+    async def _show_page(self, interaction: discord.Interaction, page: int):
+        logs = await async_get_user_caselogs(self.guild_id, self.user.id, before_id=self.page_cursors[page], limit=self.PAGE_SIZE)
+        if not logs:
+            await interaction.response.send_message(embed=create_base_embed("❌ Error", "Could not load that page of cases.", color=discord.Color.red()), ephemeral=True)
+            return
+        self.page = page
+        self.logs = logs
+        self._sync_buttons()
+        await interaction.response.edit_message(embed=self.build_embed(), view=self)
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        return interaction.user.id == self.author_id
+    @discord.ui.button(label="Newer", style=discord.ButtonStyle.secondary, emoji="◀️")
+    async def previous_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self._show_page(interaction, self.page - 1)
+    @discord.ui.button(label="Older", style=discord.ButtonStyle.secondary, emoji="▶️")
+    async def next_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        if len(self.page_cursors) <= self.page + 1:
+            self.page_cursors.append(self.logs[-1]['id'])
+        await self._show_page(interaction, self.page + 1)
+
 # --- Custom Check for /config & /restart ---
 
 def is_admin_or_creator_check():
@@ -514,37 +2749,50 @@ def is_admin_or_creator_check():
 
 # --- Core Bot Class and Setup ---
 
+def bot_intents() -> discord.Intents:
+    intents = discord.Intents.default()
+    intents.members = True
+    intents.message_content = True
+    intents.guilds = True
+    intents.messages = True
+    return intents
+
 class BurgentruckBot(commands.Bot):
     def __init__(self, token: str):
-        intents = discord.Intents.default()
-        intents.members = True
-        intents.message_content = True
-        intents.guilds = True
-        intents.messages = True
-        super().__init__(command_prefix="!", intents=intents)
+        super().__init__(command_prefix="!", intents=bot_intents(), **memory_profile_options(MEMORY_PROFILE))
         self.token = token
         self.initial_config_loaded = False
+    async def setup_hook(self):
+        xp_buffer.start()
+        log_dispatcher.start()
+        instrument_http_client(self.http)
+        if METRICS_ENABLED:
+            await metrics_server.start()
+    async def close(self):
+        if background_tasks:
+            await asyncio.wait(list(background_tasks), timeout=LOG_DRAIN_TIMEOUT_SECONDS)
+        await log_dispatcher.stop()
+        await super().close()
+        await xp_buffer.stop()
+        if db_driver is not None:
+            await db_driver.close()
+        db_executor.shutdown()
+        if db_pool is not None:
+            db_pool.close_all()
+        await metrics_server.stop()
     async def load_initial_config_and_check_db(self):
-        """Loads global config and checks the database connection."""
-        global logging_channel_id
-        def sync_config_op():
-            conn = _get_sync_connection()
-            if not conn:
-                raise mysql.connector.Error("Failed to establish initial database connection for config.")
-            cursor = conn.cursor(dictionary=True)
-            cursor.execute("SELECT name, value FROM bot_config")
-            config = {row['name']: row['value'] for row in cursor.fetchall()}
-            cursor.close()
-            conn.close()
-            return config
+        """Applies the startup config snapshot, reading bot_config now only if startup could not reach the database."""
+        global logging_channel_id, bot_config_snapshot
         try:
-            config = await asyncio.to_thread(sync_config_op)
+            if bot_config_snapshot is None:
+                bot_config_snapshot = await db_executor.submit(fetch_bot_config)
+            config = bot_config_snapshot
             db_log_id = int(config.get("LOGGING_CHANNEL_ID", 0) or 0)
             if db_log_id != 0:
                 logging_channel_id = db_log_id
             print(f"Config loaded successfully: Log Channel ID={logging_channel_id}")
             return True
-        except mysql.connector.Error as err:
+        except (mysql.connector.Error, sqlite3.Error) as err:
             error_desc = f"**Error Type:** `{type(err).__name__}`\n**Message:** {err}"
             await send_log_embed(
                 title="⚠️ CRITICAL DB FAILURE",
@@ -567,10 +2815,11 @@ class BurgentruckBot(commands.Bot):
                 await self.close()
                 sys.exit(1)
                 return
-            await tree.sync()
+            await sync_command_tree(tree)
             self.initial_config_loaded = True
             @self.tree.error
             async def on_app_command_error(interaction: discord.Interaction, error: app_commands.AppCommandError):
+                record_command_latency(interaction, "error")
                 if interaction.response.is_done():
                     send_func = interaction.followup.send
                 else:
@@ -593,82 +2842,87 @@ class BurgentruckBot(commands.Bot):
             await send_log_embed("🚀 Bot Operational", f"Bot is now online and running.", color=discord.Color.green())
 
     async def on_message(self, message: discord.Message):
+        start = time.perf_counter()
+        try:
+            await self.handle_message(message)
+        finally:
+            metrics.observe("on_message_seconds", time.perf_counter() - start)
+
+    async def on_app_command_completion(self, interaction: discord.Interaction, command):
+        record_command_latency(interaction, "ok")
+
+    async def handle_message(self, message: discord.Message):
+        """Leveling, top sender tracking and prefix commands for one message (timed by on_message)."""
         if message.author.bot or not message.guild:
             return
         config = await async_get_level_config(message.guild.id)
         if not config:
-            print(f"No level config found for guild {message.guild.id}. Skipping leveling logic.")
             return
         user_id = message.author.id
         guild_id = message.guild.id
-        user_data = await async_get_user_level(guild_id, user_id)
-        # Check XP cooldown
         current_time = datetime.datetime.utcnow()
         cooldown_seconds = config.get('xp_cooldown_seconds', 60)  # Default to 60 if not set
-        can_gain_xp = True
-        if user_data['last_xp_gain']:
-            last_xp_time = user_data['last_xp_gain']
-            time_diff = (current_time - last_xp_time).total_seconds()
-            if time_diff < cooldown_seconds:
-                can_gain_xp = False
-        new_message_count = user_data['message_count'] + 1
-        if can_gain_xp:
+        # Messages inside a known XP cooldown only bump message_count, so they skip the DB entirely
+        gated_message_count = xp_cooldowns.check(guild_id, user_id, cooldown_seconds, current_time)
+        if gated_message_count is not None:
+            new_message_count = gated_message_count
+            xp_buffer.add(guild_id, user_id, message_count=1)
+        else:
+            # Cooldown check, XP/message_count increments and level recompute in one upsert (a skipped one is counted through the buffer)
             xp_gain = random.randint(config.get('xp_min', 1), config.get('xp_max', 10))
-            new_xp = user_data['xp'] + xp_gain
-            xp_mult = config.get('xp_multiplier', 100)
-            def calc_level(xp: int) -> int:
-                if xp_mult == 0:
-                    return 0
-                discriminant = 1 + 8 * xp / xp_mult
-                return int((-1 + math.sqrt(discriminant)) / 2)
-            old_level = user_data['level']
-            new_level = calc_level(new_xp)
-            await async_update_user_level(guild_id, user_id, xp=new_xp, level=new_level, message_count=new_message_count, last_xp_gain=current_time)
+            result = await async_apply_message_xp(guild_id, user_id, xp_gain, cooldown_seconds, config.get('xp_multiplier', 100), current_time)
+            if result is None:
+                await self.process_commands(message)
+                return
+            if not result['gained']:
+                xp_buffer.add(guild_id, user_id, message_count=1)
+            user_data = xp_buffer.apply_pending(guild_id, user_id, result['row'])
+            new_message_count = user_data['message_count']
+            xp_cooldowns.seed(guild_id, user_id, user_data['last_xp_gain'], new_message_count)
+            old_level = result['old_level']
+            new_level = result['new_level']
+            if result['gained']:
+                guild_xp_indexes.note_xp(guild_id, user_id, user_data['xp'])
             if new_level > old_level:
                 channel_id = config.get('level_up_channel_id')
                 if channel_id:
                     channel = bot.get_channel(channel_id)
                     if channel:
                         msg = f"Congrats {message.author.mention}, you reached level {new_level}!"
-                        roles_added = []
-                        for lvl in range(old_level + 1, new_level + 1):
-                            role_id = await async_get_level_role(guild_id, lvl)
-                            if role_id:
-                                role = message.guild.get_role(role_id)
-                                if role:
-                                    try:
-                                        await message.author.add_roles(role)
-                                        roles_added.append(f"Level {lvl} role")
-                                    except:
-                                        pass
+                        level_roles = await async_get_level_roles_between(guild_id, old_level, new_level)
+                        roles_added = [f"Level {lvl} role" for lvl in await apply_level_roles(message.author, message.guild, level_roles)]
                         if roles_added:
                             msg += f" Gained roles: {', '.join(roles_added)}"
                         await channel.send(msg)
-        else:
-            await async_update_user_level(guild_id, user_id, message_count=new_message_count)
-        # Check for top message sender
-        current_top_id = config.get('current_top_user_id')
-        top_count = 0
-        if current_top_id:
-            top_data = await async_get_user_level(guild_id, current_top_id)
-            top_count = top_data['message_count']
-        if new_message_count > top_count:
-            role_id = config.get('top_message_role_id')
-            if role_id:
-                role = message.guild.get_role(role_id)
-                if role:
-                    if current_top_id:
-                        old_top = message.guild.get_member(current_top_id)
-                        if old_top:
-                            try:
-                                await old_top.remove_roles(role)
-                            except:
-                                pass
-                    try:
-                        await message.author.add_roles(role)
-                    except:
-                        pass
-                    await async_set_level_config(guild_id, 'current_top_user_id', user_id)
+        # Check for top message sender (running maximum kept in memory, seeded once per guild)
+        top = top_senders.get(guild_id)
+        if top is None:
+            current_top_id = config.get('current_top_user_id')
+            top_count = await async_get_message_count(guild_id, current_top_id) if current_top_id else 0
+            if top_count is not None:
+                top = top_senders.set(guild_id, current_top_id, top_count)
+        if top is not None:
+            current_top_id, top_count = top
+            if user_id == current_top_id:
+                top_senders.set(guild_id, user_id, new_message_count)
+            elif new_message_count > top_count:
+                top_senders.set(guild_id, user_id, new_message_count)
+                role_id = config.get('top_message_role_id')
+                if role_id:
+                    role = message.guild.get_role(role_id)
+                    if role:
+                        if current_top_id:
+                            old_top = await get_or_fetch_member(message.guild, current_top_id)
+                            if old_top:
+                                try:
+                                    await old_top.remove_roles(role)
+                                except:
+                                    pass
+                        try:
+                            await message.author.add_roles(role)
+                        except:
+                            pass
+                await async_set_level_config(guild_id, 'current_top_user_id', user_id)
         await self.process_commands(message)
 
 # --- Application Commands: Utility ---
@@ -702,32 +2956,92 @@ async def say_command(ctx: discord.Interaction, channel: discord.TextChannel, me
 
 # --- Application Commands: Moderation ---
 
+# Fire-and-forget work (moderation DMs and their follow-up edits). Strong references keep the tasks alive until they finish.
+background_tasks: set = set()
+
+def track_background_task(coro: Awaitable) -> asyncio.Task:
+    """Runs a coroutine as a background task that is kept referenced until it finishes."""
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+class StepTimer:
+    """Records when each step of a command finished, relative to the command's start, and reports step durations to metrics."""
+    def __init__(self, label: str):
+        self.label = label
+        self.start = time.perf_counter()
+        self.steps: List[Tuple[str, float]] = []
+
+    def mark(self, step: str):
+        self.steps.append((step, time.perf_counter() - self.start))
+
+    def report(self):
+        previous = 0.0
+        for step, elapsed in self.steps:
+            metrics.observe("moderation_step_seconds", elapsed - previous, command=self.label, step=step)
+            previous = elapsed
+        if MODERATION_TIMING_LOG:
+            steps = ", ".join(f"{step} +{elapsed * 1000:.0f}ms" for step, elapsed in self.steps)
+            print(f"Timing [{self.label}]: {steps}")
+
+async def complete_moderation_action(
+    ctx: discord.Interaction,
+    timer: StepTimer,
+    case_coro: Awaitable,
+    dm_coro: Optional[Awaitable],
+    log_title: str,
+    log_color: discord.Color,
+    log_desc: Callable[[Optional[int]], str],
+    followup_embed: Callable[[Optional[int]], discord.Embed],
+    on_dm_done: Optional[Callable[[discord.WebhookMessage, bool], Awaitable]] = None
+):
+    """Runs the side effects of a successful moderation action.
+
+    The DM starts alongside the case insert, and the followup goes out as soon as the case ID is known.
+    """
+    timer.mark("action")
+    dm_task = track_background_task(dm_coro) if dm_coro is not None else None
+    case_id = await case_coro
+    timer.mark("case_log")
+    await send_log_embed(log_title, log_desc(case_id), log_color)
+    message = await ctx.followup.send(embed=followup_embed(case_id), wait=True)
+    timer.mark("followup")
+    if dm_task is None:
+        timer.report()
+        return
+    async def finish_dm():
+        delivered = await dm_task
+        timer.mark("dm")
+        if on_dm_done is not None:
+            try:
+                await on_dm_done(message, delivered)
+            except Exception as e:
+                print(f"Failed to update moderation followup after DM: {e}")
+        timer.report()
+    track_background_task(finish_dm())
+
 @app_commands.command(name="ban", description="Bans a user from the server.")
 @app_commands.checks.has_permissions(ban_members=True)
 async def ban_command(ctx: discord.Interaction, user: discord.User, reason: str = "No reason provided", delete_days: app_commands.Range[int, 0, 7] = 0):
     await ctx.response.defer(thinking=True)
     guild = ctx.guild
     moderator = ctx.user
+    timer = StepTimer("/ban")
     try:
         delete_seconds = delete_days * 24 * 60 * 60  # Convert days to seconds
         await guild.ban(user, reason=reason, delete_message_seconds=delete_seconds)
-        case_id = await async_log_case(user.id, moderator.id, "BAN", reason)
-        appeal_view = BanAppealDMView(guild_name=guild.name)
-        appeal_embed = create_base_embed(
-            f"🚫 You Have Been Banned from {guild.name}",
-            f"**Reason:** {reason}\n\nIf you believe this was in error, click the button below to submit a formal ban appeal to the staff team.",
-            color=discord.Color.red()
-        )
-        user_message = f"{user.mention} has been banned."
-        try:
-            await user.send(embed=appeal_embed, view=appeal_view)
-            user_message = f"{user.mention} has been banned and sent the **appeal form** via DM."
-        except discord.Forbidden:
-            user_message = f"{user.mention} has been banned. **Could not send appeal form via DM.**"
-        log_desc = f"**User:** {user.mention} (`{user.id}`)\n**Moderator:** {moderator.mention}\n**Reason:** {reason}\n**Case ID:** `{case_id}`"
-        await send_log_embed("🔨 User Banned", log_desc, discord.Color.red())
-        await ctx.followup.send(
-            embed=create_base_embed("✅ Ban Successful", user_message, color=discord.Color.green())
+        async def report_dm(message: discord.WebhookMessage, delivered: bool):
+            user_message = f"{user.mention} has been banned and sent the **appeal form** via DM." if delivered else f"{user.mention} has been banned. **Could not send appeal form via DM.**"
+            await message.edit(embed=create_base_embed("✅ Ban Successful", user_message, color=discord.Color.green()))
+        await complete_moderation_action(
+            ctx, timer,
+            async_log_case(guild.id, user.id, moderator.id, "BAN", reason),
+            send_ban_appeal_dm(user, guild.name, reason),
+            "🔨 User Banned", discord.Color.red(),
+            lambda case_id: f"**User:** {user.mention} (`{user.id}`)\n**Moderator:** {moderator.mention}\n**Reason:** {reason}\n**Case ID:** `{case_id}`",
+            lambda case_id: create_base_embed("✅ Ban Successful", f"{user.mention} has been banned. Sending the appeal form via DM...", color=discord.Color.green()),
+            on_dm_done=report_dm
         )
     except discord.Forbidden:
         await ctx.followup.send(embed=create_base_embed("❌ Action Failed", "I do not have permissions to ban that user.", color=discord.Color.dark_red()))
@@ -740,14 +3054,16 @@ async def kick_command(ctx: discord.Interaction, member: discord.Member, reason:
     await ctx.response.defer(thinking=True)
     guild = ctx.guild
     moderator = ctx.user
+    timer = StepTimer("/kick")
     try:
         await member.kick(reason=reason)
-        case_id = await async_log_case(member.id, moderator.id, "KICK", reason)
-        await send_moderation_dm(member, "Kick", guild.name, reason)
-        log_desc = f"**User:** {member.mention} (`{member.id}`)\n**Moderator:** {moderator.mention}\n**Reason:** {reason}\n**Case ID:** `{case_id}`"
-        await send_log_embed("👟 User Kicked", log_desc, discord.Color.orange())
-        await ctx.followup.send(
-            embed=create_base_embed("✅ Kick Successful", f"{member.mention} has been kicked.", color=discord.Color.green())
+        await complete_moderation_action(
+            ctx, timer,
+            async_log_case(guild.id, member.id, moderator.id, "KICK", reason),
+            send_moderation_dm(member, "Kick", guild.name, reason),
+            "👟 User Kicked", discord.Color.orange(),
+            lambda case_id: f"**User:** {member.mention} (`{member.id}`)\n**Moderator:** {moderator.mention}\n**Reason:** {reason}\n**Case ID:** `{case_id}`",
+            lambda case_id: create_base_embed("✅ Kick Successful", f"{member.mention} has been kicked.", color=discord.Color.green())
         )
     except discord.Forbidden:
         await ctx.followup.send(embed=create_base_embed("❌ Action Failed", "I do not have permissions to kick that user.", color=discord.Color.dark_red()))
@@ -760,6 +3076,7 @@ async def unban_command(ctx: discord.Interaction, user_id: str, reason: str = "N
     await ctx.response.defer(thinking=True)
     guild = ctx.guild
     moderator = ctx.user
+    timer = StepTimer("/unban")
     try:
         user_id_int = int(user_id)
     except ValueError:
@@ -771,11 +3088,13 @@ async def unban_command(ctx: discord.Interaction, user_id: str, reason: str = "N
         user = discord.Object(id=user_id_int)
     try:
         await guild.unban(user, reason=reason)
-        case_id = await async_log_case(user_id_int, moderator.id, "UNBAN", reason)
-        log_desc = f"**User:** {user.mention if hasattr(user, 'mention') else user_id_int} (`{user_id_int}`)\n**Moderator:** {moderator.mention}\n**Reason:** {reason}\n**Case ID:** `{case_id}`"
-        await send_log_embed("✅ User Unbanned", log_desc, discord.Color.green())
-        await ctx.followup.send(
-            embed=create_base_embed("✅ Unban Successful", f"User ID `{user_id}` has been unbanned.", color=discord.Color.green())
+        await complete_moderation_action(
+            ctx, timer,
+            async_log_case(guild.id, user_id_int, moderator.id, "UNBAN", reason),
+            None,
+            "✅ User Unbanned", discord.Color.green(),
+            lambda case_id: f"**User:** {user.mention if hasattr(user, 'mention') else user_id_int} (`{user_id_int}`)\n**Moderator:** {moderator.mention}\n**Reason:** {reason}\n**Case ID:** `{case_id}`",
+            lambda case_id: create_base_embed("✅ Unban Successful", f"User ID `{user_id}` has been unbanned.", color=discord.Color.green())
         )
     except discord.NotFound:
         await ctx.followup.send(embed=create_base_embed("❌ Action Failed", f"User ID `{user_id}` is not currently banned or could not be found.", color=discord.Color.dark_red()))
@@ -790,22 +3109,24 @@ async def mute_command(ctx: discord.Interaction, member: discord.Member, duratio
     await ctx.response.defer(thinking=True)
     guild = ctx.guild
     moderator = ctx.user
+    timer = StepTimer("/mute")
     duration = datetime.timedelta(minutes=duration_minutes)
     duration_str = f"{duration_minutes} minutes"
     try:
         await member.timeout(duration, reason=reason)
-        case_id = await async_log_case(member.id, moderator.id, "MUTE", reason, duration_str)
-        await send_moderation_dm(member, "Mute (Timeout)", guild.name, reason, duration_str)
-        log_desc = (
-            f"**User:** {member.mention} (`{member.id}`)\n"
-            f"**Moderator:** {moderator.mention}\n"
-            f"**Duration:** {duration_str}\n"
-            f"**Reason:** {reason}\n"
-            f"**Case ID:** `{case_id}`"
-        )
-        await send_log_embed("🔇 User Muted (Timeout)", log_desc, discord.Color.dark_orange())
-        await ctx.followup.send(
-            embed=create_base_embed("✅ Mute Successful", f"{member.mention} has been muted for {duration_str}.", color=discord.Color.green())
+        await complete_moderation_action(
+            ctx, timer,
+            async_log_case(guild.id, member.id, moderator.id, "MUTE", reason, duration_str),
+            send_moderation_dm(member, "Mute (Timeout)", guild.name, reason, duration_str),
+            "🔇 User Muted (Timeout)", discord.Color.dark_orange(),
+            lambda case_id: (
+                f"**User:** {member.mention} (`{member.id}`)\n"
+                f"**Moderator:** {moderator.mention}\n"
+                f"**Duration:** {duration_str}\n"
+                f"**Reason:** {reason}\n"
+                f"**Case ID:** `{case_id}`"
+            ),
+            lambda case_id: create_base_embed("✅ Mute Successful", f"{member.mention} has been muted for {duration_str}.", color=discord.Color.green())
         )
     except discord.Forbidden:
         await ctx.followup.send(embed=create_base_embed("❌ Action Failed", "I do not have permissions to mute that user.", color=discord.Color.dark_red()))
@@ -818,23 +3139,25 @@ async def unmute_command(ctx: discord.Interaction, member: discord.Member, reaso
     await ctx.response.defer(thinking=True)
     guild = ctx.guild
     moderator = ctx.user
+    timer = StepTimer("/unmute")
     is_timed_out = member.timeout is not None and member.timeout > discord.utils.utcnow()
     if not is_timed_out:
         await ctx.followup.send(embed=create_base_embed("⚠️ Action Failed", f"{member.mention} is not currently timed out (muted).", color=discord.Color.orange()))
         return
     try:
         await member.timeout(None, reason=reason)
-        case_id = await async_log_case(member.id, moderator.id, "UNMUTE", reason)
-        await send_moderation_dm(member, "Unmute", guild.name, reason)
-        log_desc = (
-            f"**User:** {member.mention} (`{member.id}`)\n"
-            f"**Moderator:** {moderator.mention}\n"
-            f"**Reason:** {reason}\n"
-            f"**Case ID:** `{case_id}`"
-        )
-        await send_log_embed("🔊 User Unmuted (Timeout Removed)", log_desc, discord.Color.green())
-        await ctx.followup.send(
-            embed=create_base_embed("✅ Unmute Successful", f"{member.mention}'s timeout has been removed.", color=discord.Color.green())
+        await complete_moderation_action(
+            ctx, timer,
+            async_log_case(guild.id, member.id, moderator.id, "UNMUTE", reason),
+            send_moderation_dm(member, "Unmute", guild.name, reason),
+            "🔊 User Unmuted (Timeout Removed)", discord.Color.green(),
+            lambda case_id: (
+                f"**User:** {member.mention} (`{member.id}`)\n"
+                f"**Moderator:** {moderator.mention}\n"
+                f"**Reason:** {reason}\n"
+                f"**Case ID:** `{case_id}`"
+            ),
+            lambda case_id: create_base_embed("✅ Unmute Successful", f"{member.mention}'s timeout has been removed.", color=discord.Color.green())
         )
     except discord.Forbidden:
         await ctx.followup.send(embed=create_base_embed("❌ Action Failed", "I do not have permissions to remove timeout from that user.", color=discord.Color.dark_red()))
@@ -847,18 +3170,20 @@ async def warn_command(ctx: discord.Interaction, member: discord.Member, reason:
     await ctx.response.defer(thinking=True)
     guild = ctx.guild
     moderator = ctx.user
+    timer = StepTimer("/warn")
     try:
-        case_id = await async_log_case(member.id, moderator.id, "WARN", reason)
-        await send_moderation_dm(member, "Warning", guild.name, reason)
-        log_desc = (
-            f"**User:** {member.mention} (`{member.id}`)\n"
-            f"**Moderator:** {moderator.mention}\n"
-            f"**Reason:** {reason}\n"
-            f"**Case ID:** `{case_id}`"
-        )
-        await send_log_embed("⚠️ User Warned", log_desc, discord.Color.gold())
-        await ctx.followup.send(
-            embed=create_base_embed("✅ Warning Issued", f"{member.mention} has been warned. Case ID: `{case_id}`", color=discord.Color.green())
+        await complete_moderation_action(
+            ctx, timer,
+            async_log_case(guild.id, member.id, moderator.id, "WARN", reason),
+            send_moderation_dm(member, "Warning", guild.name, reason),
+            "⚠️ User Warned", discord.Color.gold(),
+            lambda case_id: (
+                f"**User:** {member.mention} (`{member.id}`)\n"
+                f"**Moderator:** {moderator.mention}\n"
+                f"**Reason:** {reason}\n"
+                f"**Case ID:** `{case_id}`"
+            ),
+            lambda case_id: create_base_embed("✅ Warning Issued", f"{member.mention} has been warned. Case ID: `{case_id}`", color=discord.Color.green())
         )
     except Exception as e:
         await ctx.followup.send(embed=create_base_embed("❌ Error", f"An unexpected error occurred: {e}", color=discord.Color.dark_red()))
@@ -867,36 +3192,176 @@ async def warn_command(ctx: discord.Interaction, member: discord.Member, reason:
 @app_commands.checks.has_permissions(moderate_members=True)
 async def cases_command(ctx: discord.Interaction, user: discord.User):
     await ctx.response.defer(thinking=True)
-    logs = await async_get_user_caselogs(user.id)
+    total = await async_count_user_caselogs(ctx.guild.id, user.id)
+    logs = await async_get_user_caselogs(ctx.guild.id, user.id, limit=CaseLogView.PAGE_SIZE) if total else None
     if not logs:
         embed = create_base_embed("✅ Case Logs", f"{user.mention} has no recorded moderation cases.", color=discord.Color.green())
         await ctx.followup.send(embed=embed)
         return
-    description_parts = []
-    for log in logs:
-        moderator_mention = f"<@{log['moderator_id']}>"
+    view = CaseLogView(ctx.guild.id, user, total, logs, ctx.user.id)
+    if total > CaseLogView.PAGE_SIZE:
+        await ctx.followup.send(embed=view.build_embed(), view=view)
+    else:
+        await ctx.followup.send(embed=view.build_embed())
+
+# --- Application Commands: Raid Response (Bulk Moderation) ---
+
+BULK_BAN_MAX_USERS = 200 # Discord's limit per bulk ban request
+
+async def resolve_mass_targets(guild: discord.Guild, moderator: discord.abc.User, user_ids: Optional[str], joined_within_minutes: Optional[int]) -> List[int]:
+    """Collects target IDs from a pasted ID/mention list and/or members who joined recently (chunks the guild if needed)."""
+    targets: Dict[int, None] = {}
+    if user_ids:
+        for match in re.findall(r"\d{15,21}", user_ids):
+            targets[int(match)] = None
+    if joined_within_minutes:
+        cutoff = discord.utils.utcnow() - datetime.timedelta(minutes=joined_within_minutes)
+        for member in await guild_members(guild):
+            if member.joined_at and member.joined_at >= cutoff and not member.bot:
+                targets[member.id] = None
+    protected = {moderator.id, guild.owner_id, bot.user.id if bot.user else 0}
+    return [user_id for user_id in targets if user_id not in protected][:MASS_ACTION_MAX_TARGETS]
+
+class MassActionProgress:
+    """Keeps a followup message updated with the progress of a bulk moderation run."""
+    def __init__(self, title: str, total: int):
+        self.title = title
+        self.total = total
+        self.succeeded: List[int] = []
+        self.failed: List[int] = []
+        self.message: Optional[discord.WebhookMessage] = None
+        self._last_edit = 0.0
+
+    def build_embed(self, finished: bool = False) -> discord.Embed:
+        done = len(self.succeeded) + len(self.failed)
+        status = "Finished" if finished else "Working"
+        description = f"**{status}:** `{done}/{self.total}` processed\n**Succeeded:** `{len(self.succeeded)}`\n**Failed:** `{len(self.failed)}`"
+        return create_base_embed(self.title, description, color=discord.Color.green() if finished else discord.Color.orange())
+
+    async def start(self, ctx: discord.Interaction):
+        self.message = await ctx.followup.send(embed=self.build_embed(), wait=True)
+        self._last_edit = time.monotonic()
+
+    async def update(self, finished: bool = False):
+        """Edits the progress message, at most once per MASS_ACTION_PROGRESS_INTERVAL_SECONDS unless finished."""
+        if self.message is None:
+            return
+        if not finished and time.monotonic() - self._last_edit < MASS_ACTION_PROGRESS_INTERVAL_SECONDS:
+            return
+        self._last_edit = time.monotonic()
         try:
-            timestamp_str = log['timestamp'].strftime("%Y-%m-%d %H:%M UTC")
-        except:
-            timestamp_str = "Unknown Time"
-        duration_info = f" | **Duration:** {log['duration']}" if log['duration'] else ""
-        reason_display = log['reason'][:50] + "..." if len(log['reason']) > 50 else log['reason']
-        case_entry = (
-            f"**Case ID:** `{log['id']}` | **Action:** `{log['action']}`{duration_info}\n"
-            f"**Moderator:** {moderator_mention}\n"
-            f"**Reason:** *{reason_display}*\n"
-            f"**Date:** {timestamp_str}\n"
-        )
-        description_parts.append(case_entry)
-    display_logs = description_parts[:10]
-    more_info = f"\n...and **{len(logs) - 10}** more old cases not shown." if len(logs) > 10 else ""
-    embed = create_base_embed(
-        f"📋 Case Logs for {user.name}",
-        f"Showing {len(display_logs)} of {len(logs)} total cases.\n\n" + "\n".join(display_logs) + more_info,
-        color=discord.Color.blue()
-    )
-    embed.set_thumbnail(url=user.display_avatar.url)
-    await ctx.followup.send(embed=embed)
+            await self.message.edit(embed=self.build_embed(finished))
+        except discord.HTTPException as e:
+            print(f"Failed to update mass action progress: {e}")
+
+def format_mass_action_log(progress: MassActionProgress, moderator: discord.abc.User, reason: str, duration_str: Optional[str] = None) -> str:
+    lines = [
+        f"**Moderator:** {moderator.mention}",
+        f"**Targets:** `{progress.total}`  **Succeeded:** `{len(progress.succeeded)}`  **Failed:** `{len(progress.failed)}`",
+    ]
+    if duration_str:
+        lines.append(f"**Duration:** {duration_str}")
+    lines.append(f"**Reason:** {reason}")
+    if progress.succeeded:
+        shown = ", ".join(f"`{user_id}`" for user_id in progress.succeeded[:50])
+        more = f" and {len(progress.succeeded) - 50} more" if len(progress.succeeded) > 50 else ""
+        lines.append(f"**Users:** {shown}{more}")
+    return "\n".join(lines)
+
+@app_commands.command(name="massban", description="Bans many users at once (ID list and/or recent joins).")
+@app_commands.checks.has_permissions(ban_members=True)
+@app_commands.describe(
+    user_ids="User IDs or mentions, separated by spaces or commas.",
+    joined_within_minutes="Also ban every member who joined within this many minutes.",
+    delete_days="Days of messages to delete (0-7)."
+)
+async def massban_command(ctx: discord.Interaction, reason: str, user_ids: Optional[str] = None, joined_within_minutes: Optional[app_commands.Range[int, 1, 1440]] = None, delete_days: app_commands.Range[int, 0, 7] = 0):
+    await ctx.response.defer(thinking=True)
+    guild = ctx.guild
+    moderator = ctx.user
+    targets = await resolve_mass_targets(guild, moderator, user_ids, joined_within_minutes)
+    if not targets:
+        await ctx.followup.send(embed=create_base_embed("❌ No Targets", "Provide `user_ids` and/or `joined_within_minutes` that match at least one user.", color=discord.Color.dark_red()))
+        return
+    timer = StepTimer("/massban")
+    progress = MassActionProgress("🔨 Mass Ban", len(targets))
+    await progress.start(ctx)
+    delete_seconds = delete_days * 24 * 60 * 60
+    semaphore = asyncio.Semaphore(MASS_ACTION_CONCURRENCY)
+    async def ban_one(user_id: int):
+        async with semaphore:
+            try:
+                await guild.ban(discord.Object(id=user_id), reason=reason, delete_message_seconds=delete_seconds)
+                progress.succeeded.append(user_id)
+            except discord.HTTPException:
+                progress.failed.append(user_id)
+            await progress.update()
+    use_bulk = hasattr(guild, "bulk_ban")
+    for start in range(0, len(targets), BULK_BAN_MAX_USERS):
+        chunk = targets[start:start + BULK_BAN_MAX_USERS]
+        if use_bulk:
+            try:
+                result = await guild.bulk_ban([discord.Object(id=user_id) for user_id in chunk], reason=reason, delete_message_seconds=delete_seconds)
+                progress.succeeded.extend(user.id for user in result.banned)
+                progress.failed.extend(user.id for user in result.failed)
+                await progress.update()
+                continue
+            except discord.Forbidden as e:
+                # Bulk ban also needs Manage Server; plain bans only need Ban Members
+                print(f"Bulk ban not permitted ({e}). Banning users one by one instead.")
+                use_bulk = False
+            except discord.HTTPException as e:
+                print(f"Bulk ban of {len(chunk)} users failed: {e}. Banning this chunk one by one instead.")
+        await asyncio.gather(*(ban_one(user_id) for user_id in chunk))
+    timer.mark("bans")
+    await async_log_cases_bulk(guild.id, progress.succeeded, moderator.id, "BAN", reason)
+    timer.mark("case_log")
+    await send_log_embed("🔨 Mass Ban", format_mass_action_log(progress, moderator, reason), discord.Color.red())
+    await progress.update(finished=True)
+    timer.mark("followup")
+    timer.report()
+
+@app_commands.command(name="masstimeout", description="Times out many members at once (ID list and/or recent joins).")
+@app_commands.checks.has_permissions(moderate_members=True)
+@app_commands.describe(
+    duration_minutes="Timeout length in minutes (max 28 days).",
+    user_ids="User IDs or mentions, separated by spaces or commas.",
+    joined_within_minutes="Also time out every member who joined within this many minutes."
+)
+async def masstimeout_command(ctx: discord.Interaction, duration_minutes: app_commands.Range[int, 1, 40320], reason: str, user_ids: Optional[str] = None, joined_within_minutes: Optional[app_commands.Range[int, 1, 1440]] = None):
+    await ctx.response.defer(thinking=True)
+    guild = ctx.guild
+    moderator = ctx.user
+    targets = await resolve_mass_targets(guild, moderator, user_ids, joined_within_minutes)
+    if not targets:
+        await ctx.followup.send(embed=create_base_embed("❌ No Targets", "Provide `user_ids` and/or `joined_within_minutes` that match at least one member.", color=discord.Color.dark_red()))
+        return
+    timer = StepTimer("/masstimeout")
+    duration = datetime.timedelta(minutes=duration_minutes)
+    duration_str = f"{duration_minutes} minutes"
+    progress = MassActionProgress("🔇 Mass Timeout", len(targets))
+    await progress.start(ctx)
+    semaphore = asyncio.Semaphore(MASS_ACTION_CONCURRENCY)
+    async def timeout_one(user_id: int):
+        async with semaphore:
+            member = await get_or_fetch_member(guild, user_id)
+            if member is None:
+                progress.failed.append(user_id)  # timeouts only apply to current members
+                return
+            try:
+                await member.timeout(duration, reason=reason)
+                progress.succeeded.append(user_id)
+            except discord.HTTPException:
+                progress.failed.append(user_id)
+            await progress.update()
+    await asyncio.gather(*(timeout_one(user_id) for user_id in targets))
+    timer.mark("timeouts")
+    await async_log_cases_bulk(guild.id, progress.succeeded, moderator.id, "MUTE", reason, duration_str)
+    timer.mark("case_log")
+    await send_log_embed("🔇 Mass Timeout", format_mass_action_log(progress, moderator, reason, duration_str), discord.Color.dark_orange())
+    await progress.update(finished=True)
+    timer.mark("followup")
+    timer.report()
 
 # --- Utility Commands (/ping, /help, /userinfo, /dashboard) ---
 
@@ -944,17 +3409,17 @@ async def help_command(ctx: discord.Interaction):
     )
     embed.add_field(
         name="🛡️ Moderation", 
-        value="`/ban`, `/unban`, `/kick`, `/mute`, `/unmute`, `/warn`, `/cases`",
+        value="`/ban`, `/unban`, `/kick`, `/mute`, `/unmute`, `/warn`, `/cases`, `/massban`, `/masstimeout`",
         inline=False
     )
     embed.add_field(
         name="⚙️ Utility & Config",
-        value="`/config`, `/ping`, `/userinfo`, `/dashboard`, `/say`, `/restart` (Admin/Creator only)",
+        value="`/config`, `/ping`, `/userinfo`, `/dashboard`, `/say`, `/restart`, `/sync`, `/debug stats` (Admin/Creator only)",
         inline=False
     )
     embed.add_field(
         name="📈 Leveling",
-        value="`/level add_xp`, `/level remove_xp`, `/level set_role`, `/level set_xp_range`, `/level set_xp_multiplier`, `/level set_xp_cooldown`, `/level set_level_up_channel`, `/level set_top_role`, `/level update_top`, `/level rank`",
+        value="`/level add_xp`, `/level remove_xp`, `/level set_role`, `/level set_xp_range`, `/level set_xp_multiplier`, `/level set_xp_cooldown`, `/level set_level_up_channel`, `/level set_top_role`, `/level refresh_config`, `/level update_top`, `/level rank`, `/level leaderboard`",
         inline=False
     )
     await ctx.response.send_message(embed=embed, ephemeral=True)
@@ -987,12 +3452,26 @@ async def config_command(
     await ctx.response.defer(thinking=True, ephemeral=True)
     if action.lower() == "view":
         current_config = await async_db_runner(fetch_bot_config)
+        if current_config is None and db_breaker.is_open() and bot_config_snapshot is not None:
+            current_config = dict(bot_config_snapshot)  # database is down: show the startup snapshot
         if current_config is None:
             await ctx.followup.send(embed=create_base_embed("❌ Error", "Could not fetch configuration. Database connection failed.", color=discord.Color.red()), ephemeral=True)
             return
         config_str = "\n".join([f"**{k}:** `{v}`" for k, v in current_config.items()])
         config_str = config_str if config_str else "No configuration keys found in the database."
         config_str += f"\n\n**Current Runtime Logging ID:** `{logging_channel_id}`"
+        if db_pool is not None:
+            pool_stats = db_pool.stats()
+            config_str += f"\n**DB Pool:** `{pool_stats['in_use']}/{pool_stats['size']}` in use, `{pool_stats['exhausted']}` exhausted checkouts, `{pool_stats['waits']}` waits"
+        if isinstance(db_driver, SQLiteDriver):
+            sqlite_stats = db_driver.stats()
+            config_str += f"\n**SQLite Writer:** `{sqlite_stats['write_queue']}` queued, `{sqlite_stats['writes']}` writes in `{sqlite_stats['commits']}` commits, `{sqlite_stats['failed_writes']}` failed"
+        executor_stats = db_executor.stats()
+        config_str += f"\n**DB Executor:** `{executor_stats['in_flight']}/{executor_stats['workers']}` running, `{executor_stats['queued']}` queued, wait p99 `{executor_stats['wait_p99_ms']:.1f}ms`, `{executor_stats['shed']}` deferred low-priority writes"
+        breaker_stats = db_breaker.stats()
+        config_str += f"\n**DB Circuit Breaker:** `{breaker_stats['state']}`, opened `{breaker_stats['opened']}` times, `{breaker_stats['rejected']}` calls rejected, `{breaker_stats['busy']}` found the pool exhausted"
+        log_stats = log_dispatcher.stats()
+        config_str += f"\n**Log Queue:** `{log_stats['depth']}/{log_stats['max_size']}` queued, `{log_stats['embeds_sent']}` posted in `{log_stats['messages_sent']}` messages, `{log_stats['dropped']}` dropped"
         embed = create_base_embed("⚙️ Bot Configuration", config_str, color=discord.Color.blue())
         await ctx.followup.send(embed=embed, ephemeral=True)
     elif action.lower() == "set":
@@ -1002,6 +3481,8 @@ async def config_command(
         key = key.upper().strip()
         value = value.strip()
         await async_set_bot_config(key, value)
+        if bot_config_snapshot is not None:
+            bot_config_snapshot[key] = value
         if key == "LOGGING_CHANNEL_ID":
             try:
                 logging_channel_id = int(value)
@@ -1023,6 +3504,90 @@ async def restart_command(ctx: discord.Interaction):
     await bot.close()
     sys.exit(0)
 
+def command_tree_fingerprint(tree: app_commands.CommandTree) -> str:
+    """Returns a stable hash of the registered global commands, as they would be uploaded to Discord."""
+    payloads = []
+    for command in tree.get_commands():
+        try:
+            payloads.append(command.to_dict(tree))
+        except TypeError:  # discord.py releases before 2.4 take no tree argument
+            payloads.append(command.to_dict())
+    payloads.sort(key=lambda payload: (payload.get("type", 1), payload["name"]))
+    return hashlib.sha256(json.dumps(payloads, sort_keys=True, separators=(",", ":"), default=str).encode()).hexdigest()
+
+async def sync_command_tree(tree: app_commands.CommandTree, force: bool = False) -> Optional[int]:
+    """Uploads the command tree if it changed since the last sync (or when forced). Returns the synced command count, or None if skipped."""
+    fingerprint = command_tree_fingerprint(tree)
+    stored = (bot_config_snapshot or {}).get(COMMAND_TREE_FINGERPRINT_KEY)
+    if not force and stored == fingerprint:
+        print(f"Command tree unchanged (fingerprint {fingerprint[:12]}); skipping sync.")
+        return None
+    synced = await tree.sync()
+    await async_set_bot_config(COMMAND_TREE_FINGERPRINT_KEY, fingerprint)
+    if bot_config_snapshot is not None:
+        bot_config_snapshot[COMMAND_TREE_FINGERPRINT_KEY] = fingerprint
+    print(f"Synced {len(synced)} application commands (fingerprint {fingerprint[:12]}).")
+    return len(synced)
+
+@app_commands.command(name="sync", description="Force re-uploads slash commands to Discord (Bot Creator or Admin only).")
+@is_admin_or_creator_check()
+async def sync_command(ctx: discord.Interaction):
+    await ctx.response.defer(thinking=True, ephemeral=True)
+    try:
+        count = await sync_command_tree(bot.tree, force=True)
+    except discord.HTTPException as e:
+        await ctx.followup.send(embed=create_base_embed("❌ Sync Failed", f"Discord rejected the command sync: {e}", color=discord.Color.red()), ephemeral=True)
+        return
+    log_desc = f"Command sync forced by {ctx.user.mention} (`{ctx.user.id}`). `{count}` commands uploaded."
+    await send_log_embed("🔁 Commands Synced", log_desc, discord.Color.blue())
+    await ctx.followup.send(embed=create_base_embed("✅ Commands Synced", f"Uploaded `{count}` commands to Discord.", color=discord.Color.green()), ephemeral=True)
+
+debug_group = app_commands.Group(name="debug", description="Diagnostics (Bot Creator or Admin only)")
+
+def format_latency_lines(name: str, label: str, limit: int) -> str:
+    """Summarizes one histogram family as '`label` count p50/p99' lines, busiest first."""
+    series = sorted(metrics.histograms(name).items(), key=lambda item: -item[1].count)[:limit]
+    lines = []
+    for key, histogram in series:
+        labels = dict(key)
+        title = labels.get(label, "all")
+        if labels.get("status", "ok") != "ok":
+            title += f" ({labels['status']})"
+        lines.append(f"`{title}` {histogram.count}× · p50 `{histogram.quantile(0.5) * 1000:.0f}ms` · p99 `{histogram.quantile(0.99) * 1000:.0f}ms`")
+    return "\n".join(lines) or "No samples yet."
+
+def format_db_time_by_helper(limit: int) -> str:
+    """Ranks helpers by total statement execution time, so the one dominating DB time is listed first."""
+    series = sorted(metrics.histograms("db_statement_seconds").items(), key=lambda item: -item[1].sum)
+    total = sum(histogram.sum for _, histogram in series) or 1.0  # share of all DB time, not just of the rows shown
+    series = series[:limit]
+    lines = [f"`{dict(key).get('helper', 'other')}` `{histogram.sum:.2f}s` ({histogram.sum / total:.0%}) over {histogram.count} statements" for key, histogram in series]
+    return "\n".join(lines) or "No samples yet."
+
+@debug_group.command(name="stats", description="Shows command, database, on_message and REST latency.")
+@is_admin_or_creator_check()
+async def debug_stats(ctx: discord.Interaction):
+    embed = create_base_embed("🩺 Debug Stats", f"Full histograms: `http://{METRICS_HOST}:{METRICS_PORT}/metrics`" if METRICS_ENABLED else None, color=discord.Color.blue())
+    embed.add_field(name="Commands", value=format_latency_lines("command_latency_seconds", "command", 8)[:1024], inline=False)
+    embed.add_field(name="DB Helpers", value=format_latency_lines("db_helper_seconds", "helper", 8)[:1024], inline=False)
+    embed.add_field(name="DB Execution", value=format_latency_lines("db_query_seconds", "helper", 5)[:1024], inline=False)
+    embed.add_field(name="DB Time by Helper", value=format_db_time_by_helper(5)[:1024], inline=False)
+    embed.add_field(name="on_message", value=format_latency_lines("on_message_seconds", "", 1), inline=False)
+    embed.add_field(name="Discord REST", value=format_latency_lines("discord_rest_seconds", "route", 5)[:1024], inline=False)
+    executor_stats = db_executor.stats()
+    load = [
+        f"**DB Executor:** `{executor_stats['in_flight']}/{executor_stats['workers']}` running, `{executor_stats['queued']}` queued, wait p99 `{executor_stats['wait_p99_ms']:.1f}ms`",
+        f"**DB Breaker:** `{db_breaker.state}`",
+        f"**Log Queue:** `{log_dispatcher.depth()}`",
+        f"**Caches:** `{MEMORY_PROFILE}` profile, `{sum(len(guild.members) for guild in bot.guilds)}` members, `{len(bot.cached_messages)}` messages",
+    ]
+    if db_pool is not None:
+        load.insert(0, f"**DB Pool:** `{db_pool.stats()['in_use']}/{db_pool.size}` in use")
+    if isinstance(db_driver, SQLiteDriver):
+        load.insert(0, f"**SQLite Writer:** `{db_driver.stats()['write_queue']}` queued")
+    embed.add_field(name="Load", value="\n".join(load), inline=False)
+    await ctx.response.send_message(embed=embed, ephemeral=True)
+
 # --- Leveling Commands ---
 
 level_group = app_commands.Group(name="level", description="Leveling system commands")
@@ -1038,34 +3603,21 @@ async def add_xp(ctx: discord.Interaction, member: discord.Member, amount: app_c
     if not config:
         await ctx.followup.send(embed=create_base_embed("❌ Error", "Leveling system not configured for this server.", color=discord.Color.red()))
         return
+    await xp_buffer.flush()  # absolute writes below must not be re-applied by a later buffered delta
     user_data = await async_get_user_level(guild_id, user_id)
     old_level = user_data['level']
     new_xp = user_data['xp'] + amount
-    xp_mult = config.get('xp_multiplier', 100)
-    def calc_level(xp: int) -> int:
-        if xp_mult == 0:
-            return 0
-        discriminant = 1 + 8 * xp / xp_mult
-        return int((-1 + math.sqrt(discriminant)) / 2)
-    new_level = calc_level(new_xp)
+    new_level = level_engine.level_for_xp(new_xp, config.get('xp_multiplier', 100))
     await async_update_user_level(guild_id, user_id, xp=new_xp, level=new_level)
+    guild_xp_indexes.note_xp(guild_id, user_id, new_xp)
     if new_level > old_level:
         channel_id = config.get('level_up_channel_id')
         if channel_id:
             channel = bot.get_channel(channel_id)
             if channel:
                 msg = f"Congrats {member.mention}, you reached level {new_level} via admin add!"
-                roles_added = []
-                for lvl in range(old_level + 1, new_level + 1):
-                    role_id = await async_get_level_role(guild_id, lvl)
-                    if role_id:
-                        role = ctx.guild.get_role(role_id)
-                        if role:
-                            try:
-                                await member.add_roles(role)
-                                roles_added.append(f"Level {lvl} role")
-                            except:
-                                pass
+                level_roles = await async_get_level_roles_between(guild_id, old_level, new_level)
+                roles_added = [f"Level {lvl} role" for lvl in await apply_level_roles(member, ctx.guild, level_roles)]
                 if roles_added:
                     msg += f" Gained roles: {', '.join(roles_added)}"
                 await channel.send(msg)
@@ -1082,27 +3634,16 @@ async def remove_xp(ctx: discord.Interaction, member: discord.Member, amount: ap
     if not config:
         await ctx.followup.send(embed=create_base_embed("❌ Error", "Leveling system not configured for this server.", color=discord.Color.red()))
         return
+    await xp_buffer.flush()  # absolute writes below must not be re-applied by a later buffered delta
     user_data = await async_get_user_level(guild_id, user_id)
     old_level = user_data['level']
     new_xp = max(0, user_data['xp'] - amount)
-    xp_mult = config.get('xp_multiplier', 100)
-    def calc_level(xp: int) -> int:
-        if xp_mult == 0:
-            return 0
-        discriminant = 1 + 8 * xp / xp_mult
-        return int((-1 + math.sqrt(discriminant)) / 2)
-    new_level = calc_level(new_xp)
+    new_level = level_engine.level_for_xp(new_xp, config.get('xp_multiplier', 100))
     await async_update_user_level(guild_id, user_id, xp=new_xp, level=new_level)
+    guild_xp_indexes.note_xp(guild_id, user_id, new_xp)
     if new_level < old_level:
-        for lvl in range(new_level + 1, old_level + 1):
-            role_id = await async_get_level_role(guild_id, lvl)
-            if role_id:
-                role = ctx.guild.get_role(role_id)
-                if role:
-                    try:
-                        await member.remove_roles(role)
-                    except:
-                        pass
+        level_roles = await async_get_level_roles_between(guild_id, new_level, old_level)
+        await apply_level_roles(member, ctx.guild, level_roles, remove=True)
     await ctx.followup.send(embed=create_base_embed("✅ XP Removed", f"Removed {amount} XP from {member.mention}. New level: {new_level}.", color=discord.Color.green()))
 
 @level_group.command(name="set_role", description="Set a role for a specific level.")
@@ -1131,7 +3672,22 @@ async def set_xp_range(ctx: discord.Interaction, min_xp: app_commands.Range[int,
 async def set_xp_multiplier(ctx: discord.Interaction, multiplier: app_commands.Range[int, 1, 1000]):
     await ctx.response.defer(thinking=True)
     await async_set_level_config(ctx.guild.id, 'xp_multiplier', multiplier)
-    await ctx.followup.send(embed=create_base_embed("✅ Config Updated", f"XP multiplier set to {multiplier}.", color=discord.Color.green()))
+    crossed = await async_recompute_guild_levels(ctx.guild.id, multiplier)
+    if crossed is None:
+        await ctx.followup.send(embed=create_base_embed("⚠️ Config Updated", f"XP multiplier set to {multiplier}, but stored levels could not be recomputed. Database connection failed.", color=discord.Color.orange()))
+        return
+    if crossed:
+        # Role edits are one REST call per member, so they run after the reply instead of holding the interaction open
+        guild = ctx.guild
+        async def update_roles():
+            try:
+                members_updated = await reconcile_level_roles(guild, crossed)
+            except Exception as e:
+                print(f"Failed to update level roles after the XP multiplier change in guild {guild.id}: {e}")
+                return
+            await send_log_embed("🎚️ Level Roles Updated", f"XP multiplier change in **{guild.name}**: level roles updated for `{members_updated}/{len(crossed)}` member(s).", discord.Color.blue())
+        track_background_task(update_roles())
+    await ctx.followup.send(embed=create_base_embed("✅ Config Updated", f"XP multiplier set to {multiplier}. Levels recomputed; {len(crossed)} member(s) crossed a level role, their roles are being updated in the background.", color=discord.Color.green()))
 
 @level_group.command(name="set_xp_cooldown", description="Set the XP gain cooldown in seconds.")
 @is_admin_or_creator_check()
@@ -1157,6 +3713,18 @@ async def set_top_role(ctx: discord.Interaction, role: discord.Role):
     await async_set_level_config(ctx.guild.id, 'top_message_role_id', role.id)
     await ctx.followup.send(embed=create_base_embed("✅ Config Updated", f"Top message role set to {role.mention}.", color=discord.Color.green()))
 
+@level_group.command(name="refresh_config", description="Reload this server's leveling config from the database.")
+@is_admin_or_creator_check()
+async def refresh_level_config(ctx: discord.Interaction):
+    await ctx.response.defer(thinking=True)
+    level_config_cache.invalidate(ctx.guild.id)
+    top_senders.invalidate(ctx.guild.id)
+    config = await async_get_level_config(ctx.guild.id)
+    if config:
+        await ctx.followup.send(embed=create_base_embed("✅ Config Reloaded", "Leveling config reloaded from the database.", color=discord.Color.green()))
+    else:
+        await ctx.followup.send(embed=create_base_embed("⚠️ Config Reloaded", "No leveling config found for this server.", color=discord.Color.orange()))
+
 @level_group.command(name="update_top", description="Update the top message sender role.")
 @is_admin_or_creator_check()
 async def update_top(ctx: discord.Interaction):
@@ -1166,21 +3734,24 @@ async def update_top(ctx: discord.Interaction):
     if not config or not config.get('top_message_role_id'):
         await ctx.followup.send(embed=create_base_embed("❌ Error", "Top role not configured.", color=discord.Color.red()))
         return
-    top_user_id = await async_get_top_user(guild_id)
-    if not top_user_id:
+    await xp_buffer.flush()
+    top = await async_get_top_user(guild_id)
+    if not top:
         await ctx.followup.send(embed=create_base_embed("❌ Error", "No users found.", color=discord.Color.red()))
         return
+    top_user_id, top_count = top
+    top_senders.set(guild_id, top_user_id, top_count)
     current_top_id = config.get('current_top_user_id')
     role = ctx.guild.get_role(config['top_message_role_id'])
     if role:
         if current_top_id:
-            old_top = ctx.guild.get_member(current_top_id)
+            old_top = await get_or_fetch_member(ctx.guild, current_top_id)
             if old_top:
                 try:
                     await old_top.remove_roles(role)
                 except:
                     pass
-        top_member = ctx.guild.get_member(top_user_id)
+        top_member = await get_or_fetch_member(ctx.guild, top_user_id)
         if top_member:
             try:
                 await top_member.add_roles(role)
@@ -1209,13 +3780,27 @@ async def rank_command(ctx: discord.Interaction, user: Optional[discord.User] =
     embed.set_thumbnail(url=target.display_avatar.url)
     await ctx.followup.send(embed=embed)
 
-# --- Final Setup and Run ---
+@level_group.command(name="leaderboard", description="Shows the server's XP leaderboard.")
+async def leaderboard_command(ctx: discord.Interaction):
+    await ctx.response.defer(thinking=True)
+    index = await guild_xp_indexes.load(ctx.guild.id)
+    if index is None:
+        await ctx.followup.send(embed=create_base_embed("❌ Error", "Could not load the leaderboard. Database connection failed.", color=discord.Color.red()))
+        return
+    if not len(index):
+        await ctx.followup.send(embed=create_base_embed("🏆 Leaderboard", "No users have earned XP in this server yet.", color=discord.Color.gold()))
+        return
+    view = LeaderboardView(ctx.guild, index, ctx.user.id)
+    await ctx.followup.send(embed=view.build_embed(), view=view)
 
-setup_database_schema()
-BOT_TOKEN = fetch_bot_token()
+# --- Final Setup and Run ---
 
-if __name__ == "__main__":
-    bot = BurgentruckBot(token=BOT_TOKEN)
+def main():
+    """Prepares the database, reads config once, registers commands and runs the bot."""
+    global bot, bot_config_snapshot
+    bot_config_snapshot = load_startup_state()
+    token = fetch_bot_token(bot_config_snapshot or {})
+    bot = BurgentruckBot(token=token)
     bot.tree.add_command(ban_command)
     bot.tree.add_command(kick_command)
     bot.tree.add_command(unban_command)
@@ -1223,17 +3808,24 @@ if __name__ == "__main__":
     bot.tree.add_command(unmute_command)
     bot.tree.add_command(warn_command)
     bot.tree.add_command(cases_command)
+    bot.tree.add_command(massban_command)
+    bot.tree.add_command(masstimeout_command)
     bot.tree.add_command(config_command)
     bot.tree.add_command(restart_command)
+    bot.tree.add_command(sync_command)
     bot.tree.add_command(ping_command)
     bot.tree.add_command(userinfo_command)
     bot.tree.add_command(help_command)
     bot.tree.add_command(dashboard_command)
     bot.tree.add_command(say_command)
     bot.tree.add_command(level_group)
+    bot.tree.add_command(debug_group)
     try:
-        bot.run(BOT_TOKEN)
+        bot.run(token)
     except discord.errors.LoginFailure as e:
         print(f"CRITICAL: Failed to log in. Check your BOT_TOKEN.\nError: {e}")
     except Exception as e:
         print(f"An unexpected error occurred during bot runtime: {e}")
+
+if __name__ == "__main__":
+    main()
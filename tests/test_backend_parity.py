@@ -0,0 +1,228 @@
+"""Backend parity: the async_* helpers must leave identical rows on every storage driver.
+
+Runs one scenario against SQLite (always) and MySQL (when DB_CONFIG is reachable) and compares
+the observed results. SQLite runs the hand-written statements in SQLITE_STATEMENTS, so this is
+where a dialect divergence would show up.
+
+Usage: python -m unittest tests.test_backend_parity   (or python -m pytest tests)
+"""
+import asyncio
+import datetime
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import botcode  # noqa: E402
+
+GUILD_ID = 990_000_000_000_000_001
+OTHER_GUILD_ID = 990_000_000_000_000_002
+CASE_USER_ID = 990_000_000_000_000_005
+T0 = datetime.datetime(2026, 1, 1, 12, 0, 0)  # whole seconds: MySQL TIMESTAMP columns drop fractions
+
+
+def mysql_reachable():
+    try:
+        conn = botcode.mysql.connector.connect(**botcode.DB_CONFIG, connection_timeout=2)
+    except botcode.mysql.connector.Error:
+        return False
+    conn.close()
+    return True
+
+
+async def use_backend(driver: str, sqlite_path: str = None):
+    """Points botcode at a fresh driver and forgets every cache that could answer instead of the database."""
+    if botcode.db_driver is not None:
+        await botcode.db_driver.close()
+    botcode.db_driver = None
+    if botcode.db_pool is not None:
+        botcode.db_pool.close_all()
+    botcode.DB_DRIVER = driver
+    if sqlite_path:
+        botcode.SQLITE_PATH = sqlite_path
+    for guild_id in (GUILD_ID, OTHER_GUILD_ID):
+        botcode.level_config_cache.invalidate(guild_id)
+        botcode.level_role_index.invalidate(guild_id)
+        botcode.top_senders.invalidate(guild_id)
+    botcode.setup_database_schema()
+
+
+async def remove_rows():
+    guilds = (GUILD_ID, OTHER_GUILD_ID)
+    await botcode.async_db_transaction(
+        botcode.DBStatement("DELETE FROM user_levels WHERE guild_id IN (%s, %s)", guilds),
+        botcode.DBStatement("DELETE FROM level_config WHERE guild_id IN (%s, %s)", guilds),
+        botcode.DBStatement("DELETE FROM level_roles WHERE guild_id IN (%s, %s)", guilds),
+        botcode.DBStatement("DELETE FROM case_logs WHERE user_id = %s", (CASE_USER_ID,)),
+    )
+
+
+async def user_rows():
+    return await botcode.async_db_query(
+        "SELECT user_id, xp, level, message_count, last_xp_gain FROM user_levels WHERE guild_id = %s ORDER BY user_id",
+        (GUILD_ID,), fetch="all", dictionary=True
+    )
+
+
+async def run_scenario():
+    """Exercises the helpers and returns everything observed, with backend-specific values (case IDs, timestamps) normalized."""
+    await remove_rows()
+    seen = {}
+
+    # level_config upserts: insert, then update of an existing row
+    await botcode.async_set_level_config(GUILD_ID, "xp_multiplier", 100)
+    await botcode.async_set_level_config(GUILD_ID, "xp_cooldown_seconds", 60)
+    await botcode.async_set_level_config(GUILD_ID, "xp_multiplier", 50)
+    botcode.level_config_cache.invalidate(GUILD_ID)
+    seen["level_config"] = await botcode.async_get_level_config(GUILD_ID)
+
+    # INSERT IGNORE: creates a default row once, then is a no-op
+    seen["get_user_level"] = await botcode.async_get_user_level(GUILD_ID, 1)
+    seen["insert_ignore_duplicate"] = await botcode.async_db_query(botcode.SQL_INSERT_USER_LEVEL, (GUILD_ID, 1))
+
+    # Per-message XP upsert: new row, inside the cooldown, after it, and a row with no last_xp_gain
+    seen["apply_xp"] = [
+        await botcode.async_apply_message_xp(GUILD_ID, 2, 150, 60, 50, T0),
+        await botcode.async_apply_message_xp(GUILD_ID, 2, 150, 60, 50, T0 + datetime.timedelta(seconds=30)),
+        await botcode.async_apply_message_xp(GUILD_ID, 2, 150, 60, 50, T0 + datetime.timedelta(seconds=61)),
+        await botcode.async_apply_message_xp(GUILD_ID, 2, 150, 60, 50, T0 + datetime.timedelta(seconds=121)),
+        await botcode.async_apply_message_xp(GUILD_ID, 1, 30, 60, 50, T0),
+    ]
+    seen["rows_after_apply_xp"] = await user_rows()
+
+    # Write-buffer flush upsert: existing rows (with and without XP) and a new one
+    buffer = botcode.XPWriteBuffer(flush_interval=3600, max_pending=2)  # two statements in one transaction
+    buffer.add(GUILD_ID, 2, xp=40, message_count=3, level=7, last_xp_gain=T0 + datetime.timedelta(seconds=300))
+    buffer.add(GUILD_ID, 1, message_count=2)
+    buffer.add(GUILD_ID, 3, xp=500, message_count=1, level=4, last_xp_gain=T0)
+    seen["flush_written"] = await buffer.flush()
+    seen["rows_after_flush"] = await user_rows()
+
+    # Partial COALESCE update
+    await botcode.async_update_user_level(GUILD_ID, 3, message_count=9)
+    seen["user_3"] = await botcode.async_get_user_level(GUILD_ID, 3)
+
+    # Rank (SQL path; the in-memory index is covered separately), top user and message count
+    with mock.patch.object(botcode.guild_xp_indexes, "ensure_loading", lambda guild_id: None):
+        seen["ranks"] = [await botcode.async_get_user_rank(GUILD_ID, user_id) for user_id in (1, 2, 3, 4)]
+    seen["top_user"] = await botcode.async_get_top_user(GUILD_ID)
+    seen["message_count"] = await botcode.async_get_message_count(GUILD_ID, 2)
+
+    # Level role upserts
+    await botcode.async_add_level_role(GUILD_ID, 5, 111)
+    await botcode.async_add_level_role(GUILD_ID, 5, 222)
+    await botcode.async_add_level_role(GUILD_ID, 10, 333)
+    botcode.level_role_index.invalidate(GUILD_ID)
+    seen["level_roles"] = await botcode.async_get_level_roles_between(GUILD_ID, 0, 100)
+
+    # Case logs: single and bulk inserts, guild scoping and keyset paging
+    first_id = await botcode.async_log_case(GUILD_ID, CASE_USER_ID, 1, "WARN", "case 0")
+    for i in range(1, 12):
+        await botcode.async_log_case(GUILD_ID, CASE_USER_ID, 1, "WARN", f"case {i}", "5 minutes" if i % 2 else None)
+    seen["bulk_rows"] = await botcode.async_log_cases_bulk(GUILD_ID, [CASE_USER_ID] * 3, 2, "BAN", "raid")
+    await botcode.async_log_case(OTHER_GUILD_ID, CASE_USER_ID, 1, "KICK", "elsewhere")
+    await botcode.async_log_case(None, CASE_USER_ID, 1, "MUTE", "logged before case_logs had guild_id")
+    seen["case_count"] = await botcode.async_count_user_caselogs(GUILD_ID, CASE_USER_ID)
+    pages = []
+    before_id = None
+    while True:
+        page = await botcode.async_get_user_caselogs(GUILD_ID, CASE_USER_ID, before_id, 6)
+        if not page:
+            break
+        pages.append([(row["id"] - first_id, row["action"], row["reason"], row["duration"], row["moderator_id"]) for row in page])
+        seen.setdefault("case_timestamps_are_datetimes", all(isinstance(row["timestamp"], datetime.datetime) for row in page))
+        before_id = page[-1]["id"]
+    seen["case_pages"] = pages
+
+    await remove_rows()
+    return seen
+
+
+class BackendParityTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self._saved = (botcode.DB_DRIVER, botcode.SQLITE_PATH)
+        self._tmp = tempfile.TemporaryDirectory()
+
+    async def asyncTearDown(self):
+        if botcode.db_driver is not None:
+            await botcode.db_driver.close()
+        botcode.db_driver = None
+        if botcode.db_pool is not None:
+            botcode.db_pool.close_all()
+        botcode.DB_DRIVER, botcode.SQLITE_PATH = self._saved
+        self._tmp.cleanup()
+
+    async def run_sqlite(self):
+        await use_backend("sqlite", os.path.join(self._tmp.name, "parity.sqlite3"))
+        return await run_scenario()
+
+    async def test_sqlite_results(self):
+        seen = await self.run_sqlite()
+        self.assertEqual(seen["level_config"]["xp_multiplier"], 50)
+        self.assertEqual(seen["level_config"]["xp_cooldown_seconds"], 60)
+        self.assertEqual(seen["level_config"]["xp_min"], 1)
+        self.assertEqual(seen["get_user_level"], {"xp": 0, "level": 0, "message_count": 0, "last_xp_gain": None})
+        self.assertEqual(seen["insert_ignore_duplicate"], 0)
+
+        gained = [(r["gained"], r["old_level"], r["new_level"], r["row"]["xp"], r["row"]["message_count"]) for r in seen["apply_xp"]]
+        engine = botcode.level_engine
+        self.assertEqual(gained, [
+            (True, 0, engine.level_for_xp(150, 50), 150, 1),
+            (False, engine.level_for_xp(150, 50), engine.level_for_xp(150, 50), 150, 1),  # inside the cooldown: row untouched
+            (True, engine.level_for_xp(150, 50), engine.level_for_xp(300, 50), 300, 2),
+            (True, engine.level_for_xp(300, 50), engine.level_for_xp(450, 50), 450, 3),
+            (True, 0, engine.level_for_xp(30, 50), 30, 1),  # existing row with NULL last_xp_gain
+        ])
+        self.assertEqual(seen["apply_xp"][3]["row"]["last_xp_gain"], T0 + datetime.timedelta(seconds=121))
+
+        self.assertTrue(seen["flush_written"])
+        self.assertEqual(seen["rows_after_flush"], [
+            {"user_id": 1, "xp": 30, "level": engine.level_for_xp(30, 50), "message_count": 3, "last_xp_gain": T0},
+            {"user_id": 2, "xp": 490, "level": 7, "message_count": 6, "last_xp_gain": T0 + datetime.timedelta(seconds=300)},
+            {"user_id": 3, "xp": 500, "level": 4, "message_count": 1, "last_xp_gain": T0},
+        ])
+        self.assertEqual(seen["user_3"]["message_count"], 9)
+        self.assertEqual(seen["user_3"]["xp"], 500)
+
+        self.assertEqual(seen["ranks"], [3, 2, 1, None])
+        self.assertEqual(seen["top_user"], (3, 9))
+        self.assertEqual(seen["message_count"], 6)
+        self.assertEqual(seen["level_roles"], [(5, 222), (10, 333)])
+
+        self.assertEqual(seen["bulk_rows"], 3)
+        self.assertEqual(seen["case_count"], 15)
+        flat = [entry for page in seen["case_pages"] for entry in page]
+        self.assertEqual([len(page) for page in seen["case_pages"]], [6, 6, 3])
+        self.assertEqual([entry[0] for entry in flat], sorted((entry[0] for entry in flat), reverse=True))
+        self.assertEqual(flat[-1][1:], ("WARN", "case 0", None, 1))
+        self.assertNotIn("KICK", [entry[1] for entry in flat])
+        self.assertNotIn("MUTE", [entry[1] for entry in flat])  # NULL guild_id rows belong to no guild
+        self.assertTrue(seen["case_timestamps_are_datetimes"])
+
+    def test_sqlite_refuses_mysql_only_syntax(self):
+        for query in (
+            "SELECT IF(xp > 0, 1, 0) FROM user_levels",
+            "SELECT `xp` FROM user_levels",
+            "SELECT xp FROM user_levels LIMIT 5, 10",
+            "SELECT xp FROM user_levels WHERE guild_id = %s FOR UPDATE",
+            "INSERT INTO bot_config (name, value) VALUES (%s, %s) ON DUPLICATE KEY UPDATE value = %s",
+            "INSERT IGNORE INTO bot_config (name) VALUES (%s)",
+        ):
+            with self.assertRaises(botcode.SQLiteDialectError, msg=query):
+                botcode.sqlite_query(query)
+        self.assertEqual(botcode.sqlite_query("SELECT xp FROM user_levels WHERE guild_id = %s LIMIT %s"), "SELECT xp FROM user_levels WHERE guild_id = ? LIMIT ?")
+
+    async def test_mysql_matches_sqlite(self):
+        if not await asyncio.to_thread(mysql_reachable):
+            self.skipTest("MySQL server from DB_CONFIG is not reachable")
+        sqlite_seen = await self.run_sqlite()
+        await use_backend("thread")
+        mysql_seen = await run_scenario()
+        for key in sqlite_seen:
+            self.assertEqual(mysql_seen[key], sqlite_seen[key], key)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+"""Driver metrics: every storage driver must count db_calls outcomes and time db_query_seconds like async_db_runner.
+
+The aiomysql driver runs against a stubbed _run_once (no server needed); the SQLite driver uses a temporary file.
+
+Usage: python -m unittest tests.test_driver_metrics   (or python -m pytest tests)
+"""
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import botcode  # noqa: E402
+
+HELPER = "test_driver_metrics"
+
+
+def db_calls(outcome):
+    return botcode.metrics.counters("db_calls").get((("helper", HELPER), ("outcome", outcome)), 0)
+
+
+def query_seconds_count():
+    histogram = botcode.metrics.histograms("db_query_seconds").get((("helper", HELPER),))
+    return histogram.count if histogram is not None else 0
+
+
+class DriverMetricsTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self._token = botcode.current_db_helper.set(HELPER)
+
+    async def asyncTearDown(self):
+        botcode.current_db_helper.reset(self._token)
+
+    def assert_recorded(self, before, outcome, timed):
+        self.assertEqual(db_calls(outcome) - before[outcome], 1, outcome)
+        self.assertEqual(query_seconds_count() - before["timed"], 1 if timed else 0)
+
+    def snapshot(self):
+        return {"ok": db_calls("ok"), "error": db_calls("error"), "rejected": db_calls("rejected"), "timed": query_seconds_count()}
+
+    @unittest.skipIf(botcode.aiomysql is None, "aiomysql is not installed")
+    async def test_aiomysql_outcomes(self):
+        driver = botcode.AsyncMySQLDriver(botcode.DB_CONFIG, 1)
+        statements = [botcode.DBStatement("SELECT 1")]
+        with mock.patch.object(botcode, "handle_db_runtime_failure", mock.AsyncMock()) as failure:
+            before = self.snapshot()
+            with mock.patch.object(driver, "_run_once", mock.AsyncMock(return_value=[1])):
+                self.assertEqual(await driver.run(statements), [1])
+            self.assert_recorded(before, "ok", timed=True)
+
+            before = self.snapshot()
+            with mock.patch.object(driver, "_run_once", mock.AsyncMock(side_effect=botcode.aiomysql.ProgrammingError("bad query"))):
+                self.assertIsNone(await driver.run(statements))
+            self.assert_recorded(before, "error", timed=True)
+            failure.assert_awaited_once()
+
+            before = self.snapshot()
+            with mock.patch.object(botcode.db_breaker, "allow_request", return_value=False):
+                self.assertIsNone(await driver.run(statements))
+            self.assert_recorded(before, "rejected", timed=False)
+
+    async def test_sqlite_write_outcomes(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            driver = botcode.SQLiteDriver(os.path.join(tmp, "metrics.sqlite3"), 0, 5.0, 8)
+            driver.migrate()
+            try:
+                before = self.snapshot()
+                self.assertEqual(await driver.run([botcode.DBStatement("INSERT INTO bot_config (name, value) VALUES (%s, %s)", ("a", "b"))]), [1])
+                self.assert_recorded(before, "ok", timed=True)
+
+                before = self.snapshot()
+                self.assertIsNone(await driver.run([botcode.DBStatement("INSERT INTO missing_table (name) VALUES (%s)", ("a",))]))
+                self.assert_recorded(before, "error", timed=True)
+            finally:
+                await driver.close()
+
+
+if __name__ == "__main__":
+    unittest.main()